@@ -1,5 +1,4 @@
 from django.apps import AppConfig
-from books import image_cache
 
 
 class BooksConfig(AppConfig):
@@ -8,4 +7,5 @@ class BooksConfig(AppConfig):
 
     def ready(self):
         super().ready()
-        image_cache.sync_cache()
+        # Import registers signal receivers.
+        from books import signals  # noqa: F401
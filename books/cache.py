@@ -0,0 +1,131 @@
+"""
+Cache backend shared by all App Engine instances.
+
+Each instance keeps recently used entries in a small in-memory cache (L1) in front
+of the shared cache (L2), so hot entries don't need a roundtrip to the shared
+storage while new instances still start with everything cached by others. Writes
+go to both tiers. Entries written by other instances become visible after at most
+LOCAL_TIMEOUT seconds, which bounds staleness of the L1.
+
+Configuration:
+
+    CACHES = {
+        "default": {
+            "BACKEND": "books.cache.TieredCache",
+            "LOCATION": "local-cache-name",
+            "OPTIONS": {"SHARED_CACHE": "shared", "LOCAL_TIMEOUT": 30},
+        },
+        "shared": {
+            "BACKEND": "django.core.cache.backends.db.DatabaseCache",
+            "LOCATION": "cache_table",
+        },
+    }
+"""
+
+from typing import Any, Optional
+
+from django.core.cache import caches
+from django.core.cache.backends.base import DEFAULT_TIMEOUT, BaseCache
+from django.core.cache.backends.locmem import LocMemCache
+
+_MISSING = object()
+
+
+class TieredCache(BaseCache):
+    """Per-process in-memory cache in front of a shared cache. See module docs."""
+
+    def __init__(self, location: str, params: dict):
+        super().__init__(params)
+        options = params.get("OPTIONS", {})
+        self._shared_alias = options["SHARED_CACHE"]
+        self._local_timeout = options.get("LOCAL_TIMEOUT", 30)
+        self._local = LocMemCache(
+            location,
+            {
+                "TIMEOUT": self._local_timeout,
+                "OPTIONS": {"MAX_ENTRIES": self._max_entries},
+            },
+        )
+
+    @property
+    def _shared(self) -> BaseCache:
+        # Cache connections are per thread, so the shared cache is looked up on
+        # each use rather than stored.
+        return caches[self._shared_alias]
+
+    def _local_timeout_for(self, timeout: Any) -> Optional[float]:
+        if timeout is DEFAULT_TIMEOUT or timeout is None:
+            return self._local_timeout
+        return min(timeout, self._local_timeout)
+
+    def get(self, key, default=None, version=None):
+        value = self._local.get(key, _MISSING, version=version)
+        if value is not _MISSING:
+            return value
+        value = self._shared.get(key, _MISSING, version=version)
+        if value is _MISSING:
+            return default
+        self._local.set(key, value, version=version)
+        return value
+
+    def get_many(self, keys, version=None):
+        keys = list(keys)
+        values = self._local.get_many(keys, version=version)
+        missing = [key for key in keys if key not in values]
+        if missing:
+            shared_values = self._shared.get_many(missing, version=version)
+            self._local.set_many(shared_values, version=version)
+            values.update(shared_values)
+        return values
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        self._shared.set(key, value, timeout=timeout, version=version)
+        self._local.set(
+            key, value, timeout=self._local_timeout_for(timeout), version=version
+        )
+
+    def set_many(self, data, timeout=DEFAULT_TIMEOUT, version=None):
+        failed = self._shared.set_many(data, timeout=timeout, version=version)
+        self._local.set_many(
+            data, timeout=self._local_timeout_for(timeout), version=version
+        )
+        return failed
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        if not self._shared.add(key, value, timeout=timeout, version=version):
+            return False
+        self._local.set(
+            key, value, timeout=self._local_timeout_for(timeout), version=version
+        )
+        return True
+
+    def incr(self, key, delta=1, version=None):
+        value = self._shared.incr(key, delta, version=version)
+        self._local.delete(key, version=version)
+        return value
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        self._local.touch(key, self._local_timeout_for(timeout), version=version)
+        return self._shared.touch(key, timeout=timeout, version=version)
+
+    def has_key(self, key, version=None):
+        return self._local.has_key(key, version=version) or self._shared.has_key(
+            key, version=version
+        )
+
+    def delete(self, key, version=None):
+        self._local.delete(key, version=version)
+        return self._shared.delete(key, version=version)
+
+    def delete_many(self, keys, version=None):
+        keys = list(keys)
+        self._local.delete_many(keys, version=version)
+        self._shared.delete_many(keys, version=version)
+
+    def clear(self):
+        self._local.clear()
+        self._shared.clear()
+
+    def clear_local(self):
+        """Drops entries cached by this instance, keeping the shared ones."""
+        self._local.clear()
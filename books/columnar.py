@@ -0,0 +1,265 @@
+"""
+Compact columnar binary format used for data.bin export, see books/data_export.py.
+
+The module uses only the standard library, so it can be copied to projects that
+read the export. Reading:
+
+    with open("data.bin", "rb") as f:
+        tables = columnar.loads(f.read())
+    tables["books"]["title"]  # sequence of titles of all books
+
+Columns are decompressed and decoded only when their values are first accessed,
+so loading is cheap and reading a few columns doesn't pay for the rest. Each
+column is decoded in bulk. UUIDs are read as 32 character hex strings, which
+uuid.UUID() accepts, as creating UUID objects, or even adding dashes to each id,
+would take most of the time of reading the file.
+
+Format, all numbers are little-endian:
+
+    file:    magic b"ABCF" | u8 format version | u8 number of tables | table*
+    table:   name | u32 number of rows | u8 number of columns | column*
+    column:  name | u8 type | u32 size of data | data compressed with zlib
+    name:    u8 size | utf-8 bytes
+
+Column type is one of the types below, ORed with NULLABLE for columns that can
+contain nulls. Data of a nullable column starts with a bitmap with a bit for
+each row, set for rows that have a value. Values of null rows are zeros or
+empty strings. Data of each type contains a value for each row:
+
+    UUID    16 bytes, read as a hex string like "5a8b1c9e03f4..."
+    INT     i64
+    BOOL    u8, 0 or 1
+    DATE    i32, days since 1970-01-01
+    STRING  u32 offset of each value and of the end of the last value in
+            characters, followed by utf-8 bytes of all values. So that all
+            values can be decoded at once and then split.
+"""
+
+from dataclasses import dataclass, field
+from datetime import date
+import struct
+from typing import Any, Dict, Iterator, List, Optional, Sequence
+import uuid
+import zlib
+
+MAGIC = b"ABCF"
+FORMAT_VERSION = 1
+
+UUID = 1
+INT = 2
+BOOL = 3
+DATE = 4
+STRING = 5
+NULLABLE = 0x80
+
+_EPOCH = date(1970, 1, 1)
+_EPOCH_ORDINAL = _EPOCH.toordinal()
+
+
+@dataclass
+class Column:
+    name: str
+    type: int
+    nullable: bool = False
+
+
+@dataclass
+class Table:
+    """Table that is filled row by row and stored column by column."""
+
+    name: str
+    columns: List[Column]
+    values: List[List[Any]] = field(init=False)
+
+    def __post_init__(self):
+        self.values = [[] for _ in self.columns]
+
+    def append(self, *row: Any) -> None:
+        for values, value in zip(self.values, row, strict=True):
+            values.append(value)
+
+    def __len__(self) -> int:
+        return len(self.values[0]) if self.values else 0
+
+
+def _pack_name(name: str) -> bytes:
+    data = name.encode("utf-8")
+    return struct.pack("<B", len(data)) + data
+
+
+def _to_date(value: Any) -> date:
+    return date.fromisoformat(value) if isinstance(value, str) else value
+
+
+def _pack_values(column_type: int, values: List[Any]) -> bytes:
+    if column_type == UUID:
+        return b"".join(
+            (value if isinstance(value, uuid.UUID) else uuid.UUID(value)).bytes
+            for value in values
+        )
+    if column_type == INT:
+        return struct.pack(f"<{len(values)}q", *values)
+    if column_type == BOOL:
+        return bytes(int(bool(value)) for value in values)
+    if column_type == DATE:
+        return struct.pack(
+            f"<{len(values)}i", *((_to_date(value) - _EPOCH).days for value in values)
+        )
+    if column_type == STRING:
+        offsets = [0]
+        for value in values:
+            offsets.append(offsets[-1] + len(value))
+        return struct.pack(f"<{len(offsets)}I", *offsets) + "".join(values).encode(
+            "utf-8"
+        )
+    raise ValueError(f"Unknown column type {column_type}")
+
+
+_NULL_VALUES = {UUID: uuid.UUID(int=0), INT: 0, BOOL: False, DATE: _EPOCH, STRING: ""}
+
+
+def _pack_column(column: Column, values: List[Any]) -> bytes:
+    data = b""
+    if column.nullable:
+        bitmap = bytearray((len(values) + 7) // 8)
+        for i, value in enumerate(values):
+            if value is not None:
+                bitmap[i // 8] |= 1 << (i % 8)
+        data = bytes(bitmap)
+        values = [_NULL_VALUES[column.type] if v is None else v for v in values]
+    data = zlib.compress(data + _pack_values(column.type, values))
+    column_type = column.type | (NULLABLE if column.nullable else 0)
+    return _pack_name(column.name) + struct.pack("<BI", column_type, len(data)) + data
+
+
+def dumps(tables: List[Table]) -> bytes:
+    parts = [MAGIC, struct.pack("<BB", FORMAT_VERSION, len(tables))]
+    for table in tables:
+        parts.append(_pack_name(table.name))
+        parts.append(struct.pack("<IB", len(table), len(table.columns)))
+        for column, values in zip(table.columns, table.values):
+            parts.append(_pack_column(column, values))
+    return b"".join(parts)
+
+
+class _Reader:
+    def __init__(self, content: bytes):
+        self.content = memoryview(content)
+        self.position = 0
+
+    def unpack(self, fmt: str) -> tuple:
+        values = struct.unpack_from(fmt, self.content, self.position)
+        self.position += struct.calcsize(fmt)
+        return values
+
+    def read(self, size: int) -> bytes:
+        data = self.content[self.position : self.position + size]
+        self.position += size
+        return bytes(data)
+
+    def name(self) -> str:
+        (size,) = self.unpack("<B")
+        return self.read(size).decode("utf-8")
+
+
+def _unpack_values(column_type: int, data: bytes, rows: int) -> List[Any]:
+    if column_type == UUID:
+        # Hex of the whole column is split with slices created by map(), which
+        # unlike a list comprehension doesn't run Python code for each value.
+        text = data[: rows * 16].hex()
+        return list(
+            map(
+                text.__getitem__,
+                map(slice, range(0, rows * 32, 32), range(32, rows * 32 + 1, 32)),
+            )
+        )
+    if column_type == INT:
+        return list(struct.unpack_from(f"<{rows}q", data))
+    if column_type == BOOL:
+        return list(map(bool, data[:rows]))
+    if column_type == DATE:
+        days = struct.unpack_from(f"<{rows}i", data)
+        dates = {day: date.fromordinal(_EPOCH_ORDINAL + day) for day in set(days)}
+        return list(map(dates.__getitem__, days))
+    if column_type == STRING:
+        offsets = struct.unpack_from(f"<{rows + 1}I", data)
+        text = data[4 * (rows + 1) :].decode("utf-8")
+        if not text:
+            return [""] * rows
+        return [text[start:end] for start, end in zip(offsets, offsets[1:])]
+    raise ValueError(f"Unknown column type {column_type}")
+
+
+class ColumnValues(Sequence):
+    """
+    Values of a column, nulls are None. Values are decoded on first access.
+    Compares equal to a list of the same values.
+    """
+
+    def __init__(self, column_type: int, data: bytes, rows: int):
+        self._type = column_type
+        self._data = data
+        self._rows = rows
+        self._values: Optional[List[Any]] = None
+
+    def _decode(self) -> List[Any]:
+        if self._values is None:
+            data = zlib.decompress(self._data)
+            present = None
+            if self._type & NULLABLE:
+                bitmap_size = (self._rows + 7) // 8
+                present = data[:bitmap_size]
+                data = data[bitmap_size:]
+            values = _unpack_values(self._type & ~NULLABLE, data, self._rows)
+            if present is not None:
+                # Bit of each row as "0" or "1", the first row first.
+                bits = format(int.from_bytes(present, "little"), f"0{self._rows}b")
+                values = [
+                    value if bit == "1" else None
+                    for value, bit in zip(values, reversed(bits))
+                ]
+            self._values = values
+            self._data = b""
+        return self._values
+
+    def __len__(self) -> int:
+        return self._rows
+
+    def __getitem__(self, index):
+        return self._decode()[index]
+
+    def __iter__(self) -> Iterator[Any]:
+        return iter(self._decode())
+
+    def __eq__(self, other: Any) -> bool:
+        if isinstance(other, ColumnValues):
+            other = other._decode()
+        if not isinstance(other, list):
+            return NotImplemented
+        return self._decode() == other
+
+    __hash__ = None  # type: ignore[assignment]
+
+    def __repr__(self) -> str:
+        return repr(self._decode())
+
+
+def loads(content: bytes) -> Dict[str, Dict[str, ColumnValues]]:
+    """Returns values of each column of each table, see ColumnValues."""
+    reader = _Reader(content)
+    if reader.read(len(MAGIC)) != MAGIC:
+        raise ValueError("Not a columnar file")
+    version, table_count = reader.unpack("<BB")
+    if version != FORMAT_VERSION:
+        raise ValueError(f"Unsupported format version {version}")
+    tables: Dict[str, Dict[str, ColumnValues]] = {}
+    for _ in range(table_count):
+        table_name = reader.name()
+        rows, column_count = reader.unpack("<IB")
+        columns: Dict[str, ColumnValues] = {}
+        for _ in range(column_count):
+            column_name = reader.name()
+            column_type, size = reader.unpack("<BI")
+            columns[column_name] = ColumnValues(column_type, reader.read(size), rows)
+        tables[table_name] = columns
+    return tables
@@ -0,0 +1,576 @@
+"""
+Export of the whole database as data.json, served at /data.json.
+
+The export is generated by the daily job and streamed to storage in chunks, so
+the whole database is never kept in memory as a single string. A gzipped copy
+is written at the same time and served to clients that accept gzip.
+
+Each generation writes files with new names and only then switches the current
+version, stored in SharedState, to them. Files of the previous version are kept so that
+requests that already started reading them can finish, older ones are deleted.
+This way requests never see a partially written or missing file.
+
+Each version is incremental as well: a hash of every exported object is stored
+with the version, and objects that were added, changed or removed since the
+previous version are written to a delta file. Deltas are kept for
+DELTA_RETENTION_DAYS, so that mirrors can sync with /data.json?since=<version>,
+which combines deltas of all versions after the given one. The version of
+/data.json is returned in the X-Data-Version header.
+
+The same data is also exported to data.bin, a compact typed columnar file that
+loads much faster than JSON, see books/columnar.py for the format and the reader
+and _binary_tables() for its tables.
+"""
+
+from collections import defaultdict
+from dataclasses import asdict, dataclass
+from functools import partial
+from datetime import timedelta
+import gzip
+import hashlib
+import io
+import json
+from itertools import islice
+from typing import (
+    IO,
+    Any,
+    Callable,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    Optional,
+    Set,
+    Tuple,
+)
+from uuid import UUID
+import uuid
+
+from django.core.cache import cache
+from django.core.files.storage import default_storage
+from django.db.models import Prefetch, QuerySet
+from django.utils import timezone
+
+from books import columnar, serializers
+from books.models import Book, LinkType, Person, Publisher, SharedState, Tag
+
+FILE_PREFIX = "data-json-"
+# Name of the file used before versioned files were introduced.
+LEGACY_FILE = "tmp_data.json"
+CURRENT_VERSION_KEY = "data-json:current"
+# Cache key remembering that storage has no export, so that it's not listed on
+# every request until the first generation.
+NOT_GENERATED_KEY = "data-json:not-generated"
+NOT_GENERATED_TIMEOUT_SEC = 60
+# Suffixes of files of each version.
+FILE_SUFFIXES = {
+    "json": ".json",
+    "gzip": ".json.gz",
+    "hashes": ".hashes.json",
+    "delta": ".delta.json",
+    "binary": ".bin",
+}
+DELTA_RETENTION_DAYS = 30
+# Number of objects loaded from DB at once.
+CHUNK_SIZE = 500
+
+
+class UUIDEncoder(json.JSONEncoder):
+
+    def default(self, obj):
+        if isinstance(obj, UUID):
+            # if the obj is uuid, we simply return the value of uuid
+            return str(obj)
+        return json.JSONEncoder.default(self, obj)
+
+
+@dataclass
+class ExportVersion:
+    """Files of a generated export."""
+
+    version: str
+    json_file: str
+    gzip_file: str
+    # sha256 of the uncompressed content, or version if the hash is unknown.
+    etag: str
+    json_size: int
+    gzip_size: int
+
+
+def books_queryset() -> QuerySet:
+    """
+    Returns books with everything BookSimpleSerializer outputs prefetched, so
+    serializing a chunk of books takes a fixed number of queries. Related people,
+    tags and publishers are serialized as ids, so only ids are loaded for them.
+    """
+    return Book.objects.prefetch_related(
+        Prefetch("authors", queryset=Person.objects.only("uuid")),
+        Prefetch("tag", queryset=Tag.objects.only("id")),
+        "narrations",
+        Prefetch("narrations__narrators", queryset=Person.objects.only("uuid")),
+        Prefetch("narrations__translators", queryset=Person.objects.only("uuid")),
+        Prefetch("narrations__publishers", queryset=Publisher.objects.only("uuid")),
+        "narrations__links",
+    )
+
+
+def _sections() -> Iterable[tuple[str, str, QuerySet, Any]]:
+    """Returns name, id field, queryset and serializer of each section."""
+    return [
+        ("books", "uuid", books_queryset(), serializers.BookSimpleSerializer),
+        ("people", "uuid", Person.objects.all(), serializers.PersonSimpleSerializer),
+        (
+            "link_types",
+            "id",
+            LinkType.objects.all(),
+            serializers.LinkTypeSimpleSerializer,
+        ),
+        ("tags", "id", Tag.objects.all(), serializers.TagSerializer),
+        (
+            "publishers",
+            "uuid",
+            Publisher.objects.all(),
+            serializers.PublisherSimpleSerializer,
+        ),
+    ]
+
+
+def section_names() -> List[str]:
+    return [name for name, *_ in _sections()]
+
+
+def _dumps(value: Any) -> str:
+    return json.dumps(value, ensure_ascii=False, separators=(",", ":"), cls=UUIDEncoder)
+
+
+def serialize(queryset: QuerySet, serializer: Any) -> Iterator[Dict]:
+    """
+    Yields serialized objects of the queryset. Objects are loaded and serialized
+    in chunks, so that prefetches are done per chunk and serializer fields are
+    created once per chunk rather than for each object.
+    """
+    objects = queryset.iterator(chunk_size=CHUNK_SIZE)
+    while chunk := list(islice(objects, CHUNK_SIZE)):
+        yield from serializer(chunk, many=True).data
+
+
+def generate_chunks(
+    on_object: Optional[Callable[[str, str, Dict, str], None]] = None,
+) -> Iterator[str]:
+    """
+    Yields data.json content in chunks, one object at a time. on_object is called
+    with section, id, serialized data and JSON of each object.
+    """
+    yield "{"
+    for section_index, (name, id_field, queryset, serializer) in enumerate(_sections()):
+        if section_index > 0:
+            yield ","
+        yield f"{_dumps(name)}:["
+        for i, data in enumerate(serialize(queryset, serializer)):
+            if i > 0:
+                yield ","
+            content = _dumps(data)
+            if on_object is not None:
+                on_object(name, str(data[id_field]), data, content)
+            yield content
+        yield "]"
+    yield "}"
+
+
+def _typed_id(id_field: str, object_id: str) -> Any:
+    """Converts id to the type it has in data.json."""
+    return int(object_id) if id_field == "id" else object_id
+
+
+def _file_name(version: str, kind: str) -> str:
+    return f"{FILE_PREFIX}{version}{FILE_SUFFIXES[kind]}"
+
+
+def _parse_file_name(name: str) -> Optional[tuple[str, str]]:
+    """Returns version and kind of an export file, None for other files."""
+    if not name.startswith(FILE_PREFIX):
+        return None
+    version, dot, suffix = name.removeprefix(FILE_PREFIX).partition(".")
+    for kind, kind_suffix in FILE_SUFFIXES.items():
+        if kind_suffix == dot + suffix:
+            return version, kind
+    return None
+
+
+def _read_json(name: str) -> Optional[Dict]:
+    if not default_storage.exists(name):
+        return None
+    with default_storage.open(name, "rb") as f:
+        return json.loads(f.read().decode("utf-8"))
+
+
+def _write_json(name: str, value: Any) -> None:
+    with default_storage.open(name, "wb") as f:
+        f.write(_dumps(value).encode("utf-8"))
+
+
+def _binary_tables() -> Dict[str, columnar.Table]:
+    """
+    Returns empty tables of the binary export. Sections of data.json are split
+    into flat tables: lists of related objects are stored in separate tables
+    that reference both objects, like many-to-many tables in DB. Durations are
+    stored in seconds.
+    """
+    uuid_column = partial(columnar.Column, type=columnar.UUID)
+    int_column = partial(columnar.Column, type=columnar.INT)
+    string_column = partial(columnar.Column, type=columnar.STRING)
+    tables = [
+        columnar.Table(
+            "books",
+            [
+                uuid_column("uuid"),
+                string_column("title"),
+                string_column("description"),
+                string_column("description_source"),
+                string_column("slug"),
+            ],
+        ),
+        columnar.Table("book_authors", [uuid_column("book"), uuid_column("person")]),
+        columnar.Table("book_tags", [uuid_column("book"), int_column("tag")]),
+        columnar.Table(
+            "narrations",
+            [
+                uuid_column("uuid"),
+                uuid_column("book"),
+                columnar.Column("paid", columnar.BOOL),
+                string_column("language"),
+                int_column("duration", nullable=True),
+                string_column("cover_image", nullable=True),
+                string_column("cover_image_source"),
+                columnar.Column("date", columnar.DATE),
+                string_column("description"),
+                string_column("preview_url"),
+            ],
+        ),
+        columnar.Table(
+            "narration_narrators", [uuid_column("narration"), uuid_column("person")]
+        ),
+        columnar.Table(
+            "narration_translators", [uuid_column("narration"), uuid_column("person")]
+        ),
+        columnar.Table(
+            "narration_publishers",
+            [uuid_column("narration"), uuid_column("publisher")],
+        ),
+        columnar.Table(
+            "links",
+            [
+                uuid_column("narration"),
+                string_column("url"),
+                int_column("url_type", nullable=True),
+            ],
+        ),
+        columnar.Table(
+            "people",
+            [
+                uuid_column("uuid"),
+                string_column("name"),
+                string_column("description"),
+                string_column("description_source"),
+                string_column("photo", nullable=True),
+                string_column("photo_source"),
+                string_column("slug"),
+                string_column("gender"),
+            ],
+        ),
+        columnar.Table(
+            "link_types",
+            [
+                int_column("id"),
+                string_column("name"),
+                string_column("caption"),
+                string_column("icon", nullable=True),
+                string_column("availability"),
+            ],
+        ),
+        columnar.Table(
+            "tags",
+            [
+                int_column("id"),
+                string_column("name"),
+                string_column("slug"),
+                string_column("description"),
+            ],
+        ),
+        columnar.Table(
+            "publishers",
+            [
+                uuid_column("uuid"),
+                string_column("name"),
+                string_column("slug"),
+                string_column("url"),
+                string_column("logo", nullable=True),
+                string_column("description"),
+            ],
+        ),
+    ]
+    return {table.name: table for table in tables}
+
+
+def _append(table: columnar.Table, data: Dict, **values: Any) -> None:
+    table.append(
+        *(values.get(column.name, data.get(column.name)) for column in table.columns)
+    )
+
+
+def _add_to_binary_tables(
+    tables: Dict[str, columnar.Table], section: str, data: Dict
+) -> None:
+    if section != "books":
+        _append(tables[section], data)
+        return
+    _append(tables["books"], data)
+    for person in data["authors"]:
+        tables["book_authors"].append(data["uuid"], person)
+    for tag in data["tag"]:
+        tables["book_tags"].append(data["uuid"], tag)
+    for narration in data["narrations"]:
+        duration = narration["duration"]
+        _append(
+            tables["narrations"],
+            narration,
+            book=data["uuid"],
+            duration=None if duration is None else round(duration),
+        )
+        for person in narration["narrators"]:
+            tables["narration_narrators"].append(narration["uuid"], person)
+        for person in narration["translators"]:
+            tables["narration_translators"].append(narration["uuid"], person)
+        for publisher in narration["publishers"]:
+            tables["narration_publishers"].append(narration["uuid"], publisher)
+        for link in narration["links"]:
+            tables["links"].append(narration["uuid"], link["url"], link["url_type"])
+
+
+class _Writer:
+    """Writes export files and collects hashes and changes of objects."""
+
+    def __init__(self, previous_hashes: Optional[Dict[str, Dict[str, str]]]):
+        self.previous_hashes = previous_hashes
+        self.hashes: Dict[str, Dict[str, str]] = defaultdict(dict)
+        self.changed: Dict[str, List[Dict]] = defaultdict(list)
+        self.binary_tables = _binary_tables()
+
+    def on_object(self, section: str, object_id: str, data: Dict, content: str) -> None:
+        _add_to_binary_tables(self.binary_tables, section, data)
+        object_hash = hashlib.sha256(content.encode("utf-8")).hexdigest()[:16]
+        self.hashes[section][object_id] = object_hash
+        if (
+            self.previous_hashes is not None
+            and self.previous_hashes.get(section, {}).get(object_id) != object_hash
+        ):
+            self.changed[section].append(json.loads(content))
+
+    def removed(self) -> Dict[str, List]:
+        return {
+            section: sorted(
+                _typed_id(id_field, object_id)
+                for object_id in self.previous_hashes.get(section, {}).keys()
+                - self.hashes[section].keys()
+            )
+            for section, id_field, *_ in _sections()
+        }
+
+    def write(self, json_file: IO[bytes], gzip_file: IO[bytes]) -> str:
+        """Writes content to both files and returns its hash."""
+        content_hash = hashlib.sha256()
+        with gzip.GzipFile(fileobj=gzip_file, mode="wb") as compressed:
+            for chunk in generate_chunks(self.on_object):
+                data = chunk.encode("utf-8")
+                content_hash.update(data)
+                json_file.write(data)
+                compressed.write(data)
+        return content_hash.hexdigest()
+
+
+def generate() -> ExportVersion:
+    """
+    Generates new export and makes it current. If nothing changed since the
+    current export, it's kept and no new version is created.
+    """
+    previous = get_current()
+    previous_hashes = (
+        _read_json(_file_name(previous.version, "hashes")) if previous else None
+    )
+    # Versions sort in order of generation, see _delete_old_files().
+    version = f"{timezone.now():%Y%m%d%H%M%S%f}-{uuid.uuid4().hex[:8]}"
+    json_name = _file_name(version, "json")
+    gzip_name = _file_name(version, "gzip")
+    writer = _Writer(previous_hashes)
+    with default_storage.open(json_name, "wb") as json_file, default_storage.open(
+        gzip_name, "wb"
+    ) as gzip_file:
+        content_hash = writer.write(json_file, gzip_file)
+    if previous is not None and previous.etag == content_hash:
+        default_storage.delete(json_name)
+        default_storage.delete(gzip_name)
+        return previous
+
+    with default_storage.open(_file_name(version, "binary"), "wb") as binary_file:
+        binary_file.write(columnar.dumps(list(writer.binary_tables.values())))
+    if previous_hashes is not None:
+        _write_json(
+            _file_name(version, "delta"),
+            {
+                "version": version,
+                "since": previous.version,
+                "changed": {
+                    section: writer.changed[section] for section in section_names()
+                },
+                "removed": writer.removed(),
+            },
+        )
+    # Hashes are written last, they mark the version as complete, see
+    # _find_latest().
+    _write_json(_file_name(version, "hashes"), writer.hashes)
+    export = ExportVersion(
+        version=version,
+        json_file=json_name,
+        gzip_file=gzip_name,
+        etag=content_hash,
+        json_size=default_storage.size(json_name),
+        gzip_size=default_storage.size(gzip_name),
+    )
+    SharedState.objects.set_value(CURRENT_VERSION_KEY, asdict(export))
+    cache.delete(NOT_GENERATED_KEY)
+    _delete_old_files(keep=[export] + ([previous] if previous else []))
+    return export
+
+
+def generate_in_memory() -> Tuple[bytes, bytes]:
+    """
+    Returns content of data.json and data.bin without writing them to storage,
+    used by benchmark_data_json command.
+    """
+    writer = _Writer(previous_hashes=None)
+    json_file = io.BytesIO()
+    writer.write(json_file, io.BytesIO())
+    return json_file.getvalue(), columnar.dumps(list(writer.binary_tables.values()))
+
+
+def _delete_old_files(keep: List[ExportVersion]) -> None:
+    # Only files older than the kept ones are deleted, newer ones might be being
+    # written by a concurrent generation.
+    oldest_kept = min(export.version for export in keep)
+    oldest_delta = min(
+        oldest_kept,
+        f"{timezone.now() - timedelta(days=DELTA_RETENTION_DAYS):%Y%m%d%H%M%S%f}",
+    )
+    for name in default_storage.listdir("")[1]:
+        parsed = _parse_file_name(name)
+        if parsed is not None:
+            version, kind = parsed
+            if version < (oldest_delta if kind == "delta" else oldest_kept):
+                default_storage.delete(name)
+        elif name == LEGACY_FILE:
+            default_storage.delete(name)
+
+
+def _find_latest() -> Optional[ExportVersion]:
+    """
+    Finds the latest complete export in storage, used for exports generated before
+    the current version was stored in SharedState.
+    """
+    files: Dict[str, Set[str]] = defaultdict(set)
+    for name in default_storage.listdir("")[1]:
+        parsed = _parse_file_name(name)
+        if parsed is not None:
+            files[parsed[0]].add(parsed[1])
+    for version in sorted(files, reverse=True):
+        if {"json", "gzip", "hashes"} <= files[version]:
+            json_name = _file_name(version, "json")
+            gzip_name = _file_name(version, "gzip")
+            return ExportVersion(
+                version=version,
+                json_file=json_name,
+                gzip_file=gzip_name,
+                etag=version,
+                json_size=default_storage.size(json_name),
+                gzip_size=default_storage.size(gzip_name),
+            )
+    return None
+
+
+def get_binary_file(export: ExportVersion) -> Optional[str]:
+    """
+    Returns name of the binary export file, see books/columnar.py. None for
+    exports generated before binary export was added.
+    """
+    name = _file_name(export.version, "binary")
+    return name if default_storage.exists(name) else None
+
+
+def get_current() -> Optional[ExportVersion]:
+    """Returns the current export, None if it was never generated."""
+    current = SharedState.objects.get_value(CURRENT_VERSION_KEY)
+    if current is not None:
+        return ExportVersion(**current)
+    if cache.get(NOT_GENERATED_KEY):
+        return None
+    export = _find_latest()
+    if export is not None:
+        SharedState.objects.set_value(CURRENT_VERSION_KEY, asdict(export))
+    else:
+        cache.set(NOT_GENERATED_KEY, True, timeout=NOT_GENERATED_TIMEOUT_SEC)
+    return export
+
+
+def _combine_deltas(since: str, current: str) -> Optional[Dict]:
+    deltas = []
+    version = current
+    while version != since:
+        # Versions before `since` can't lead to it.
+        if version < since:
+            return None
+        delta = _read_json(_file_name(version, "delta"))
+        if delta is None:
+            return None
+        deltas.append(delta)
+        version = delta["since"]
+
+    id_fields = {name: id_field for name, id_field, *_ in _sections()}
+    # Objects and ids of removed objects by string id in each section.
+    changed: Dict[str, Dict[str, Dict]] = {name: {} for name in id_fields}
+    removed: Dict[str, Dict[str, Any]] = {name: {} for name in id_fields}
+    for delta in reversed(deltas):
+        for section, object_ids in delta["removed"].items():
+            for object_id in object_ids:
+                changed[section].pop(str(object_id), None)
+                removed[section][str(object_id)] = object_id
+        for section, objects in delta["changed"].items():
+            for obj in objects:
+                object_id = str(obj[id_fields[section]])
+                removed[section].pop(object_id, None)
+                changed[section][object_id] = obj
+    return {
+        "version": current,
+        "since": since,
+        "changed": {
+            section: list(objects.values()) for section, objects in changed.items()
+        },
+        "removed": {section: sorted(ids.values()) for section, ids in removed.items()},
+    }
+
+
+def get_changes(since: str) -> Optional[Dict]:
+    """
+    Returns objects that were added, changed or removed after the given version,
+    None if the version is unknown or its deltas were already deleted.
+    """
+    current = get_current()
+    if current is None:
+        return None
+    # Combined changes are only a cache, they are computed again from delta files
+    # when evicted.
+    key = f"data-json:changes:{since}:{current.version}"
+    changes = cache.get(key)
+    if changes is None:
+        changes = _combine_deltas(since, current.version)
+        if changes is not None:
+            cache.set(key, changes, timeout=60 * 60 * 24)
+    return changes
@@ -0,0 +1,170 @@
+"""
+Derived tags are tags whose books are computed from other data instead of being
+set manually. For example "cytaje-autar" tag contains books narrated by one of
+their authors.
+
+Each derived tag is declared as a rule: a function that filters given books down
+to the ones that should have the tag. Rules are registered with @rule(slug) and
+applied by update(), which computes the books with SQL and changes the tag only
+where needed: books that should have it and don't get it, books that have it
+but shouldn't lose it. Tags of other books are not touched, so tag facets and
+cached pages are updated only for changed books.
+
+A rule is applied only if its tag exists in DB, so a derived tag is enabled by
+creating a tag with the rule slug in admin. As derived tags are regular tags,
+catalog shows and filters them using precomputed tag facets.
+
+Tags are recomputed incrementally: signals in books/signals.py call
+request_update() with books whose narrations, links, authors or narrators
+changed, and rules are applied to those books once the transaction commits. The
+daily update_derived_tags job applies rules to all books, which handles rules
+depending on current date and changes that signals miss, like a narration moved
+to another book.
+"""
+
+from dataclasses import dataclass
+from datetime import date, timedelta
+import threading
+from typing import Callable, Dict, Iterable, Optional, Set
+import uuid
+
+from django.db import connection, transaction
+from django.db.models import Exists, F, OuterRef, QuerySet
+from django.utils import timezone
+
+from books.models import Book, Language, Narration, Tag
+
+Rule = Callable[[QuerySet], QuerySet]
+
+RULES: Dict[str, Rule] = {}
+
+
+def rule(slug: str) -> Callable[[Rule], Rule]:
+    """Registers a rule of the tag with the given slug."""
+
+    def register(func: Rule) -> Rule:
+        RULES[slug] = func
+        return func
+
+    return register
+
+
+@dataclass
+class UpdateResult:
+    added: int
+    removed: int
+
+
+def _apply(tag: Tag, book_ids: Optional[Iterable]) -> UpdateResult:
+    books = Book.objects.all()
+    if book_ids is not None:
+        books = books.filter(uuid__in=book_ids)
+    matching = RULES[tag.slug](books).values("uuid")
+    with transaction.atomic():
+        to_add = list(
+            books.filter(uuid__in=matching)
+            .exclude(tag=tag)
+            .values_list("uuid", flat=True)
+        )
+        to_remove = list(
+            books.filter(tag=tag)
+            .exclude(uuid__in=matching)
+            .values_list("uuid", flat=True)
+        )
+        if to_add:
+            tag.books.add(*to_add)
+        if to_remove:
+            tag.books.remove(*to_remove)
+    return UpdateResult(added=len(to_add), removed=len(to_remove))
+
+
+def update(slug: str, book_ids: Optional[Iterable] = None) -> UpdateResult:
+    """
+    Applies rule of the tag to all books, or only to the given books. Raises
+    Tag.DoesNotExist if the tag is missing from DB.
+    """
+    return _apply(Tag.objects.get(slug=slug), book_ids)
+
+
+def update_all(book_ids: Optional[Iterable] = None) -> Dict[str, UpdateResult]:
+    """
+    Applies rules of all derived tags that exist in DB to all books, or only to
+    the given books. Returns result for each tag slug.
+    """
+    if book_ids is not None:
+        book_ids = list(book_ids)
+    return {
+        tag.slug: _apply(tag, book_ids)
+        for tag in Tag.objects.filter(slug__in=RULES.keys())
+    }
+
+
+_pending = threading.local()
+
+
+def _update_pending() -> None:
+    book_ids = getattr(_pending, "book_ids", set())
+    _pending.book_ids = set()
+    if book_ids:
+        update_all(book_ids)
+
+
+def request_update(book_ids: Iterable[uuid.UUID]) -> None:
+    """
+    Applies rules to the given books after the current transaction commits.
+    Books changed within one transaction are updated together by the first
+    callback, the following ones find nothing pending. Books of a rolled back
+    transaction stay pending and are updated with the next ones, which is
+    harmless as rules are applied to the current data.
+    """
+    if not connection.in_atomic_block:
+        update_all(book_ids)
+        return
+    pending: Set[uuid.UUID] = getattr(_pending, "book_ids", set())
+    pending.update(book_ids)
+    _pending.book_ids = pending
+    # A callback is registered on each call rather than once per transaction,
+    # as callbacks registered in a savepoint are dropped when it's rolled back.
+    transaction.on_commit(_update_pending)
+
+
+@rule("cytaje-autar")
+def read_by_author(books: QuerySet) -> QuerySet:
+    """Books narrated by one of their authors."""
+    return books.filter(authors=F("narrations__narrators"))
+
+
+@rule("biasplatnyja")
+def free(books: QuerySet) -> QuerySet:
+    """Books that have a free narration."""
+    return books.filter(narrations__paid=False)
+
+
+@rule("bols-za-10-hadzin")
+def over_10_hours(books: QuerySet) -> QuerySet:
+    """Books that have a narration longer than 10 hours."""
+    return books.filter(narrations__duration__gt=timedelta(hours=10))
+
+
+@rule("vyjsli-sioleta")
+def released_this_year(books: QuerySet) -> QuerySet:
+    """Books that have a narration released this year."""
+    return books.filter(narrations__date__gte=date(timezone.localdate().year, 1, 1))
+
+
+@rule("josc-u-spotify")
+def has_spotify_link(books: QuerySet) -> QuerySet:
+    """Books that have a Spotify link, including Spotify Audiobooks."""
+    return books.filter(narrations__links__url_type__name__startswith="spotify")
+
+
+@rule("tolki-pa-rusku")
+def russian_only(books: QuerySet) -> QuerySet:
+    """Books that have narrations only in russian."""
+    return books.filter(narrations__language=Language.RUSSIAN).exclude(
+        Exists(
+            Narration.objects.filter(book=OuterRef("pk")).exclude(
+                language=Language.RUSSIAN
+            )
+        )
+    )
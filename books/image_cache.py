@@ -15,11 +15,17 @@ from django.core.files.storage import default_storage
 from django.conf import settings
 import requests
 import threading
+import time
 
 # Process only covers for now. We don't have pages where we display
 # multiple photos or publisher logos.
 FOLDERS = ["covers"]
 
+# The mapping is needed for every cover shown on a page. It's kept in process memory
+# for a few seconds so that it's not read from cache for each cover.
+LOCAL_SIZES_TIMEOUT_SEC = 10
+_local_sizes: dict = {"sizes": {}, "loaded_at": float("-inf")}
+
 
 def sync_cache() -> dict[str, dict[int, str]]:
     """
@@ -44,9 +50,32 @@ def sync_cache() -> dict[str, dict[int, str]]:
                 sizes[original_url] = {}
             sizes[original_url][size] = f"{settings.MEDIA_URL}{folder}/{file_name}"
     cache.set("image_cache", sizes, timeout=None)
+    _local_sizes.update(sizes=sizes, loaded_at=time.monotonic())
+    return sizes
+
+
+def get_sizes() -> dict[str, dict[int, str]]:
+    """
+    Returns mapping from original image URLs to their resized versions. If the
+    mapping is not cached, it's empty and pages show original images until
+    warm_up() or the sync_image_cache job builds it: listing the bucket takes too
+    long for a page request.
+    """
+    if time.monotonic() - _local_sizes["loaded_at"] < LOCAL_SIZES_TIMEOUT_SEC:
+        return _local_sizes["sizes"]
+    sizes: dict[str, dict[int, str]] = cache.get("image_cache", {})
+    _local_sizes.update(sizes=sizes, loaded_at=time.monotonic())
     return sizes
 
 
+def warm_up() -> None:
+    """Loads the mapping, it's built from storage if it's not cached."""
+    if cache.get("image_cache") is None:
+        sync_cache()
+    else:
+        get_sizes()
+
+
 def warn_in_production(message: str):
     if not settings.DEBUG:
         logging.warning(message)
@@ -57,10 +86,7 @@ def get_image_for_size(filename: str, size: int) -> str:
     Given original image filename and desired size returns URL of the resized image,
     if it exists. If it doesn't, returns original filename.
     """
-    sizes: dict[str, dict[int, str]] = cache.get("image_cache")
-    if sizes is None:
-        warn_in_production("Image cache is empty.")
-        return filename
+    sizes = get_sizes()
     if filename not in sizes:
         warn_in_production(f"Image {filename} missing size {size}.")
         return filename
@@ -0,0 +1,34 @@
+"""
+Conversion of texts from cyrillic to łacinka using belorthography.
+
+Conversion is slow, about 0.1ms for a title and 10ms for a long description, so
+converted texts are not recomputed on each page render:
+
+* Short texts, like titles, names and captions, repeat across pages and are
+  cached in a bounded LRU cache of each process.
+* Long texts are converted once when the model is saved and stored in *_lac
+  fields, like Book.description_lac. Templates pass them to dtranslate tag.
+"""
+
+import functools
+
+import belorthography
+
+# Texts longer than that are not cached as there are few repeats of them and they
+# would take most of the cache memory.
+MAX_CACHED_LENGTH = 200
+CACHE_SIZE = 20000
+
+
+@functools.lru_cache(maxsize=CACHE_SIZE)
+def _convert_cached(text: str, to: belorthography.Orthography) -> str:
+    return belorthography.convert(text, belorthography.Orthography.OFFICIAL, to)
+
+
+def convert(
+    text: str, to: belorthography.Orthography = belorthography.Orthography.LATIN
+) -> str:
+    """Converts text in official orthography to the given one, łacinka by default."""
+    if len(text) > MAX_CACHED_LENGTH:
+        return belorthography.convert(text, belorthography.Orthography.OFFICIAL, to)
+    return _convert_cached(text, to)
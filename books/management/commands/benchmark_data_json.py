@@ -0,0 +1,186 @@
+"""
+See Command desription.
+"""
+
+from datetime import date, timedelta
+import json
+import time
+import timeit
+from typing import Any, Callable, List
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+
+from books import columnar, data_export, serializers
+from books.models import (
+    Book,
+    BookStatus,
+    Language,
+    Link,
+    LinkType,
+    Narration,
+    Person,
+    Publisher,
+    Tag,
+)
+
+
+class Rollback(Exception):
+    pass
+
+
+def seed(books: int) -> None:
+    """Creates books with authors, tags and a narration with links each."""
+    people = Person.objects.bulk_create(
+        Person(name=f"Асоба {i}", slug=f"benchmark-person-{i}")
+        for i in range(max(books // 2, 1))
+    )
+    tags = Tag.objects.bulk_create(
+        Tag(name=f"Тэг {i}", slug=f"benchmark-tag-{i}") for i in range(10)
+    )
+    publishers = Publisher.objects.bulk_create(
+        Publisher(name=f"Выдавецтва {i}", slug=f"benchmark-publisher-{i}")
+        for i in range(5)
+    )
+    link_types = LinkType.objects.bulk_create(
+        LinkType(name=f"benchmark-{i}", caption=f"Link {i}") for i in range(3)
+    )
+    created_books = Book.objects.bulk_create(
+        Book(
+            title=f"Кніга {i}",
+            slug=f"benchmark-book-{i}",
+            status=BookStatus.ACTIVE,
+        )
+        for i in range(books)
+    )
+    narrations = Narration.objects.bulk_create(
+        Narration(
+            book=book,
+            language=Language.BELARUSIAN,
+            date=date.today(),
+            duration=timedelta(hours=1),
+        )
+        for book in created_books
+    )
+    Book.authors.through.objects.bulk_create(
+        Book.authors.through(book=book, person=people[i % len(people)])
+        for i, book in enumerate(created_books)
+    )
+    Book.tag.through.objects.bulk_create(
+        Book.tag.through(book=book, tag=tags[i % len(tags)])
+        for i, book in enumerate(created_books)
+    )
+    Narration.narrators.through.objects.bulk_create(
+        Narration.narrators.through(
+            narration=narration, person=people[(i + 1) % len(people)]
+        )
+        for i, narration in enumerate(narrations)
+    )
+    Narration.publishers.through.objects.bulk_create(
+        Narration.publishers.through(
+            narration=narration, publisher=publishers[i % len(publishers)]
+        )
+        for i, narration in enumerate(narrations)
+    )
+    Link.objects.bulk_create(
+        Link(
+            narration=narration,
+            url_type=link_type,
+            url=f"https://{link_type.name}.com/{i}",
+        )
+        for i, narration in enumerate(narrations)
+        for link_type in link_types[: 1 + i % len(link_types)]
+    )
+
+
+class Command(BaseCommand):
+    """See help."""
+
+    help = (
+        "Compares number of queries and time needed to serialize books for "
+        "data.json with only narrations prefetched and the way data.json export "
+        "does it, with all related objects prefetched per chunk. Then compares "
+        "time of loading data.json and data.bin. With --books the given number of "
+        "books is created for the benchmark and removed after."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--books",
+            type=int,
+            default=0,
+            help="Number of books to create before the benchmark.",
+        )
+
+    def measure(self, name: str, serialize: Callable[[], List]) -> List:
+        queries = 0
+
+        def count_queries(execute, sql, params, many, context):
+            nonlocal queries
+            queries += 1
+            return execute(sql, params, many, context)
+
+        start = time.perf_counter()
+        with connection.execute_wrapper(count_queries):
+            data = serialize()
+        elapsed = time.perf_counter() - start
+        self.stdout.write(
+            f"{name}: {len(data)} books, {queries} queries, {elapsed:.2f}s"
+        )
+        return data
+
+    def measure_loading(self, name: str, load: Callable[[], Any]) -> None:
+        # Best of several runs, as single runs are noisy.
+        elapsed = min(timeit.repeat(load, number=1, repeat=5))
+        self.stdout.write(f"{name}: {elapsed:.3f}s")
+
+    def handle(self, *args, **options):
+        try:
+            with transaction.atomic():
+                if options["books"] > 0:
+                    seed(options["books"])
+                before = self.measure(
+                    "narrations prefetched",
+                    lambda: serializers.BookSimpleSerializer(
+                        Book.objects.prefetch_related("narrations"), many=True
+                    ).data,
+                )
+                after = self.measure(
+                    "everything prefetched",
+                    lambda: list(
+                        data_export.serialize(
+                            data_export.books_queryset(),
+                            serializers.BookSimpleSerializer,
+                        )
+                    ),
+                )
+                json_content, binary_content = data_export.generate_in_memory()
+                raise Rollback()
+        except Rollback:
+            pass
+        if before != after:
+            raise CommandError("Serialized books differ.")
+
+        self.stdout.write(
+            f"data.json: {len(json_content)} bytes, "
+            f"data.bin: {len(binary_content)} bytes"
+        )
+        self.measure_loading("json.loads", lambda: json.loads(json_content))
+        self.measure_loading("columnar.loads", lambda: columnar.loads(binary_content))
+        self.measure_loading(
+            "columnar.loads, books titles",
+            lambda: list(columnar.loads(binary_content)["books"]["title"]),
+        )
+        self.measure_loading(
+            "columnar.loads, all values",
+            lambda: [
+                list(values)
+                for columns in columnar.loads(binary_content).values()
+                for values in columns.values()
+            ],
+        )
+        data = json.loads(json_content)
+        if [book["title"] for book in data["books"]] != columnar.loads(binary_content)[
+            "books"
+        ]["title"]:
+            raise CommandError("Books in data.json and data.bin differ.")
@@ -0,0 +1,21 @@
+"""
+See Command desription.
+"""
+
+from django.core.management.base import BaseCommand
+
+from books import search
+
+
+class Command(BaseCommand):
+    """See help."""
+
+    help = (
+        "Builds local search index from DB and saves it to storage. The index is "
+        "also rebuilt by push_data_to_algolia."
+    )
+
+    def handle(self, *args, **options):
+        records = search.build_records()
+        search.save_local_index(records)
+        self.stdout.write(f"Built search index of {len(records)} records.")
@@ -0,0 +1,24 @@
+"""
+See Command desription.
+"""
+
+from django.core.management.base import BaseCommand
+
+from books import page_cache
+
+# Import views so that cached views are registered.
+from books import urls  # noqa: F401
+
+
+class Command(BaseCommand):
+    """See help."""
+
+    help = "Prints number of page cache hits and misses for each cached page."
+
+    def handle(self, *args, **options):
+        for name, stats in page_cache.get_stats().items():
+            total = stats["hit"] + stats["miss"]
+            ratio = stats["hit"] / total if total else 0
+            self.stdout.write(
+                f"{name}: {stats['hit']} hits, {stats['miss']} misses ({ratio:.0%})"
+            )
@@ -0,0 +1,51 @@
+"""
+See Command desription.
+"""
+
+from django.core.management.base import BaseCommand
+
+from books import query_stats
+
+
+class Command(BaseCommand):
+    """See help."""
+
+    help = (
+        "Prints percentiles of number of SQL queries, DB time, template rendering "
+        "time and response size for each view, collected by QueryStatsMiddleware."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--reset", action="store_true", help="Remove collected stats."
+        )
+
+    def handle(self, *args, **options):
+        if options["reset"]:
+            query_stats.reset()
+            self.stdout.write("Removed collected stats.")
+            return
+        percentiles = "/".join(f"p{p}" for p in query_stats.PERCENTILES)
+        self.stdout.write(
+            f"view: samples, {percentiles} of queries, DB ms, template ms, KB"
+        )
+        report = query_stats.get_report()
+        # Views with the most queries first.
+        for view, stats in sorted(
+            report.items(), key=lambda item: -item[1]["queries"][50]
+        ):
+            sizes = stats["response_size"]
+            columns = [
+                self.format(stats["queries"]),
+                self.format(stats["db_time_ms"]),
+                self.format(stats["template_time_ms"]),
+                (
+                    self.format({p: size / 1024 for p, size in sizes.items()})
+                    if sizes
+                    else "-"
+                ),
+            ]
+            self.stdout.write(f"{view}: {stats['samples']}, " + ", ".join(columns))
+
+    def format(self, percentiles: dict[int, float]) -> str:
+        return "/".join(f"{value:.0f}" for value in percentiles.values())
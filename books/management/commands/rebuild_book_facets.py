@@ -0,0 +1,20 @@
+"""
+See Command desription.
+"""
+
+from django.core.management.base import BaseCommand
+
+from books.models import Book, BookFacet
+
+
+class Command(BaseCommand):
+    """See help."""
+
+    help = (
+        "Recomputes catalog facets (BookFacet) for all books. Use it after "
+        "bulk changes that bypass model signals, for example loaddata."
+    )
+
+    def handle(self, *args, **options):
+        BookFacet.objects.rebuild(Book.objects.values_list("uuid", flat=True))
+        self.stdout.write(f"Rebuilt facets: {BookFacet.objects.count()} in total.")
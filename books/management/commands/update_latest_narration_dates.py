@@ -0,0 +1,22 @@
+"""
+See Command desription.
+"""
+
+from django.core.management.base import BaseCommand
+
+from books.models import Book
+
+
+class Command(BaseCommand):
+    """See help."""
+
+    help = (
+        "Recomputes Book.latest_narration_date for all books. Use it after "
+        "bulk changes that bypass Narration.save(), for example loaddata."
+    )
+
+    def handle(self, *args, **options):
+        Book.objects.update_latest_narration_date()
+        self.stdout.write(
+            f"Updated latest narration date for {Book.objects.count()} books."
+        )
@@ -1,5 +1,10 @@
+import random
+
+from django.conf import settings
 from django.http import HttpRequest, HttpResponsePermanentRedirect
 
+from books import query_stats
+
 
 class WwwRedirectMiddleware:
 
@@ -14,3 +19,27 @@ class WwwRedirectMiddleware:
             )
         else:
             return self.get_response(request)
+
+
+class QueryStatsMiddleware:
+    """
+    Collects number of SQL queries, DB and template rendering time and response
+    size for a sample of requests, see books/query_stats.py. Sample rate is set
+    by QUERY_STATS_SAMPLE_RATE setting.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request: HttpRequest):
+        if random.random() >= settings.QUERY_STATS_SAMPLE_RATE:
+            return self.get_response(request)
+        with query_stats.collect() as stats:
+            response = self.get_response(request)
+        # Body of streaming responses is produced after this point, queries made
+        # while streaming are not counted.
+        if not response.streaming:
+            stats.response_size = len(response.content)
+        if request.resolver_match is not None:
+            query_stats.record(query_stats.view_name(request.resolver_match), stats)
+        return response
@@ -0,0 +1,42 @@
+# Generated by Django 5.2.10 on 2026-10-18 05:33
+
+from django.db import migrations, models
+
+
+def fill_latest_narration_date(apps, schema_editor):
+    Book = apps.get_model("books", "Book")
+    Narration = apps.get_model("books", "Narration")
+    latest_date = (
+        Narration.objects.filter(book=models.OuterRef("uuid"))
+        .order_by("-date")
+        .values("date")[:1]
+    )
+    Book.objects.update(latest_narration_date=models.Subquery(latest_date))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("books", "0025_add_isbn_model"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="book",
+            name="latest_narration_date",
+            field=models.DateField(
+                blank=True,
+                editable=False,
+                null=True,
+                verbose_name="Latest narration date",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="book",
+            index=models.Index(
+                fields=["-latest_narration_date", "-uuid"],
+                name="book_latest_narration_idx",
+            ),
+        ),
+        migrations.RunPython(fill_latest_narration_date, migrations.RunPython.noop),
+    ]
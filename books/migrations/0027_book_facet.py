@@ -0,0 +1,67 @@
+# Generated by Django 5.2.10 on 2026-10-18 05:36
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def fill_book_facets(apps, schema_editor):
+    Book = apps.get_model("books", "Book")
+    BookFacet = apps.get_model("books", "BookFacet")
+    Narration = apps.get_model("books", "Narration")
+    Link = apps.get_model("books", "Link")
+    facets = set()
+    for book_id, language, paid in Narration.objects.values_list(
+        "book_id", "language", "paid"
+    ):
+        facets.add((book_id, f"lang:{language}"))
+        facets.add((book_id, f"paid:{str(paid).lower()}"))
+    for book_id, link_type_name in Link.objects.filter(
+        narration__isnull=False, url_type__isnull=False
+    ).values_list("narration__book_id", "url_type__name"):
+        facets.add((book_id, f"links:{link_type_name}"))
+    for book_id, tag_id in Book.tag.through.objects.values_list("book_id", "tag_id"):
+        facets.add((book_id, f"tag:{tag_id}"))
+    BookFacet.objects.bulk_create(
+        [BookFacet(book_id=book_id, name=name) for book_id, name in facets]
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("books", "0026_book_latest_narration_date"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="BookFacet",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("name", models.CharField(max_length=150, verbose_name="Facet")),
+                (
+                    "book",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="facets",
+                        to="books.book",
+                    ),
+                ),
+            ],
+            options={
+                "constraints": [
+                    models.UniqueConstraint(
+                        fields=("name", "book"), name="book_facet_name_book_unique"
+                    )
+                ],
+            },
+        ),
+        migrations.RunPython(fill_book_facets, migrations.RunPython.noop),
+    ]
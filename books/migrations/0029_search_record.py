@@ -0,0 +1,32 @@
+# Generated by Django 5.2.10 on 2026-10-18 06:06
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("books", "0028_create_cache_table"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="SearchRecord",
+            fields=[
+                (
+                    "object_id",
+                    models.CharField(
+                        max_length=36,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="Object Id",
+                    ),
+                ),
+                (
+                    "content_hash",
+                    models.CharField(max_length=64, verbose_name="Content hash"),
+                ),
+                ("data", models.JSONField(verbose_name="Record")),
+            ],
+        ),
+    ]
@@ -0,0 +1,104 @@
+# Generated by Django 5.2.10 on 2026-10-18 06:37
+
+import belorthography
+from django.db import migrations, models
+
+FIELDS = {
+    "Book": ["title", "description"],
+    "Narration": ["description"],
+    "Person": ["name", "description"],
+    "Publisher": ["name", "description"],
+}
+
+
+def fill_lacinka_fields(apps, schema_editor):
+    for model_name, fields in FIELDS.items():
+        Model = apps.get_model("books", model_name)
+        objects = list(Model.objects.only("pk", *fields))
+        for obj in objects:
+            for field in fields:
+                setattr(
+                    obj,
+                    f"{field}_lac",
+                    belorthography.convert(
+                        getattr(obj, field),
+                        belorthography.Orthography.OFFICIAL,
+                        belorthography.Orthography.LATIN,
+                    ),
+                )
+        Model.objects.bulk_update(
+            objects, [f"{field}_lac" for field in fields], batch_size=500
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("books", "0029_search_record"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="book",
+            name="description_lac",
+            field=models.TextField(
+                blank=True, editable=False, verbose_name="Book Description in łacinka"
+            ),
+        ),
+        migrations.AddField(
+            model_name="book",
+            name="title_lac",
+            field=models.CharField(
+                default="",
+                editable=False,
+                max_length=200,
+                verbose_name="Book Title in łacinka",
+            ),
+        ),
+        migrations.AddField(
+            model_name="narration",
+            name="description_lac",
+            field=models.TextField(
+                blank=True,
+                editable=False,
+                verbose_name="Narration Description in łacinka",
+            ),
+        ),
+        migrations.AddField(
+            model_name="person",
+            name="description_lac",
+            field=models.TextField(
+                blank=True, editable=False, verbose_name="Person Description in łacinka"
+            ),
+        ),
+        migrations.AddField(
+            model_name="person",
+            name="name_lac",
+            field=models.CharField(
+                default="",
+                editable=False,
+                max_length=200,
+                verbose_name="Person Name in łacinka",
+            ),
+        ),
+        migrations.AddField(
+            model_name="publisher",
+            name="description_lac",
+            field=models.TextField(
+                blank=True,
+                editable=False,
+                verbose_name="Publisher Description in łacinka",
+            ),
+        ),
+        migrations.AddField(
+            model_name="publisher",
+            name="name_lac",
+            field=models.CharField(
+                default="",
+                editable=False,
+                max_length=200,
+                verbose_name="Publisher Name in łacinka",
+            ),
+        ),
+        migrations.RunPython(fill_lacinka_fields, migrations.RunPython.noop),
+    ]
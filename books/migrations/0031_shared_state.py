@@ -0,0 +1,32 @@
+# Generated by Django 5.2.10 on 2026-10-18 06:51
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("books", "0030_lacinka_fields"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="SharedState",
+            fields=[
+                (
+                    "name",
+                    models.CharField(
+                        max_length=100,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="Name",
+                    ),
+                ),
+                ("value", models.JSONField(null=True, verbose_name="Value")),
+                (
+                    "updated_at",
+                    models.DateTimeField(auto_now=True, verbose_name="Updated at"),
+                ),
+            ],
+        ),
+    ]
@@ -1,25 +1,43 @@
 import functools
 import os
-from typing import Union
+from typing import Any, Iterable, List, Optional, Union
 import uuid
 import belorthography
 
 from django.template import defaultfilters
 
+from django.core.cache import cache
 from django.core.validators import MinValueValidator, MaxValueValidator, RegexValidator
-from django.db import models
+from django.db import models, transaction
 from django.db.models.deletion import CASCADE, SET_NULL
 from django.utils.translation import gettext as _
 
-from books import image_cache
+from books import image_cache, lacinka
 
 
 def lacinify(text: str) -> str:
-    return belorthography.convert(
-        text,
-        belorthography.Orthography.OFFICIAL,
-        belorthography.Orthography.LATIN_NO_DIACTRIC,
-    )
+    return lacinka.convert(text, belorthography.Orthography.LATIN_NO_DIACTRIC)
+
+
+def _update_lacinka(
+    instance: models.Model, update_fields: Optional[Iterable[str]], *fields: str
+) -> Optional[List[str]]:
+    """
+    Stores łacinka versions of the given fields in "<field>_lac" fields, so that
+    pages in łacinka don't convert them on each render. See books/lacinka.py.
+
+    If save() is called with update_fields, only the listed fields are converted
+    and returned update_fields include their "<field>_lac" fields.
+    """
+    if update_fields is not None:
+        update_fields = list(update_fields)
+        fields = tuple(field for field in fields if field in update_fields)
+        update_fields.extend(
+            f"{field}_lac" for field in fields if f"{field}_lac" not in update_fields
+        )
+    for field in fields:
+        setattr(instance, f"{field}_lac", lacinka.convert(getattr(instance, field)))
+    return update_fields
 
 
 def _get_image_name(
@@ -68,7 +86,13 @@ class Person(models.Model):
     )
     name = models.CharField(_("Person Name"), max_length=100, default="")
     name_ru = models.CharField(_("Person Name in russian"), max_length=100, default="")
+    name_lac = models.CharField(
+        _("Person Name in łacinka"), max_length=200, default="", editable=False
+    )
     description = models.TextField(_("Person Description"), blank=True)
+    description_lac = models.TextField(
+        _("Person Description in łacinka"), blank=True, editable=False
+    )
     description_source = models.CharField(
         _("Person Description Source"),
         blank=True,
@@ -117,6 +141,9 @@ class Person(models.Model):
     def save(self, *args, **kwargs):
         if self.slug != defaultfilters.slugify(self.slug) or self.slug == "":
             self.slug = defaultfilters.slugify(lacinify(self.name))
+        kwargs["update_fields"] = _update_lacinka(
+            self, kwargs.get("update_fields"), "name", "description"
+        )
         super().save(*args, **kwargs)
 
 
@@ -155,13 +182,28 @@ class BookManager(models.Manager):
     def active_books_ordered_by_date(
         self, prefetch_fields=["authors"]
     ) -> models.QuerySet:
+        # We order by nartation date. Books with the most recent narrations go first.
+        # uuid is used as a tie-breaker so that the order is stable across pages.
         return (
             self.prefetch_related(*prefetch_fields)
             .filter(status=BookStatus.ACTIVE)
-            # We order by nartation date. Books with the most recent narrations go first.
-            .annotate(recent_annotation=models.Max("narrations__date"))
-            .order_by("-recent_annotation")
+            .order_by("-latest_narration_date", "-uuid")
+        )
+
+    def update_latest_narration_date(
+        self, book_ids: Optional[Iterable[uuid.UUID]] = None
+    ) -> None:
+        """
+        Recomputes denormalized Book.latest_narration_date for given books or
+        for all books if book_ids is None.
+        """
+        books = self.all() if book_ids is None else self.filter(uuid__in=book_ids)
+        latest_date = (
+            Narration.objects.filter(book=models.OuterRef("uuid"))
+            .order_by("-date")
+            .values("date")[:1]
         )
+        books.update(latest_narration_date=models.Subquery(latest_date))
 
 
 class Book(models.Model):
@@ -176,7 +218,13 @@ class Book(models.Model):
     )
     title = models.CharField(_("Book Title"), max_length=100, default="")
     title_ru = models.CharField(_("Book Title in russian"), max_length=100, default="")
+    title_lac = models.CharField(
+        _("Book Title in łacinka"), max_length=200, default="", editable=False
+    )
     description = models.TextField(_("Book Description"), blank=True)
+    description_lac = models.TextField(
+        _("Book Description in łacinka"), blank=True, editable=False
+    )
     description_source = models.CharField(
         _("Book Description Source"),
         blank=True,
@@ -206,6 +254,20 @@ class Book(models.Model):
     livelib_url = models.CharField(
         _("LiveLib URL"), max_length=256, blank=True, default=""
     )
+    # Date of the most recent narration. Denormalized from Narration.date so that
+    # catalog can be ordered using index instead of aggregating over narrations.
+    # Maintained by Narration.save() and signals in books/signals.py.
+    latest_narration_date = models.DateField(
+        _("Latest narration date"), null=True, blank=True, editable=False
+    )
+
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=["-latest_narration_date", "-uuid"],
+                name="book_latest_narration_idx",
+            ),
+        ]
 
     def __str__(self) -> str:
         return "%s (%s)" % (
@@ -220,12 +282,21 @@ class Book(models.Model):
         # from title.
         if self.slug != defaultfilters.slugify(self.slug) or self.slug == "":
             self.slug = defaultfilters.slugify(lacinify(self.title))
+        kwargs["update_fields"] = _update_lacinka(
+            self, kwargs.get("update_fields"), "title", "description"
+        )
         if Book.objects.filter(slug=self.slug).exclude(uuid=self.uuid).count() > 0:
             for i in range(2, 100):
                 new_slug = f"{self.slug}-{i}"
                 if Book.objects.filter(slug=new_slug).count() == 0:
                     self.slug = new_slug
                     break
+        # The value on this instance might be outdated as the field is updated
+        # directly in DB when narrations change.
+        if not self._state.adding:
+            self.latest_narration_date = self.narrations.aggregate(
+                latest=models.Max("date")
+            )["latest"]
         super().save(*args, **kwargs)
 
     objects = BookManager()
@@ -244,6 +315,9 @@ class Publisher(models.Model):
         unique=True,
     )
     name = models.CharField(_("Publisher Name"), max_length=100, default="")
+    name_lac = models.CharField(
+        _("Publisher Name in łacinka"), max_length=200, default="", editable=False
+    )
     slug = models.SlugField(
         _("Publisher Slug"),
         max_length=100,
@@ -257,6 +331,9 @@ class Publisher(models.Model):
         upload_to=functools.partial(_get_image_name, "logos"), blank=True, null=True
     )
     description = models.TextField(_("Publisher Description"), blank=True)
+    description_lac = models.TextField(
+        _("Publisher Description in łacinka"), blank=True, editable=False
+    )
 
     def __str__(self) -> str:
         return f"{self.name}"
@@ -264,6 +341,9 @@ class Publisher(models.Model):
     def save(self, *args, **kwargs):
         if self.slug != defaultfilters.slugify(self.slug) or self.slug == "":
             self.slug = defaultfilters.slugify(lacinify(self.name))
+        kwargs["update_fields"] = _update_lacinka(
+            self, kwargs.get("update_fields"), "name", "description"
+        )
         super().save(*args, **kwargs)
 
 
@@ -303,6 +383,9 @@ class Narration(models.Model):
     )
 
     description = models.TextField(_("Narration Description"), blank=True)
+    description_lac = models.TextField(
+        _("Narration Description in łacinka"), blank=True, editable=False
+    )
 
     cover_image = models.ImageField(
         upload_to=functools.partial(_get_image_name, "covers"), blank=True, null=True
@@ -333,7 +416,22 @@ class Narration(models.Model):
         )
 
     def save(self, *args, **kwargs):
+        # Narration might be moved to another book in admin. In that case the latest
+        # narration date needs to be updated for both old and new book.
+        previous_book_id = None
+        if not self._state.adding:
+            previous_book_id = (
+                Narration.objects.filter(uuid=self.uuid)
+                .values_list("book_id", flat=True)
+                .first()
+            )
+        kwargs["update_fields"] = _update_lacinka(
+            self, kwargs.get("update_fields"), "description"
+        )
         super().save(*args, **kwargs)
+        book_ids = {self.book_id, previous_book_id} - {None}
+        Book.objects.update_latest_narration_date(book_ids)
+        BookFacet.objects.rebuild(book_ids)
         image_cache.trigger_image_resizing()
 
 
@@ -416,3 +514,151 @@ class Link(models.Model):
 
     def __str__(self) -> str:
         return f"{self.url} - {self.url_type}"
+
+
+class BookFacetManager(models.Manager):
+    def rebuild(self, book_ids: Iterable[uuid.UUID]) -> None:
+        """Recomputes all facets of the given books from their narrations, links and tags."""
+        book_ids = list(
+            Book.objects.filter(uuid__in=book_ids).values_list("uuid", flat=True)
+        )
+        facets: set[tuple[uuid.UUID, str]] = set()
+        for book_id, language, paid in Narration.objects.filter(
+            book_id__in=book_ids
+        ).values_list("book_id", "language", "paid"):
+            facets.add((book_id, BookFacet.for_language(language)))
+            facets.add((book_id, BookFacet.for_paid(paid)))
+        for book_id, link_type_name in Link.objects.filter(
+            narration__book_id__in=book_ids, url_type__isnull=False
+        ).values_list("narration__book_id", "url_type__name"):
+            facets.add((book_id, BookFacet.for_link_type(link_type_name)))
+        for book_id, tag_id in Book.tag.through.objects.filter(
+            book_id__in=book_ids
+        ).values_list("book_id", "tag_id"):
+            facets.add((book_id, BookFacet.for_tag(tag_id)))
+        with transaction.atomic():
+            self.filter(book_id__in=book_ids).delete()
+            self.bulk_create(
+                [BookFacet(book_id=book_id, name=name) for book_id, name in facets]
+            )
+
+    def filter_books(
+        self, books: models.QuerySet, facet_groups: Iterable[Iterable[str]]
+    ) -> models.QuerySet:
+        """
+        Keeps only books that have at least one facet from each group. Each group
+        is resolved as a semi-join on the facet table so that, unlike filtering
+        through narrations, it doesn't multiply rows and doesn't need distinct().
+        """
+        for group in facet_groups:
+            books = books.filter(
+                uuid__in=self.filter(name__in=list(group)).values("book_id")
+            )
+        return books
+
+    def counts(self, books: models.QuerySet) -> dict[str, int]:
+        """Returns number of books having each facet among the given books."""
+        return dict(
+            self.filter(book__in=books.order_by().values("uuid"))
+            .values("name")
+            .annotate(count=models.Count("book_id"))
+            .values_list("name", "count")
+        )
+
+
+class BookFacet(models.Model):
+    """
+    Precomputed catalog filter value of a book, for example "it has a narration in
+    russian" or "it has a Kobo link". Catalog filters are resolved against this
+    table instead of joining narrations and links. Maintained by Narration.save()
+    and signals in books/signals.py. Use rebuild_book_facets command to recompute
+    facets of all books.
+    """
+
+    book = models.ForeignKey(Book, related_name="facets", on_delete=CASCADE)
+    name = models.CharField(_("Facet"), max_length=150)
+
+    objects = BookFacetManager()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["name", "book"], name="book_facet_name_book_unique"
+            ),
+        ]
+
+    def __str__(self) -> str:
+        return f"{self.name}"
+
+    @staticmethod
+    def for_tag(tag_id: int) -> str:
+        return f"tag:{tag_id}"
+
+    @staticmethod
+    def for_language(language: str) -> str:
+        return f"lang:{language}"
+
+    @staticmethod
+    def for_paid(paid: bool) -> str:
+        return f"paid:{str(paid).lower()}"
+
+    @staticmethod
+    def for_link_type(link_type_name: str) -> str:
+        return f"links:{link_type_name}"
+
+
+class SearchRecord(models.Model):
+    """
+    Search record as it was last pushed to Algolia. Hash of the record content is
+    used to push only records that changed since the previous sync, see
+    books/search_sync.py.
+    """
+
+    object_id = models.CharField(_("Object Id"), primary_key=True, max_length=36)
+    content_hash = models.CharField(_("Content hash"), max_length=64)
+    data = models.JSONField(_("Record"))
+
+    def __str__(self) -> str:
+        return f"{self.data.get('model')} {self.object_id}"
+
+
+class SharedStateManager(models.Manager):
+    # Values are cached to avoid a query on each read, but only for a limited time
+    # as cache entries can be evicted or culled at any moment anyway.
+    CACHE_TIMEOUT_SEC = 60 * 60
+
+    @staticmethod
+    def _cache_key(name: str) -> str:
+        return f"shared-state:{name}"
+
+    def get_value(self, name: str, default: Any = None) -> Any:
+        """Returns value stored under the name, default if there is none."""
+        cached = cache.get(self._cache_key(name))
+        if cached is None:
+            state = self.filter(name=name).first()
+            cached = {"value": state.value if state is not None else None}
+            cache.set(self._cache_key(name), cached, timeout=self.CACHE_TIMEOUT_SEC)
+        return default if cached["value"] is None else cached["value"]
+
+    def set_value(self, name: str, value: Any) -> None:
+        self.update_or_create(name=name, defaults={"value": value})
+        cache.set(
+            self._cache_key(name), {"value": value}, timeout=self.CACHE_TIMEOUT_SEC
+        )
+
+
+class SharedState(models.Model):
+    """
+    Small values shared by all instances that must not be lost, like the current
+    version of data.json. Unlike the cache, where entries might be evicted at any
+    moment, they are kept until changed.
+    """
+
+    name = models.CharField(_("Name"), primary_key=True, max_length=100)
+    value = models.JSONField(_("Value"), null=True)
+    updated_at = models.DateTimeField(_("Updated at"), auto_now=True)
+
+    objects = SharedStateManager()
+
+    def __str__(self) -> str:
+        return self.name
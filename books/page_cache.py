@@ -0,0 +1,341 @@
+"""
+Cache of rendered public pages and of data fragments used to render them.
+
+Every cached entry records its dependencies - names of objects it was built from,
+for example "book:<uuid>" or "person:<uuid>" - together with the versions those
+dependencies had at that moment. When a model changes, signal handlers in
+books/signals.py bump versions of the affected dependencies. Entries built from
+old versions are considered stale and rebuilt on the next request, while pages
+that don't depend on the changed object stay cached.
+
+Pages are keyed by URL and the active language as the same URL is rendered
+differently in cyrillic and łacinka. Only query params declared by the view are
+part of the key, others are dropped from the request, so that URLs with random
+params don't fill the cache with copies of the same page.
+
+Cached pages are served with ETag, a hash of the page content, and Last-Modified,
+the time the newest of the page dependencies changed. Requests with matching
+If-None-Match or If-Modified-Since get 304 response straight from the cached
+entry, without rendering the page.
+"""
+
+from collections import Counter
+from collections.abc import Callable, Iterable
+import functools
+import hashlib
+import re
+import time
+from typing import Any, Optional, TypeVar
+import uuid
+
+from django.core.cache import cache
+from django.db import connection, transaction
+from django.http import HttpRequest, HttpResponse, QueryDict
+from django.middleware.csrf import get_token
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date, quote_etag
+from django.utils.translation import get_language
+
+PAGE_CACHE_TIMEOUT_SEC = 60 * 60
+
+# Dependency of all pages that list books, like index or catalog. Any change of
+# books, narrations, people or tags might change such pages.
+CATALOG = "catalog"
+LINK_TYPES = "link-types"
+# Changed on any invalidation. Pages are not cached if it changed while they were
+# rendered, as they might show data older than versions of their dependencies.
+CHANGES = "changes"
+
+# Rendered pages contain CSRF token used by the language switcher form. The token
+# is different for each visitor so it's replaced when a page is served from cache.
+CSRF_TOKEN_RE = re.compile(rb'(name="csrfmiddlewaretoken" value=")[^"]*(")')
+CSRF_TOKEN_PLACEHOLDER = b"__csrf_token__"
+
+T = TypeVar("T")
+
+COUNTERS_FLUSH_EVERY = 100
+COUNTERS_FLUSH_INTERVAL_SEC = 60
+_pending_counts: Counter[str] = Counter()
+_last_counters_flush = time.monotonic()
+
+# Names of cached views and fragments. Used to report hit/miss counters.
+cached_views: list[str] = []
+
+# Pages might change without any dependency change when a new version of the site
+# is deployed, so they are never reported as modified before the process started.
+_started_at = int(time.time())
+
+
+def for_book(book_id: Any) -> str:
+    return f"book:{book_id}"
+
+
+def for_person(person_id: Any) -> str:
+    return f"person:{person_id}"
+
+
+def for_publisher(publisher_id: Any) -> str:
+    return f"publisher:{publisher_id}"
+
+
+def for_tag(tag_id: Any) -> str:
+    return f"tag:{tag_id}"
+
+
+def _version_key(dependency: str) -> str:
+    return f"page-cache-dependency:{dependency}"
+
+
+def _counter_key(name: str, outcome: str) -> str:
+    return f"page-cache-stats:{name}:{outcome}"
+
+
+def _new_version() -> str:
+    # Versions are random rather than incremented so that a version key evicted
+    # from cache can't be recreated with a value some stale entry has recorded.
+    # They start with the time of the change, used for Last-Modified header.
+    return f"{int(time.time())}-{uuid.uuid4().hex}"
+
+
+def _modified_at(versions: dict[str, str]) -> Optional[int]:
+    """Time the newest of the given dependency versions was created."""
+    times = [version.partition("-") for version in versions.values()]
+    if any(not separator for _, separator, _ in times):
+        # Versions created before they included time.
+        return None
+    return max([_started_at, *(int(created) for created, _, _ in times)])
+
+
+def _bump_versions(dependencies: Iterable[str]) -> None:
+    cache.set_many(
+        {
+            _version_key(dependency): _new_version()
+            for dependency in [*dependencies, CHANGES]
+        },
+        timeout=None,
+    )
+
+
+def invalidate(*dependencies: str) -> None:
+    """Makes all cached entries that depend on any of the given objects stale."""
+    _bump_versions(dependencies)
+    if connection.in_atomic_block:
+        # Pages rendered before the transaction commits show old data, versions
+        # are changed once more so that such pages become stale too.
+        transaction.on_commit(lambda: _bump_versions(dependencies))
+
+
+def _current_versions(dependencies: Iterable[str]) -> dict[str, str]:
+    """Returns versions of given dependencies, initializing missing ones."""
+    keys = [_version_key(dependency) for dependency in dependencies]
+    versions = cache.get_many(keys)
+    missing = {key: _new_version() for key in keys if key not in versions}
+    for key, version in missing.items():
+        if not cache.add(key, version, timeout=None):
+            # Initialized concurrently, use the winner.
+            version = cache.get(key)
+        versions[key] = version
+    return versions
+
+
+def _get_fresh(key: str) -> Optional[dict]:
+    entry = cache.get(key)
+    if entry is None:
+        return None
+    versions = cache.get_many(entry["versions"].keys())
+    if versions != entry["versions"]:
+        return None
+    return entry
+
+
+def _count(name: str, outcome: str) -> None:
+    """
+    Counts cache hit or miss. Counts are accumulated in process and added to the
+    shared counters in batches to avoid writing to cache on each request.
+    """
+    _pending_counts[_counter_key(name, outcome)] += 1
+    if (
+        _pending_counts.total() >= COUNTERS_FLUSH_EVERY
+        or time.monotonic() - _last_counters_flush >= COUNTERS_FLUSH_INTERVAL_SEC
+    ):
+        flush_counters()
+
+
+def flush_counters() -> None:
+    global _last_counters_flush
+    _last_counters_flush = time.monotonic()
+    counts = dict(_pending_counts)
+    _pending_counts.clear()
+    for key, count in counts.items():
+        cache.add(key, 0, timeout=None)
+        try:
+            cache.incr(key, count)
+        except ValueError:
+            # Counter was evicted in between. Losing some counts is fine.
+            continue
+        # Some backends reset timeout on incr.
+        cache.touch(key, timeout=None)
+
+
+def get_stats() -> dict[str, dict[str, int]]:
+    """Returns number of cache hits and misses for each cached view and fragment."""
+    flush_counters()
+    counters = cache.get_many(
+        [
+            _counter_key(name, outcome)
+            for name in cached_views
+            for outcome in ["hit", "miss"]
+        ]
+    )
+    return {
+        name: {
+            outcome: counters.get(_counter_key(name, outcome), 0)
+            for outcome in ["hit", "miss"]
+        }
+        for name in cached_views
+    }
+
+
+def add_dependencies(request: HttpRequest, *dependencies: str) -> None:
+    """
+    Records objects the page rendered for the request depends on. Only pages that
+    have dependencies are cached.
+    """
+    if not hasattr(request, "page_cache_dependencies"):
+        request.page_cache_dependencies = set()
+    request.page_cache_dependencies.update(dependencies)
+
+
+def _page_key(request: HttpRequest) -> str:
+    url = request.build_absolute_uri(request.path)
+    if request.GET:
+        url += "?" + request.GET.urlencode()
+    digest = hashlib.sha256(f"{get_language()}|{url}".encode()).hexdigest()
+    return f"page-cache:{digest}"
+
+
+def _with_validators(
+    request: HttpRequest, entry: dict, get_response: Callable[[], HttpResponse]
+) -> HttpResponse:
+    """
+    Returns 304 response if the page from the entry is not modified since the
+    client got it, otherwise the given response. Both get ETag and Last-Modified.
+    """
+    # Content with the CSRF token placeholder is hashed, so that the page has the
+    # same ETag for all visitors.
+    etag = quote_etag(hashlib.sha256(entry["content"]).hexdigest()[:32])
+    modified_at = _modified_at(entry["versions"])
+    response = (
+        get_conditional_response(request, etag=etag, last_modified=modified_at)
+        or get_response()
+    )
+    response["ETag"] = etag
+    if modified_at is not None:
+        response["Last-Modified"] = http_date(modified_at)
+    # Pages contain CSRF token of the visitor, so they can't be stored by shared
+    # caches. Browsers revalidate them on each use.
+    patch_cache_control(response, private=True, no_cache=True)
+    return response
+
+
+def _keep_params(request: HttpRequest, params: Iterable[str]) -> None:
+    """Drops query params other than the given ones from the request."""
+    kept = QueryDict(mutable=True)
+    for param in sorted(set(params) & set(request.GET.keys())):
+        kept.setlist(param, request.GET.getlist(param))
+    kept._mutable = False
+    request.GET = kept
+
+
+def cached_page(
+    params: Iterable[str] = (),
+) -> Callable[[Callable[..., HttpResponse]], Callable[..., HttpResponse]]:
+    """
+    Decorator that caches rendered pages. The view declares what the page depends
+    on using add_dependencies(). Query params that are not listed in params are
+    ignored by the view.
+    """
+    params = list(params)
+
+    def decorator(view: Callable[..., HttpResponse]) -> Callable[..., HttpResponse]:
+        name = view.__name__
+        cached_views.append(name)
+
+        @functools.wraps(view)
+        def wrapper(request: HttpRequest, *args, **kwargs) -> HttpResponse:
+            if request.method != "GET":
+                return view(request, *args, **kwargs)
+            _keep_params(request, params)
+            key = _page_key(request)
+            entry = _get_fresh(key)
+            if entry is not None:
+                _count(name, "hit")
+                return _with_validators(
+                    request,
+                    entry,
+                    lambda: HttpResponse(
+                        entry["content"].replace(
+                            CSRF_TOKEN_PLACEHOLDER, get_token(request).encode()
+                        ),
+                        content_type=entry["content_type"],
+                    ),
+                )
+
+            _count(name, "miss")
+            # Dependencies are known only after rendering, so the marker of all
+            # changes is taken before it instead.
+            changes = cache.get(_version_key(CHANGES))
+            response = view(request, *args, **kwargs)
+            dependencies = getattr(request, "page_cache_dependencies", None)
+            if response.status_code != 200 or response.streaming or not dependencies:
+                return response
+            entry = {
+                "content": CSRF_TOKEN_RE.sub(
+                    rb"\1" + CSRF_TOKEN_PLACEHOLDER + rb"\2", response.content
+                ),
+                "content_type": response["Content-Type"],
+                "versions": _current_versions(dependencies),
+            }
+            if cache.get(_version_key(CHANGES)) == changes:
+                cache.set(key, entry, timeout=PAGE_CACHE_TIMEOUT_SEC)
+            return _with_validators(request, entry, lambda: response)
+
+        return wrapper
+
+    return decorator
+
+
+def cached_fragment(
+    dependencies: Iterable[str],
+) -> Callable[[Callable[[], T]], Callable[[], T]]:
+    """
+    Decorator that caches data returned by a function without arguments. Use it for
+    parts of pages that can't be cached as a whole.
+    """
+
+    def decorator(load: Callable[[], T]) -> Callable[[], T]:
+        name = load.__name__
+        key = f"page-cache-fragment:{name}"
+        cached_views.append(name)
+
+        @functools.wraps(load)
+        def wrapper() -> T:
+            entry = _get_fresh(key)
+            if entry is not None:
+                _count(name, "hit")
+                return entry["data"]
+            _count(name, "miss")
+            # Versions are taken before loading so that changes made while loading
+            # make the entry stale instead of being lost.
+            versions = _current_versions(dependencies)
+            data = load()
+            cache.set(
+                key,
+                {"data": data, "versions": versions},
+                timeout=PAGE_CACHE_TIMEOUT_SEC,
+            )
+            return data
+
+        return wrapper
+
+    return decorator
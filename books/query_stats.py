@@ -0,0 +1,244 @@
+"""
+Collection of per-view performance stats: number of SQL queries, time spent in DB
+and in template rendering, and response size.
+
+Stats are collected by QueryStatsMiddleware for a sample of requests, buffered
+in process and periodically added to the shared cache, so that the report
+produced by the `query_stats` command covers all instances. Views are
+identified by URL name, e.g. "book-detail-page" or "partners:dashboard", or by
+URL pattern for unnamed URLs.
+"""
+
+from collections.abc import Iterator, Sequence
+from contextlib import ExitStack, contextmanager
+import contextvars
+from dataclasses import dataclass
+import functools
+import time
+from typing import Optional
+
+from django.core.cache import cache
+from django.db import connections
+from django.template.backends.django import DjangoTemplates
+from django.urls import ResolverMatch
+
+# Number of most recent samples kept per view.
+MAX_SAMPLES_PER_VIEW = 1000
+# Samples of each flush are stored under their own numbered slot, so that flushes
+# of different instances don't overwrite each other. Number of most recent slots
+# kept per view.
+MAX_SLOTS_PER_VIEW = 100
+FLUSH_EVERY = 50
+FLUSH_INTERVAL_SEC = 60
+VIEWS_KEY = "query-stats:views"
+PERCENTILES = [50, 90, 99]
+
+
+@dataclass
+class RequestStats:
+    """Stats of a single request."""
+
+    queries: int = 0
+    db_time_ms: float = 0
+    template_time_ms: float = 0
+    # None for streaming responses which size is unknown.
+    response_size: Optional[int] = None
+    _rendering_template: bool = False
+
+
+# Stats of all collect() contexts the current code runs within.
+_active: contextvars.ContextVar[tuple[RequestStats, ...]] = contextvars.ContextVar(
+    "query_stats", default=()
+)
+_pending: dict[str, list[tuple]] = {}
+_last_flush = time.monotonic()
+
+
+def _record_query(stats: RequestStats, execute, sql, params, many, context):
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        stats.queries += 1
+        stats.db_time_ms += (time.perf_counter() - start) * 1000
+
+
+class _TimedTemplate:
+    """Template that adds its rendering time to stats of collect() contexts."""
+
+    def __init__(self, template):
+        self.template = template
+
+    def __getattr__(self, name):
+        return getattr(self.template, name)
+
+    def render(self, context=None, request=None):
+        # Templates rendered by tags of another template, like inclusion tags
+        # using render_to_string, are counted as part of the outer one.
+        stats_list = [stats for stats in _active.get() if not stats._rendering_template]
+        if not stats_list:
+            return self.template.render(context, request)
+        for stats in stats_list:
+            stats._rendering_template = True
+        start = time.perf_counter()
+        try:
+            return self.template.render(context, request)
+        finally:
+            for stats in stats_list:
+                stats._rendering_template = False
+                stats.template_time_ms += (time.perf_counter() - start) * 1000
+
+
+class TimedDjangoTemplates(DjangoTemplates):
+    """
+    Django template backend that measures time of rendering templates within
+    collect(), configured in TEMPLATES setting. Django doesn't provide a hook to
+    measure template rendering, so templates returned by the backend are wrapped.
+    """
+
+    def from_string(self, template_code):
+        return _TimedTemplate(super().from_string(template_code))
+
+    def get_template(self, template_name):
+        return _TimedTemplate(super().get_template(template_name))
+
+
+@contextmanager
+def collect() -> Iterator[RequestStats]:
+    """Collects stats of the code run within the context. Contexts can be nested."""
+    stats = RequestStats()
+    token = _active.set(_active.get() + (stats,))
+    try:
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(
+                    # django-stubs types execute_wrapper() as a plain generator.
+                    connection.execute_wrapper(  # type: ignore[arg-type]
+                        functools.partial(_record_query, stats)
+                    )
+                )
+            yield stats
+    finally:
+        _active.reset(token)
+
+
+def view_name(match: ResolverMatch) -> str:
+    """Returns name the stats of the resolved view are recorded under."""
+    if match.url_name:
+        return ":".join([*match.namespaces, match.url_name])
+    return match.route
+
+
+def _slots_key(view: str) -> str:
+    return f"query-stats:slots:{view}"
+
+
+def _samples_key(view: str, slot: int) -> str:
+    return f"query-stats:samples:{view}:{slot}"
+
+
+def _store_samples(view: str, samples: list[tuple]) -> None:
+    # incr() isn't atomic in all cache backends, so a slot might be taken by a
+    # concurrent flush, then the next one is used. add() never overwrites.
+    for _ in range(10):
+        cache.add(_slots_key(view), 0, timeout=None)
+        try:
+            slot = cache.incr(_slots_key(view))
+        except ValueError:
+            # Counter was evicted after add().
+            continue
+        if cache.add(_samples_key(view, slot), samples, timeout=None):
+            cache.delete(_samples_key(view, slot - MAX_SLOTS_PER_VIEW))
+            return
+
+
+def _load_samples(view: str) -> list[tuple]:
+    last_slot = cache.get(_slots_key(view), 0)
+    keys = [
+        _samples_key(view, slot)
+        for slot in range(max(1, last_slot - MAX_SLOTS_PER_VIEW + 1), last_slot + 1)
+    ]
+    stored = cache.get_many(keys)
+    samples = [sample for key in keys for sample in stored.get(key, [])]
+    return samples[-MAX_SAMPLES_PER_VIEW:]
+
+
+def record(view: str, stats: RequestStats) -> None:
+    """Adds stats of a request to the given view."""
+    _pending.setdefault(view, []).append(
+        (
+            stats.queries,
+            stats.db_time_ms,
+            stats.template_time_ms,
+            stats.response_size,
+        )
+    )
+    if (
+        sum(len(samples) for samples in _pending.values()) >= FLUSH_EVERY
+        or time.monotonic() - _last_flush >= FLUSH_INTERVAL_SEC
+    ):
+        flush()
+
+
+def flush() -> None:
+    """Adds buffered samples to the shared cache."""
+    global _last_flush
+    _last_flush = time.monotonic()
+    pending = dict(_pending)
+    _pending.clear()
+    if not pending:
+        return
+    # A view added by a concurrent flush might be lost here, but it's added
+    # again by the next flush of its samples.
+    views = set(cache.get(VIEWS_KEY, []))
+    if not views.issuperset(pending):
+        cache.set(VIEWS_KEY, sorted(views | set(pending)), timeout=None)
+    for view, samples in pending.items():
+        _store_samples(view, samples[-MAX_SAMPLES_PER_VIEW:])
+
+
+def reset() -> None:
+    """Removes all collected samples."""
+    _pending.clear()
+    for view in cache.get(VIEWS_KEY, []):
+        last_slot = cache.get(_slots_key(view), 0)
+        cache.delete_many(
+            [_slots_key(view)]
+            + [
+                _samples_key(view, slot)
+                for slot in range(
+                    max(1, last_slot - MAX_SLOTS_PER_VIEW + 1), last_slot + 1
+                )
+            ]
+        )
+    cache.delete(VIEWS_KEY)
+
+
+def _percentiles(values: Sequence[float]) -> dict[int, float]:
+    values = sorted(values)
+    return {
+        p: values[min(len(values) - 1, len(values) * p // 100)] for p in PERCENTILES
+    }
+
+
+def get_report() -> dict[str, dict]:
+    """
+    Returns stats aggregated per view: number of samples and percentiles of each
+    metric, e.g. report["index"]["queries"][90].
+    """
+    flush()
+    report = {}
+    for view in cache.get(VIEWS_KEY, []):
+        samples = _load_samples(view)
+        if not samples:
+            continue
+        queries, db_time, template_time, all_sizes = zip(*samples)
+        sizes = [size for size in all_sizes if size is not None]
+        report[view] = {
+            "samples": len(samples),
+            "queries": _percentiles(queries),
+            "db_time_ms": _percentiles(db_time),
+            "template_time_ms": _percentiles(template_time),
+            "response_size": _percentiles(sizes) if sizes else None,
+        }
+    return report
@@ -0,0 +1,277 @@
+"""
+Search over books, people and publishers.
+
+Search is served either by Algolia or by the local index, depending on
+SEARCH_BACKEND setting. The local index (see books/search_engine.py) is built from
+the same records that are pushed to Algolia and is saved to storage, so that all
+instances load it instead of building their own. It's built only by jobs, see
+save_local_index(). Like data.json, each index is written to a file with a new
+name and then the current version in SharedState is switched to it, so instances
+never read a partially written or missing file.
+
+The Algolia client is created once per process and reused so that connections
+are pooled across requests. Requests use short timeouts and a circuit breaker:
+after several consecutive failures Algolia is not called for a while. When Algolia
+is not configured, fails or the breaker is open, search falls back to the local
+index. When the local index is used but there is none yet, search falls back to
+Algolia.
+"""
+
+from collections import defaultdict
+import logging
+import threading
+import time
+from typing import Dict, List, Optional
+import uuid
+
+from algoliasearch.configs import SearchConfig
+from algoliasearch.exceptions import AlgoliaException
+from algoliasearch.search_client import SearchClient
+from algoliasearch.search_index import SearchIndex
+from django.conf import settings
+from django.db.models import Exists, OuterRef
+from django.core.files.storage import default_storage
+from django.utils import timezone
+
+from books import lacinka, models
+from books.search_engine import SearchEngine
+
+MAX_HITS = 100
+# Algolia timeouts are set in whole seconds.
+ALGOLIA_TIMEOUT_SEC = 1
+# Number of consecutive failures after which Algolia is not called for
+# CIRCUIT_BREAKER_COOLDOWN_SEC.
+CIRCUIT_BREAKER_FAILURES = 3
+CIRCUIT_BREAKER_COOLDOWN_SEC = 60
+LOCAL_INDEX_FILE_PREFIX = "search-index-"
+# Name of the file used before versioned files were introduced.
+LEGACY_LOCAL_INDEX_FILE = "search_index.bin"
+LOCAL_INDEX_VERSION_KEY = "search:local-index-version"
+
+logger = logging.getLogger(__name__)
+
+_lock = threading.Lock()
+_index: Optional[SearchIndex] = None
+_breaker = {"failures": 0, "open_until": float("-inf")}
+_local_index: Dict = {"version": None, "engine": None}
+
+
+def build_record_sources() -> List[Dict]:
+    """
+    Returns search records of all active books and of people and publishers that
+    have active books, without łacinka fields, see add_lacinka(). Record format:
+    https://www.algolia.com/doc/guides/sending-and-managing-data/prepare-your-data/
+
+    Records are built from plain values using fixed number of queries regardless
+    of number of books, people and publishers.
+    """
+    active = models.BookStatus.ACTIVE
+    book_authors: Dict[uuid.UUID, List[tuple]] = defaultdict(list)
+    for book_id, name, name_ru in (
+        models.Book.authors.through.objects.filter(book__status=active)
+        .order_by("id")
+        .values_list("book_id", "person__name", "person__name_ru")
+    ):
+        book_authors[book_id].append((name, name_ru))
+
+    data = []
+    for book_id, title, title_ru, slug in models.Book.objects.filter(
+        status=active
+    ).values_list("uuid", "title", "title_ru", "slug"):
+        data.append(
+            {
+                "objectID": str(book_id),
+                "model": "book",
+                "title": title,
+                "title_ru": title_ru,
+                "slug": slug,
+                "authors": [name for name, _ in book_authors[book_id]],
+                "authors_ru": [name_ru for _, name_ru in book_authors[book_id]],
+            }
+        )
+
+    people = models.Person.objects.filter(
+        Exists(
+            models.Book.authors.through.objects.filter(
+                person=OuterRef("pk"), book__status=active
+            )
+        )
+        | Exists(
+            models.Narration.narrators.through.objects.filter(
+                person=OuterRef("pk"), narration__book__status=active
+            )
+        )
+        | Exists(
+            models.Narration.translators.through.objects.filter(
+                person=OuterRef("pk"), narration__book__status=active
+            )
+        )
+    )
+    for person_id, name, name_ru, slug in people.values_list(
+        "uuid", "name", "name_ru", "slug"
+    ):
+        data.append(
+            {
+                "objectID": str(person_id),
+                "model": "person",
+                "name": name,
+                "name_ru": name_ru,
+                "slug": slug,
+            }
+        )
+
+    publishers = models.Publisher.objects.filter(
+        Exists(
+            models.Narration.publishers.through.objects.filter(
+                publisher=OuterRef("pk"), narration__book__status=active
+            )
+        )
+    )
+    for publisher_id, name, slug in publishers.values_list("uuid", "name", "slug"):
+        data.append(
+            {
+                "objectID": str(publisher_id),
+                "model": "publisher",
+                "name": name,
+                "slug": slug,
+            }
+        )
+    return data
+
+
+def add_lacinka(record: Dict) -> Dict:
+    """
+    Returns the record with łacinka versions of title, name and authors. They are
+    derived from other fields, so they are added only to records that are pushed.
+    """
+    record = dict(record)
+    if "title" in record:
+        record["title_lac"] = lacinka.convert(record["title"])
+    if "name" in record:
+        record["name_lac"] = lacinka.convert(record["name"])
+    if "authors" in record:
+        record["authors_lac"] = [
+            lacinka.convert(author) for author in record["authors"]
+        ]
+    return record
+
+
+def build_records() -> List[Dict]:
+    """Returns all search records, see build_record_sources()."""
+    return [add_lacinka(record) for record in build_record_sources()]
+
+
+def _local_index_file(version: str) -> str:
+    return f"{LOCAL_INDEX_FILE_PREFIX}{version}.bin"
+
+
+def _delete_old_local_indexes(keep: List[str]) -> None:
+    # The previous index is kept for instances that are loading it.
+    oldest_kept = min(keep)
+    for name in default_storage.listdir("")[1]:
+        if name == LEGACY_LOCAL_INDEX_FILE or (
+            name.startswith(LOCAL_INDEX_FILE_PREFIX)
+            and name.removeprefix(LOCAL_INDEX_FILE_PREFIX) < oldest_kept
+        ):
+            default_storage.delete(name)
+
+
+def save_local_index(records: List[Dict]) -> SearchEngine:
+    """
+    Builds local index of the given records and saves it to storage. Instances
+    load the new index on next search.
+    """
+    engine = SearchEngine.build(records)
+    previous = models.SharedState.objects.get_value(LOCAL_INDEX_VERSION_KEY)
+    # Versions sort in order of generation, see _delete_old_local_indexes().
+    version = f"{timezone.now():%Y%m%d%H%M%S%f}-{uuid.uuid4().hex[:8]}"
+    with default_storage.open(_local_index_file(version), "wb") as f:
+        f.write(engine.to_bytes())
+    models.SharedState.objects.set_value(LOCAL_INDEX_VERSION_KEY, version)
+    with _lock:
+        _local_index.update(version=version, engine=engine)
+    _delete_old_local_indexes(keep=[version] + ([previous] if previous else []))
+    return engine
+
+
+def get_local_index() -> Optional[SearchEngine]:
+    """
+    Returns local index. The index is loaded from storage once per instance and
+    reloaded when a new one is saved. If the current index can't be loaded, the
+    previously loaded one is returned, None if there is none. The index is never
+    built here, as that takes long: it's built by push_data_to_algolia and
+    build_search_index jobs.
+    """
+    version = models.SharedState.objects.get_value(LOCAL_INDEX_VERSION_KEY)
+    with _lock:
+        if version is None or _local_index["version"] == version:
+            return _local_index["engine"]
+    try:
+        with default_storage.open(_local_index_file(version), "rb") as f:
+            engine = SearchEngine.from_bytes(f.read())
+    except FileNotFoundError:
+        logger.warning("Search index %s is missing.", version)
+        with _lock:
+            return _local_index["engine"]
+    with _lock:
+        _local_index.update(version=version, engine=engine)
+    return engine
+
+
+def _get_algolia_index() -> Optional[SearchIndex]:
+    """Returns Algolia index shared by all requests, None if Algolia is not set."""
+    global _index
+    if settings.ALGOLIA_APPLICATION_ID == "" or settings.ALGOLIA_SEARCH_KEY == "":
+        return None
+    with _lock:
+        if _index is None:
+            config = SearchConfig(
+                settings.ALGOLIA_APPLICATION_ID, settings.ALGOLIA_SEARCH_KEY
+            )
+            config.read_timeout = ALGOLIA_TIMEOUT_SEC
+            config.connect_timeout = ALGOLIA_TIMEOUT_SEC
+            client = SearchClient.create_with_config(config)
+            _index = client.init_index(settings.ALGOLIA_INDEX)
+        return _index
+
+
+def _search_algolia(query: str) -> Optional[List[Dict]]:
+    """Returns Algolia hits, None if Algolia is unavailable."""
+    index = _get_algolia_index()
+    if index is None or time.monotonic() < _breaker["open_until"]:
+        return None
+    try:
+        # Response:
+        # https://www.algolia.com/doc/guides/building-search-ui/going-further/backend-search/in-depth/understanding-the-api-response/
+        hits = index.search(query, {"hitsPerPage": MAX_HITS})["hits"]
+    except AlgoliaException as e:
+        logger.warning("Algolia search failed, using local index: %s", e)
+        _breaker["failures"] += 1
+        if _breaker["failures"] >= CIRCUIT_BREAKER_FAILURES:
+            _breaker.update(
+                failures=0,
+                open_until=time.monotonic() + CIRCUIT_BREAKER_COOLDOWN_SEC,
+            )
+        return None
+    _breaker["failures"] = 0
+    return hits
+
+
+def search(query: str) -> List[Dict]:
+    """
+    Returns records matching the query, most relevant first. Each record has at
+    least "objectID" and "model" fields.
+    """
+    hits = None
+    if settings.SEARCH_BACKEND != "local":
+        hits = _search_algolia(query)
+    if hits is None:
+        engine = get_local_index()
+        if engine is not None:
+            hits = engine.search(query, MAX_HITS)
+        elif settings.SEARCH_BACKEND == "local":
+            hits = _search_algolia(query)
+    if hits is None:
+        logger.warning("Neither Algolia nor local search index is available.")
+        return []
+    return hits
@@ -0,0 +1,239 @@
+"""
+In-process full-text search over search records, the same records that are pushed
+to Algolia (see books/search.py).
+
+The index is an inverted index: a sorted list of all words of searchable fields
+and, for each word, the list of records containing it. Queries are matched the
+way Algolia does it by default:
+
+- Each query word must match a word of the record. The last query word can also
+  match as a prefix, so results appear while the query is being typed.
+- Words of 4+ letters can match with 1 typo, words of 8+ letters with 2 typos.
+  Candidates for typo matching are found via trigram index of words.
+- Case and diacritics are ignored, so "sotnikau" matches "Sotnikaŭ".
+
+Results are ranked by: number of typos, best matching field (title/name first,
+then their russian and łacinka versions, then authors), number of words matched
+exactly rather than as prefix, and order of records.
+
+The index is serialized to a compact zlib-compressed file so that it can be built
+once and loaded by all instances.
+"""
+
+from bisect import bisect_left
+from collections import defaultdict
+import json
+import re
+from typing import Dict, Iterable, List, Set, Tuple
+import unicodedata
+import zlib
+
+FORMAT_VERSION = 1
+
+# Rank of each searchable field. Lower rank is better.
+FIELD_RANKS = {
+    "title": 0,
+    "name": 0,
+    "title_ru": 1,
+    "name_ru": 1,
+    "title_lac": 2,
+    "name_lac": 2,
+    "authors": 3,
+    "authors_ru": 3,
+    "authors_lac": 3,
+}
+MIN_WORD_SIZE_FOR_1_TYPO = 4
+MIN_WORD_SIZE_FOR_2_TYPOS = 8
+
+
+def normalize(text: str) -> str:
+    """Lowercases text and removes diacritics."""
+    text = unicodedata.normalize("NFKD", text.casefold())
+    return "".join(c for c in text if not unicodedata.combining(c)).replace("ł", "l")
+
+
+def tokenize(text: str) -> List[str]:
+    return re.findall(r"\w+", normalize(text))
+
+
+def _trigrams(text: str) -> Set[str]:
+    return {text[i : i + 3] for i in range(len(text) - 2)}
+
+
+def _allowed_typos(word: str) -> int:
+    if len(word) >= MIN_WORD_SIZE_FOR_2_TYPOS:
+        return 2
+    if len(word) >= MIN_WORD_SIZE_FOR_1_TYPO:
+        return 1
+    return 0
+
+
+def _edit_distance(a: str, b: str, limit: int) -> int:
+    """Levenshtein distance between a and b, or limit + 1 if it exceeds limit."""
+    if abs(len(a) - len(b)) > limit:
+        return limit + 1
+    previous = list(range(len(b) + 1))
+    for i, char_a in enumerate(a, 1):
+        current = [i]
+        for j, char_b in enumerate(b, 1):
+            current.append(
+                min(
+                    previous[j] + 1,
+                    current[j - 1] + 1,
+                    previous[j - 1] + (char_a != char_b),
+                )
+            )
+        if min(current) > limit:
+            return limit + 1
+        previous = current
+    return min(previous[-1], limit + 1)
+
+
+# For each matched record: (typos, field rank, 0 if matched exactly or 1 if as
+# prefix). Smaller tuples are better matches.
+WordMatches = Dict[int, Tuple[int, int, int]]
+
+
+class SearchEngine:
+    """Inverted index over search records. See module docs."""
+
+    def __init__(
+        self,
+        docs: List[Tuple[str, str]],
+        words: List[str],
+        postings: List[List[int]],
+    ):
+        # (objectID, model) of each record.
+        self._docs = docs
+        # Sorted words of all records.
+        self._words = words
+        # For each word flat list of (record index, field rank) pairs.
+        self._postings = postings
+        self._trigrams: Dict[str, List[int]] = defaultdict(list)
+        for word_index, word in enumerate(words):
+            for trigram in _trigrams(f"^{word}$"):
+                self._trigrams[trigram].append(word_index)
+
+    @staticmethod
+    def build(records: Iterable[Dict]) -> "SearchEngine":
+        """Builds index of the given search records."""
+        docs = []
+        word_docs: Dict[str, Dict[int, int]] = defaultdict(dict)
+        for doc_index, record in enumerate(records):
+            docs.append((str(record["objectID"]), record["model"]))
+            for field, rank in FIELD_RANKS.items():
+                values = record.get(field) or []
+                for value in values if isinstance(values, list) else [values]:
+                    for word in tokenize(value):
+                        ranks = word_docs[word]
+                        ranks[doc_index] = min(rank, ranks.get(doc_index, rank))
+        words = sorted(word_docs)
+        postings = [
+            [value for pair in sorted(word_docs[word].items()) for value in pair]
+            for word in words
+        ]
+        return SearchEngine(docs, words, postings)
+
+    def to_bytes(self) -> bytes:
+        data = {
+            "version": FORMAT_VERSION,
+            "docs": self._docs,
+            "words": self._words,
+            "postings": self._postings,
+        }
+        return zlib.compress(
+            json.dumps(data, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+        )
+
+    @staticmethod
+    def from_bytes(content: bytes) -> "SearchEngine":
+        data = json.loads(zlib.decompress(content).decode("utf-8"))
+        if data["version"] != FORMAT_VERSION:
+            raise ValueError(f"Unsupported search index version {data['version']}")
+        return SearchEngine(
+            [tuple(doc) for doc in data["docs"]], data["words"], data["postings"]
+        )
+
+    def _matching_words(
+        self, query_word: str, prefix: bool
+    ) -> Dict[int, Tuple[int, int]]:
+        """
+        Returns (typos, 0 if exact or 1 if prefix match) of each index word matching
+        the query word.
+        """
+        matches: Dict[int, Tuple[int, int]] = {}
+        start = bisect_left(self._words, query_word)
+        if prefix:
+            end = start
+            while end < len(self._words) and self._words[end].startswith(query_word):
+                matches[end] = (0, int(self._words[end] != query_word))
+                end += 1
+        elif start < len(self._words) and self._words[start] == query_word:
+            matches[start] = (0, 0)
+
+        max_typos = _allowed_typos(query_word)
+        if max_typos == 0:
+            return matches
+        # Each typo changes at most 3 trigrams, so words that share fewer trigrams
+        # can't match.
+        query_trigrams = _trigrams(f"^{query_word}" + ("" if prefix else "$"))
+        shared: Dict[int, int] = defaultdict(int)
+        for trigram in query_trigrams:
+            for word_index in self._trigrams.get(trigram, []):
+                shared[word_index] += 1
+        min_shared = len(query_trigrams) - 3 * max_typos
+        for word_index, count in shared.items():
+            if count < min_shared or word_index in matches:
+                continue
+            word = self._words[word_index]
+            typos = _edit_distance(query_word, word, max_typos)
+            if prefix:
+                typos = min(
+                    typos,
+                    _edit_distance(query_word, word[: len(query_word)], max_typos),
+                )
+            if typos <= max_typos:
+                matches[word_index] = (typos, 1)
+        return matches
+
+    def _match_word(self, query_word: str, prefix: bool) -> WordMatches:
+        result: WordMatches = {}
+        for word_index, (typos, inexact) in self._matching_words(
+            query_word, prefix
+        ).items():
+            postings = self._postings[word_index]
+            for i in range(0, len(postings), 2):
+                doc, rank = postings[i], postings[i + 1]
+                match = (typos, rank, inexact)
+                if doc not in result or match < result[doc]:
+                    result[doc] = match
+        return result
+
+    def search(self, query: str, limit: int) -> List[Dict]:
+        """
+        Returns up to `limit` records matching the query, most relevant first, as
+        dicts with "objectID" and "model" fields, like Algolia hits.
+        """
+        query_words = tokenize(query)
+        if not query_words:
+            return []
+        matches = [
+            self._match_word(word, prefix=i == len(query_words) - 1)
+            for i, word in enumerate(query_words)
+        ]
+        docs = set(matches[0])
+        for word_matches in matches[1:]:
+            docs &= word_matches.keys()
+        ranked = sorted(
+            (
+                sum(word_matches[doc][0] for word_matches in matches),
+                min(word_matches[doc][1] for word_matches in matches),
+                sum(word_matches[doc][2] for word_matches in matches),
+                doc,
+            )
+            for doc in docs
+        )
+        return [
+            {"objectID": self._docs[doc][0], "model": self._docs[doc][1]}
+            for *_, doc in ranked[:limit]
+        ]
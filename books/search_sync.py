@@ -0,0 +1,141 @@
+"""
+Incremental sync of search records to Algolia.
+
+Each sync builds records from DB and compares their hashes with hashes of the
+records pushed previously, which are stored in SearchRecord table. Only new and
+changed records are pushed, and records of objects that were deleted or hidden
+are deleted from the index. Łacinka fields are computed only for pushed records.
+When anything changed, or there is no local search index yet, it's rebuilt
+from stored records.
+
+Sync is run by the hourly push_data_to_algolia job. Changes of models shown in
+search, see books/signals.py, request sync by setting a marker in SharedState.
+The sync_search_changes job runs every few minutes and syncs only when the marker
+is set, so editing a book in admin, which saves several models, results in a
+single sync that runs on whichever instance gets the job.
+"""
+
+from dataclasses import dataclass
+import hashlib
+import json
+from typing import Dict
+
+from algoliasearch.search_client import SearchClient
+from algoliasearch.search_index import SearchIndex
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from books import search
+from books.models import SearchRecord, SharedState
+
+# Change when records built from the same data change, for example when łacinka
+# conversion is updated, to push all records on next sync.
+RECORD_FORMAT_VERSION = 1
+# Time of the first change since the previous sync, None if there were none.
+SYNC_REQUESTED_KEY = "search:sync-requested"
+
+
+@dataclass
+class SyncResult:
+    updated: int
+    deleted: int
+
+
+def record_hash(record: Dict) -> str:
+    content = json.dumps(
+        [RECORD_FORMAT_VERSION, record], sort_keys=True, ensure_ascii=False
+    )
+    return hashlib.sha256(content.encode("utf-8")).hexdigest()
+
+
+def create_index() -> SearchIndex:
+    """Returns Algolia index with write access."""
+    # https://www.algolia.com/doc/api-client/getting-started/instantiate-client-index/
+    client = SearchClient.create(
+        settings.ALGOLIA_APPLICATION_ID, settings.ALGOLIA_MODIFY_KEY
+    )
+    return client.init_index(settings.ALGOLIA_INDEX)
+
+
+def sync(index: SearchIndex, full: bool = False) -> SyncResult:
+    """
+    Pushes records that changed since the previous sync and deletes records of
+    removed objects. With full=True all records are pushed, replacing everything
+    in the index.
+    """
+    # Changes made during the sync request a new one.
+    requested = SharedState.objects.get_value(SYNC_REQUESTED_KEY)
+    SharedState.objects.set_value(SYNC_REQUESTED_KEY, None)
+    try:
+        return _sync(index, full)
+    except Exception:
+        if requested is not None:
+            SharedState.objects.set_value(SYNC_REQUESTED_KEY, requested)
+        raise
+
+
+def _sync(index: SearchIndex, full: bool) -> SyncResult:
+    sources = search.build_record_sources()
+    hashes: Dict[str, str] = {}
+    records: Dict[str, Dict] = {}
+    if not full:
+        for object_id, content_hash, data in SearchRecord.objects.values_list(
+            "object_id", "content_hash", "data"
+        ):
+            hashes[object_id] = content_hash
+            records[object_id] = data
+    changed = []
+    for source in sources:
+        content_hash = record_hash(source)
+        if hashes.get(source["objectID"]) != content_hash:
+            record = search.add_lacinka(source)
+            records[source["objectID"]] = record
+            changed.append(
+                SearchRecord(
+                    object_id=source["objectID"],
+                    content_hash=content_hash,
+                    data=record,
+                )
+            )
+    deleted = list(hashes.keys() - {source["objectID"] for source in sources})
+
+    if full:
+        index.replace_all_objects([record.data for record in changed]).wait()
+    else:
+        if changed:
+            index.partial_update_objects(
+                [record.data for record in changed], {"createIfNotExists": True}
+            ).wait()
+        if deleted:
+            index.delete_objects(deleted).wait()
+
+    with transaction.atomic():
+        if full:
+            SearchRecord.objects.all().delete()
+        SearchRecord.objects.filter(object_id__in=deleted).delete()
+        SearchRecord.objects.bulk_create(
+            changed,
+            update_conflicts=True,
+            unique_fields=["object_id"],
+            update_fields=["content_hash", "data"],
+        )
+
+    if (
+        changed
+        or deleted
+        or SharedState.objects.get_value(search.LOCAL_INDEX_VERSION_KEY) is None
+    ):
+        search.save_local_index([records[source["objectID"]] for source in sources])
+    return SyncResult(updated=len(changed), deleted=len(deleted))
+
+
+def request_sync() -> None:
+    """Requests sync by the next sync_search_changes job."""
+    if SharedState.objects.get_value(SYNC_REQUESTED_KEY) is None:
+        SharedState.objects.set_value(SYNC_REQUESTED_KEY, timezone.now().isoformat())
+
+
+def is_sync_requested() -> bool:
+    """Returns whether models shown in search changed since the previous sync."""
+    return SharedState.objects.get_value(SYNC_REQUESTED_KEY) is not None
@@ -0,0 +1,299 @@
+"""
+Signal handlers that keep denormalized data in sync with models. Connected in
+BooksConfig.ready().
+"""
+
+from typing import Optional
+
+from django.db import transaction
+from django.db.models import Q, QuerySet
+from django.db.models.signals import (
+    m2m_changed,
+    post_delete,
+    post_save,
+    pre_delete,
+    pre_save,
+)
+from django.dispatch import receiver
+
+from books import derived_tags, page_cache, search_sync
+from books.models import (
+    Book,
+    BookFacet,
+    Link,
+    LinkType,
+    Narration,
+    Person,
+    Publisher,
+    Tag,
+)
+
+
+def _deleted_as_part_of(origin, model) -> bool:
+    """Whether object deletion was triggered by deleting objects of the given model."""
+    if isinstance(origin, QuerySet):
+        return origin.model is model
+    return isinstance(origin, model)
+
+
+@receiver(post_delete, sender=Narration)
+def update_book_on_narration_delete(sender, instance: Narration, origin, **kwargs):
+    """Latest narration date and facets of the book might change when its narration is deleted."""
+    if _deleted_as_part_of(origin, Book):
+        return
+    Book.objects.update_latest_narration_date([instance.book_id])
+    BookFacet.objects.rebuild([instance.book_id])
+
+
+@receiver(pre_save, sender=Link)
+def remember_previous_link_book(sender, instance: Link, raw=False, **kwargs):
+    """
+    Link might be moved to another narration in admin. Its previous book is
+    remembered so that facets of both books are rebuilt on save.
+    """
+    instance.previous_book_id = None
+    if not raw and not instance._state.adding:
+        instance.previous_book_id = (
+            Link.objects.filter(uuid=instance.uuid)
+            .values_list("narration__book_id", flat=True)
+            .first()
+        )
+
+
+@receiver(post_save, sender=Link)
+def update_facets_on_link_save(sender, instance: Link, **kwargs):
+    book_ids = {getattr(instance, "previous_book_id", None)}
+    if instance.narration_id is not None:
+        book_ids.update(
+            Narration.objects.filter(uuid=instance.narration_id).values_list(
+                "book_id", flat=True
+            )
+        )
+    book_ids.discard(None)
+    if book_ids:
+        BookFacet.objects.rebuild(book_ids)
+
+
+@receiver(post_delete, sender=Link)
+def update_facets_on_link_delete(sender, instance: Link, origin, **kwargs):
+    # When whole narration or book is deleted - their own handlers update facets.
+    if instance.narration_id is None or not _deleted_as_part_of(origin, Link):
+        return
+    BookFacet.objects.rebuild(
+        Narration.objects.filter(uuid=instance.narration_id).values("book_id")
+    )
+
+
+@receiver(post_save, sender=LinkType)
+def update_facets_on_link_type_save(sender, instance: LinkType, **kwargs):
+    """Link facets use link type name, which might have been changed."""
+    BookFacet.objects.rebuild(
+        Narration.objects.filter(links__url_type=instance).values("book_id")
+    )
+
+
+@receiver(post_delete, sender=LinkType)
+def update_facets_on_link_type_delete(sender, instance: LinkType, **kwargs):
+    BookFacet.objects.filter(name=BookFacet.for_link_type(instance.name)).delete()
+
+
+@receiver(post_delete, sender=Tag)
+def update_facets_on_tag_delete(sender, instance: Tag, **kwargs):
+    BookFacet.objects.filter(name=BookFacet.for_tag(instance.id)).delete()
+
+
+@receiver(m2m_changed, sender=Book.tag.through)
+def update_facets_on_book_tags_change(
+    sender, instance, action: str, reverse: bool, pk_set, **kwargs
+):
+    """
+    Tag facets are updated directly, without rebuilding all facets of the books, as
+    tags are often changed in bulk, for example by update_derived_tags job.
+    """
+    # When reverse is True the instance is a Tag and pk_set contains books.
+    if reverse:
+        facets = BookFacet.objects.filter(name=BookFacet.for_tag(instance.id))
+        if pk_set is not None:
+            facets = facets.filter(book_id__in=pk_set)
+        new_facets = [
+            BookFacet(book_id=book_id, name=BookFacet.for_tag(instance.id))
+            for book_id in pk_set or []
+        ]
+    else:
+        facets = BookFacet.objects.filter(book=instance, name__startswith="tag:")
+        if pk_set is not None:
+            facets = facets.filter(name__in=[BookFacet.for_tag(id) for id in pk_set])
+        new_facets = [
+            BookFacet(book=instance, name=BookFacet.for_tag(tag_id))
+            for tag_id in pk_set or []
+        ]
+
+    if action == "post_add":
+        BookFacet.objects.bulk_create(new_facets, ignore_conflicts=True)
+    elif action in ("post_remove", "post_clear"):
+        facets.delete()
+
+
+def _book_people_and_publishers(book_id) -> list[str]:
+    """
+    Person and publisher pages list only active books and depend only on books
+    they show, so they have to be invalidated when a book of them changes status.
+    The same goes for changes of narrations and links, which decide where and
+    whether a book is shown in filtered listings of these pages.
+    """
+    people = Person.objects.filter(
+        Q(books_authored=book_id)
+        | Q(narrations__book=book_id)
+        | Q(narrations_translated__book=book_id)
+    ).values_list("uuid", flat=True)
+    publishers = Publisher.objects.filter(narrations__book=book_id).values_list(
+        "uuid", flat=True
+    )
+    return [page_cache.for_person(id) for id in people.distinct()] + [
+        page_cache.for_publisher(id) for id in publishers.distinct()
+    ]
+
+
+def _page_cache_dependencies(obj) -> list[str]:
+    """Dependencies of cached pages that show the given object."""
+    if isinstance(obj, Book):
+        return [
+            page_cache.CATALOG,
+            page_cache.for_book(obj.uuid),
+            *_book_people_and_publishers(obj.uuid),
+        ]
+    if isinstance(obj, Narration):
+        return [
+            page_cache.CATALOG,
+            page_cache.for_book(obj.book_id),
+            *_book_people_and_publishers(obj.book_id),
+        ]
+    if isinstance(obj, Person):
+        return [page_cache.CATALOG, page_cache.for_person(obj.uuid)]
+    if isinstance(obj, Tag):
+        return [page_cache.CATALOG, page_cache.for_tag(obj.id)]
+    if isinstance(obj, Publisher):
+        return [page_cache.for_publisher(obj.uuid)]
+    if isinstance(obj, Link):
+        dependencies = [page_cache.CATALOG]
+        for book_id in Narration.objects.filter(uuid=obj.narration_id).values_list(
+            "book_id", flat=True
+        ):
+            dependencies.append(page_cache.for_book(book_id))
+            dependencies.extend(_book_people_and_publishers(book_id))
+        return dependencies
+    if isinstance(obj, LinkType):
+        return [page_cache.CATALOG, page_cache.LINK_TYPES]
+    return []
+
+
+@receiver(post_save, sender=Book)
+@receiver(post_delete, sender=Book)
+@receiver(post_save, sender=Narration)
+@receiver(post_delete, sender=Narration)
+@receiver(post_save, sender=Person)
+@receiver(post_delete, sender=Person)
+@receiver(post_save, sender=Publisher)
+@receiver(post_delete, sender=Publisher)
+@receiver(post_save, sender=Tag)
+@receiver(post_delete, sender=Tag)
+@receiver(post_save, sender=Link)
+@receiver(post_delete, sender=Link)
+@receiver(post_save, sender=LinkType)
+@receiver(post_delete, sender=LinkType)
+# People and publishers of a deleted narration or link are found only before
+# its relations are deleted.
+@receiver(pre_delete, sender=Narration)
+@receiver(pre_delete, sender=Link)
+def invalidate_pages_on_change(sender, instance, **kwargs):
+    page_cache.invalidate(*_page_cache_dependencies(instance))
+
+
+@receiver(m2m_changed, sender=Book.authors.through)
+@receiver(m2m_changed, sender=Book.tag.through)
+@receiver(m2m_changed, sender=Narration.narrators.through)
+@receiver(m2m_changed, sender=Narration.translators.through)
+@receiver(m2m_changed, sender=Narration.publishers.through)
+def invalidate_pages_on_relation_change(
+    sender, instance, action: str, model, pk_set, **kwargs
+):
+    """
+    Pages that showed the relation depend on both sides of it, so it's enough to
+    invalidate the instance on removal. Added objects are invalidated as well as
+    their pages don't depend on the instance yet.
+    """
+    if not action.startswith("post_"):
+        return
+    dependencies = set(_page_cache_dependencies(instance))
+    if pk_set:
+        for obj in model.objects.filter(pk__in=pk_set):
+            dependencies.update(_page_cache_dependencies(obj))
+    page_cache.invalidate(*dependencies)
+
+
+@receiver(post_save, sender=Book)
+@receiver(post_delete, sender=Book)
+@receiver(post_save, sender=Narration)
+@receiver(post_delete, sender=Narration)
+@receiver(post_save, sender=Person)
+@receiver(post_delete, sender=Person)
+@receiver(post_save, sender=Publisher)
+@receiver(post_delete, sender=Publisher)
+@receiver(m2m_changed, sender=Book.authors.through)
+@receiver(m2m_changed, sender=Narration.narrators.through)
+@receiver(m2m_changed, sender=Narration.translators.through)
+@receiver(m2m_changed, sender=Narration.publishers.through)
+def sync_search_on_change(sender, action: Optional[str] = None, **kwargs):
+    """Search records are synced by a job, see books/search_sync.py."""
+    # m2m_changed is sent both before and after the change.
+    if action is not None and not action.startswith("post_"):
+        return
+    transaction.on_commit(search_sync.request_sync)
+
+
+@receiver(post_save, sender=Narration)
+@receiver(post_delete, sender=Narration)
+def update_derived_tags_on_narration_change(
+    sender, instance: Narration, origin=None, **kwargs
+):
+    if _deleted_as_part_of(origin, Book):
+        return
+    derived_tags.request_update([instance.book_id])
+
+
+@receiver(post_save, sender=Link)
+@receiver(post_delete, sender=Link)
+def update_derived_tags_on_link_change(sender, instance: Link, origin=None, **kwargs):
+    if instance.narration_id is None or (
+        origin is not None and not _deleted_as_part_of(origin, Link)
+    ):
+        return
+    derived_tags.request_update(
+        Narration.objects.filter(uuid=instance.narration_id).values_list(
+            "book_id", flat=True
+        )
+    )
+
+
+@receiver(m2m_changed, sender=Book.authors.through)
+@receiver(m2m_changed, sender=Narration.narrators.through)
+def update_derived_tags_on_people_change(
+    sender, instance, action: str, reverse: bool, pk_set, **kwargs
+):
+    """
+    When people of a book are changed from the person side, pk_set contains
+    books or narrations. Clearing all books of a person is left to the daily job.
+    """
+    if not action.startswith("post_"):
+        return
+    if not reverse:
+        book_ids = [
+            instance.book_id if isinstance(instance, Narration) else instance.pk
+        ]
+    elif sender is Book.authors.through:
+        book_ids = pk_set or []
+    else:
+        book_ids = Narration.objects.filter(uuid__in=pk_set or []).values_list(
+            "book_id", flat=True
+        )
+    derived_tags.request_update(book_ids)
@@ -0,0 +1,269 @@
+"""
+Sitemap of the site in XML format, served at /sitemap.xml.
+
+https://developers.google.com/search/docs/crawling-indexing/sitemaps/build-sitemap
+
+/sitemap.xml is a sitemap index that lists sitemap shards of up to SHARD_SIZE
+pages each, served at /sitemap-<n>.xml. Pages of books, people, publishers and
+tags have lastmod set to the date of their latest narration. Only people and
+publishers that have active books are included.
+
+Sitemaps contain absolute URLs, so they are generated for each base URL the site
+is served on, as the daily generate_sitemap job doesn't run on the public host.
+Files are generated by the job and stored in storage, requests only stream them.
+A base URL requested for the first time is recorded and its sitemap is generated
+once by that request, see generate_first(). Only one request generates it at a
+time, concurrent ones get 503 for the few seconds it takes. Like data.json, each
+generation writes files with new names and then switches the current version in
+SharedState, see books/data_export.py. If the current version is missing there,
+the latest complete version is found in storage.
+"""
+
+from collections import defaultdict
+from dataclasses import asdict, dataclass
+from datetime import date
+import hashlib
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+import uuid
+from xml.sax.saxutils import escape
+
+from django.core.cache import cache
+from django.core.files.storage import default_storage
+from django.db.models import Max
+from django.urls import reverse
+from django.utils import timezone
+
+from books.models import (
+    Book,
+    BookStatus,
+    Narration,
+    Person,
+    Publisher,
+    SharedState,
+    Tag,
+)
+from books.views.articles import ARTICLES
+
+FILE_PREFIX = "sitemap-"
+BASE_URLS_KEY = "sitemap:base-urls"
+# Maximum time a request generates the first sitemap of a base URL, concurrent
+# requests don't generate it meanwhile.
+GENERATING_LOCK_TIMEOUT_SEC = 5 * 60
+# Protocol allows up to 50000 URLs per sitemap.
+SHARD_SIZE = 10000
+
+# Path and date of the last modification, if known.
+Entry = Tuple[str, Optional[date]]
+
+
+@dataclass
+class SitemapVersion:
+    version: str
+    shards: int
+
+
+def _key(base_url: str) -> str:
+    return hashlib.sha256(base_url.encode("utf-8")).hexdigest()[:8]
+
+
+def _current_key(base_url: str) -> str:
+    return f"sitemap:current:{_key(base_url)}"
+
+
+def _file_prefix(base_url: str) -> str:
+    return f"{FILE_PREFIX}{_key(base_url)}-"
+
+
+def file_name(base_url: str, version: str, shard: Optional[int] = None) -> str:
+    """Name of the index file, or of the shard file if shard is given."""
+    suffix = "index" if shard is None else str(shard)
+    return f"{_file_prefix(base_url)}{version}-{suffix}.xml"
+
+
+def _entries() -> Iterator[Entry]:
+    active = BookStatus.ACTIVE
+    for path in ["/", "/about", "/catalog", "/articles"]:
+        yield path, None
+    for article in ARTICLES:
+        yield reverse("single-article", args=(article.slug,)), None
+
+    for slug, latest_narration_date in (
+        Book.objects.filter(status=active)
+        .order_by("-latest_narration_date", "-uuid")
+        .values_list("slug", "latest_narration_date")
+    ):
+        yield reverse("book-detail-page", args=(slug,)), latest_narration_date
+
+    # Latest narration date of active books of each person in any role.
+    people_dates: Dict[uuid.UUID, Optional[date]] = {}
+    for person_id, lastmod in [
+        *Book.authors.through.objects.filter(book__status=active)
+        .values("person_id")
+        .annotate(lastmod=Max("book__latest_narration_date"))
+        .values_list("person_id", "lastmod"),
+        *Narration.narrators.through.objects.filter(narration__book__status=active)
+        .values("person_id")
+        .annotate(lastmod=Max("narration__date"))
+        .values_list("person_id", "lastmod"),
+        *Narration.translators.through.objects.filter(narration__book__status=active)
+        .values("person_id")
+        .annotate(lastmod=Max("narration__date"))
+        .values_list("person_id", "lastmod"),
+    ]:
+        people_dates[person_id] = max(
+            filter(None, [people_dates.get(person_id), lastmod]), default=None
+        )
+    for person_id, slug in Person.objects.filter(
+        uuid__in=people_dates.keys()
+    ).values_list("uuid", "slug"):
+        yield reverse("person-detail-page", args=(slug,)), people_dates[person_id]
+
+    tag_dates = dict(
+        Book.tag.through.objects.filter(book__status=active)
+        .values("tag_id")
+        .annotate(lastmod=Max("book__latest_narration_date"))
+        .values_list("tag_id", "lastmod")
+    )
+    for tag_id, slug in Tag.objects.values_list("id", "slug"):
+        yield reverse("catalog-for-tag", args=(slug,)), tag_dates.get(tag_id)
+
+    publisher_dates = dict(
+        Narration.publishers.through.objects.filter(narration__book__status=active)
+        .values("publisher_id")
+        .annotate(lastmod=Max("narration__date"))
+        .values_list("publisher_id", "lastmod")
+    )
+    for publisher_id, slug in Publisher.objects.filter(
+        uuid__in=publisher_dates.keys()
+    ).values_list("uuid", "slug"):
+        yield reverse("publisher-detail-page", args=(slug,)), publisher_dates[
+            publisher_id
+        ]
+
+
+def _url_element(tag: str, url: str, lastmod: Optional[date]) -> str:
+    lastmod_element = f"<lastmod>{lastmod.isoformat()}</lastmod>" if lastmod else ""
+    return f"<{tag}><loc>{escape(url)}</loc>{lastmod_element}</{tag}>\n"
+
+
+def _write(name: str, root: str, elements: Iterable[str]) -> None:
+    with default_storage.open(name, "wb") as f:
+        f.write(
+            '<?xml version="1.0" encoding="UTF-8"?>\n'
+            f'<{root} xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">\n'.encode(
+                "utf-8"
+            )
+        )
+        for element in elements:
+            f.write(element.encode("utf-8"))
+        f.write(f"</{root}>\n".encode("utf-8"))
+
+
+def _delete_old_files(base_url: str, keep: List[SitemapVersion]) -> None:
+    # Files of the previous version are kept for requests that are reading them.
+    prefix = _file_prefix(base_url)
+    oldest_kept = min(sitemap.version for sitemap in keep)
+    for name in default_storage.listdir("")[1]:
+        if name.startswith(prefix) and name.removeprefix(prefix) < oldest_kept:
+            default_storage.delete(name)
+
+
+def generate(base_urls: Iterable[str]) -> None:
+    """Generates sitemaps for the given base URLs, like "https://audiobooks.by"."""
+    base_urls = list(base_urls)
+    if not base_urls:
+        return
+    entries = list(_entries())
+    shards = [entries[i : i + SHARD_SIZE] for i in range(0, len(entries), SHARD_SIZE)]
+    for base_url in base_urls:
+        previous = get_current(base_url)
+        # Versions sort in order of generation, see _delete_old_files().
+        version = f"{timezone.now():%Y%m%d%H%M%S%f}-{uuid.uuid4().hex[:8]}"
+        for shard_index, shard in enumerate(shards):
+            _write(
+                file_name(base_url, version, shard_index),
+                "urlset",
+                (
+                    _url_element("url", base_url + path, lastmod)
+                    for path, lastmod in shard
+                ),
+            )
+        _write(
+            file_name(base_url, version),
+            "sitemapindex",
+            (
+                _url_element(
+                    "sitemap",
+                    f"{base_url}/sitemap-{shard_index}.xml",
+                    max(filter(None, (lastmod for _, lastmod in shard)), default=None),
+                )
+                for shard_index, shard in enumerate(shards)
+            ),
+        )
+        sitemap = SitemapVersion(version=version, shards=len(shards))
+        SharedState.objects.set_value(_current_key(base_url), asdict(sitemap))
+        _delete_old_files(base_url, [sitemap] + ([previous] if previous else []))
+
+
+def _find_latest(base_url: str) -> Optional[SitemapVersion]:
+    """
+    Returns the latest version of the base URL in storage. The index file is
+    written after all shards, so only versions that have it are complete.
+    """
+    prefix = _file_prefix(base_url)
+    shards: Dict[str, int] = defaultdict(int)
+    complete = []
+    for name in default_storage.listdir("")[1]:
+        if not name.startswith(prefix) or not name.endswith(".xml"):
+            continue
+        version, suffix = name[len(prefix) : -len(".xml")].rsplit("-", 1)
+        if suffix == "index":
+            complete.append(version)
+        else:
+            shards[version] += 1
+    if not complete:
+        return None
+    latest = max(complete)
+    return SitemapVersion(version=latest, shards=shards[latest])
+
+
+def get_current(base_url: str) -> Optional[SitemapVersion]:
+    """Returns current sitemap of the base URL, None if it wasn't generated yet."""
+    current = SharedState.objects.get_value(_current_key(base_url))
+    if current is not None:
+        return SitemapVersion(**current)
+    latest = _find_latest(base_url)
+    if latest is not None:
+        SharedState.objects.set_value(_current_key(base_url), asdict(latest))
+    return latest
+
+
+def add_base_url(base_url: str) -> None:
+    """Adds the base URL to the ones generated by generate_all()."""
+    base_urls = SharedState.objects.get_value(BASE_URLS_KEY, [])
+    if base_url not in base_urls:
+        SharedState.objects.set_value(BASE_URLS_KEY, base_urls + [base_url])
+
+
+def generate_first(base_url: str) -> Optional[SitemapVersion]:
+    """
+    Generates the first sitemap of the base URL and adds it to the ones generated
+    by generate_all(). Returns None if another request is generating it.
+    """
+    add_base_url(base_url)
+    lock_key = f"sitemap:generating:{_key(base_url)}"
+    if not cache.add(lock_key, True, timeout=GENERATING_LOCK_TIMEOUT_SEC):
+        return None
+    try:
+        current = get_current(base_url)
+        if current is None:
+            generate([base_url])
+            current = get_current(base_url)
+        return current
+    finally:
+        cache.delete(lock_key)
+
+
+def generate_all() -> None:
+    """Regenerates sitemaps of all base URLs that were requested before."""
+    generate(SharedState.objects.get_value(BASE_URLS_KEY, []))
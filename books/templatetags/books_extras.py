@@ -7,9 +7,8 @@ from datetime import datetime
 from django.utils import html
 from django.utils.translation import get_language
 from django.utils.translation import gettext as _
-import belorthography
 
-from books import models, image_cache
+from books import models, image_cache, lacinka
 from books.constants import MONTHS
 
 register = template.Library()
@@ -97,9 +96,9 @@ COVER_PATTERNS = [
 
 
 @register.filter
-def colors(narration: models.Narration, ind=0) -> str:
-    """Returns random cover template for a narration that has no cover."""
-    return COVER_PATTERNS[(narration.book.uuid.int + ind) % len(COVER_PATTERNS)]
+def colors(book: models.Book, ind=0) -> str:
+    """Returns random cover template for a narration of the book that has no cover."""
+    return COVER_PATTERNS[(book.uuid.int + ind) % len(COVER_PATTERNS)]
 
 
 @register.filter
@@ -176,21 +175,24 @@ def cover_offset(ind: int) -> int:
 
 
 @register.filter
-def overlapping_cover_scale(book: models.Book) -> float:
+def overlapping_cover_scale(covers_count: int) -> float:
     """Returns scale of a cover that should be used when displaying preview with multiple narrations.
 
     When there are multiple narrations - we show them overlapped and but they need to fit 150x150px box.
     Thus we need to scale them down.
     """
-    return 1 - (book.narrations.count() - 1) * OVERLAP_COVER_OFFSET / 150
+    return 1 - (covers_count - 1) * OVERLAP_COVER_OFFSET / 150
 
 
 @register.simple_tag
-def dtranslate(text: str):
+def dtranslate(text: str, text_lac: str = ""):
+    """
+    Converts text to łacinka when the page is rendered in łacinka. Long texts should
+    be passed with their stored łacinka version, like book.description_lac, so that
+    they are not converted on each render.
+    """
     if get_language() == "be-latn":
-        return belorthography.convert(
-            text, belorthography.Orthography.OFFICIAL, belorthography.Orthography.LATIN
-        )
+        return text_lac or lacinka.convert(text)
     else:
         return text
 
@@ -0,0 +1,53 @@
+"""
+Maximum number of SQL queries each view may make, and a test case to enforce
+them. Numbers are for the data created by query budget tests. When a change
+makes a view exceed its budget, either fix the extra queries or raise the
+budget deliberately.
+"""
+
+from django.http import HttpResponse
+from django.test import TestCase, override_settings
+from django.urls import resolve
+
+from books import query_stats
+
+# Keys are view names as reported by query_stats command.
+QUERY_BUDGETS = {
+    "index": 5,
+    "catalog-all-books": 7,
+    "catalog-for-tag": 7,
+    "book-detail-page": 8,
+    "person-detail-page": 6,
+    "publisher-detail-page": 5,
+    "releases/<int:year>": 3,
+    "releases/<int:year>/<int:month>": 3,
+    "about": 1,
+    "single-article": 0,
+    "stats/birthdays": 10,
+    "stats/digest": 4,
+    # Sitemaps are generated by a job and only streamed from storage.
+    "sitemap.xml": 0,
+    "sitemap-<int:shard>.xml": 0,
+}
+
+
+# Local cache so that queries of the DB cache are not counted.
+@override_settings(
+    CACHES={"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}}
+)
+class QueryBudgetTestCase(TestCase):
+    """Test case that checks number of queries views make against their budgets."""
+
+    def assertWithinQueryBudget(self, url: str) -> HttpResponse:
+        view = query_stats.view_name(resolve(url.split("?")[0]))
+        self.assertIn(view, QUERY_BUDGETS, f"No query budget for {view}")
+        with query_stats.collect() as stats:
+            response = self.client.get(url)
+        self.assertEqual(200, response.status_code, url)
+        self.assertLessEqual(
+            stats.queries,
+            QUERY_BUDGETS[view],
+            f"{url} made {stats.queries} queries, budget of {view} is "
+            f"{QUERY_BUDGETS[view]}",
+        )
+        return response
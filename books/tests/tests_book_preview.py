@@ -0,0 +1,84 @@
+from datetime import date, timedelta
+
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+
+from books import models
+from books.tests.fake_data import FakeData
+
+
+# Local cache so that cache queries are not counted.
+@override_settings(
+    CACHES={"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}}
+)
+class BookPreviewQueriesTests(TestCase):
+    """
+    Tests that pages showing book previews make the same number of queries
+    regardless of number of books shown.
+    """
+
+    def setUp(self):
+        super().setUp()
+        self.fake_data = FakeData()
+        self.books_count = 0
+
+    def tearDown(self):
+        super().tearDown()
+        self.fake_data.cleanup()
+
+    def add_books(self, count: int):
+        """Adds books with multiple authors and narrations, some with covers."""
+        for _ in range(count):
+            self.books_count += 1
+            book = self.fake_data.create_book_with_single_narration(
+                title=f"Кніга {self.books_count}",
+                date=date(2023, 1, 1) + timedelta(days=self.books_count),
+                authors=[
+                    self.fake_data.person_ales,
+                    self.fake_data.person_bela,
+                    self.fake_data.person_viktar,
+                ],
+                narrators=[self.fake_data.person_volha],
+                publishers=[self.fake_data.publisher_audiobooksby],
+            )
+            models.Narration.objects.create(
+                book=book,
+                language=models.Language.RUSSIAN,
+                date=date(2023, 1, 2) + timedelta(days=self.books_count),
+                cover_image=self.fake_data.create_image(),
+            ).narrators.set([self.fake_data.person_volha])
+
+    def count_queries(self, url: str) -> int:
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(url)
+        self.assertEqual(200, response.status_code)
+        return len(context.captured_queries)
+
+    def assertQueriesDontDependOnBooks(self, url: str):
+        self.add_books(2)
+        queries = self.count_queries(url)
+        self.add_books(4)
+        self.assertEqual(queries, self.count_queries(url), url)
+
+    def test_catalog(self):
+        self.assertQueriesDontDependOnBooks("/catalog")
+
+    def test_index(self):
+        self.assertQueriesDontDependOnBooks("/")
+
+    def test_releases(self):
+        self.assertQueriesDontDependOnBooks("/releases/2023")
+
+    def test_person(self):
+        self.assertQueriesDontDependOnBooks(
+            f"/person/{self.fake_data.person_ales.slug}"
+        )
+        self.assertQueriesDontDependOnBooks(
+            f"/person/{self.fake_data.person_volha.slug}"
+        )
+
+    def test_publisher(self):
+        self.assertQueriesDontDependOnBooks(
+            f"/publisher/{self.fake_data.publisher_audiobooksby.slug}"
+        )
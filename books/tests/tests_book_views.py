@@ -0,0 +1,208 @@
+from datetime import date, timedelta
+
+from bs4 import BeautifulSoup
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+
+from books import models
+from books.views import catalog
+from books.tests.fake_data import FakeData
+
+
+# Local cache so that cache queries are not counted.
+@override_settings(
+    CACHES={"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}}
+)
+class BookDetailViewTests(TestCase):
+    """Tests for the book page that don't need a browser."""
+
+    def setUp(self):
+        super().setUp()
+        self.fake_data = FakeData()
+        self.book = self.fake_data.create_book_with_single_narration(
+            title="Кніга",
+            authors=[self.fake_data.person_ales],
+            narrators=[self.fake_data.person_bela],
+            translators=[self.fake_data.person_viktar],
+            publishers=[self.fake_data.publisher_audiobooksby],
+            tags=[self.fake_data.tag_classics],
+            link_types=[self.fake_data.link_type_kobo],
+        )
+
+    def tearDown(self):
+        super().tearDown()
+        self.fake_data.cleanup()
+
+    def add_narration(self, language: models.Language) -> models.Narration:
+        narration = models.Narration.objects.create(
+            book=self.book, language=language, date=date(2023, 1, 1)
+        )
+        narration.narrators.set([self.fake_data.person_volha])
+        narration.translators.set([self.fake_data.person_viktar])
+        narration.publishers.set([self.fake_data.publisher_audiobooksby])
+        for link_type in [
+            self.fake_data.link_type_kobo,
+            self.fake_data.link_type_knizhny_voz,
+        ]:
+            narration.links.add(self.fake_data.create_link(link_type, self.book))
+        return narration
+
+    def get_page(self) -> BeautifulSoup:
+        response = self.client.get(f"/books/{self.book.slug}")
+        self.assertEqual(200, response.status_code)
+        return BeautifulSoup(response.content, "html.parser")
+
+    def count_queries(self) -> int:
+        with CaptureQueriesContext(connection) as context:
+            self.get_page()
+        return len(context.captured_queries)
+
+    def test_number_of_queries_does_not_depend_on_narrations(self):
+        self.add_narration(models.Language.BELARUSIAN)
+        queries = self.count_queries()
+        self.add_narration(models.Language.RUSSIAN)
+        self.add_narration(models.Language.RUSSIAN)
+        self.assertEqual(queries, self.count_queries())
+
+    def test_og_image_is_original_cover(self):
+        narration = self.book.narrations.get()
+        narration.cover_image = "covers/cover.jpg"
+        narration.save()
+        og_image = self.get_page().find("meta", property="og:image")
+        self.assertEqual(narration.cover_image.url, og_image["content"])
+
+    def test_links_ordered_by_weight(self):
+        self.fake_data.link_type_kobo.weight = 1
+        self.fake_data.link_type_kobo.save()
+        self.fake_data.link_type_knizhny_voz.weight = 2
+        self.fake_data.link_type_knizhny_voz.save()
+        narration = self.add_narration(models.Language.RUSSIAN)
+
+        section = self.get_page().select_one(f'[data-narration-id="{narration.uuid}"]')
+        self.assertEqual(
+            ["Кніжны Воз", "Kobo"],
+            [img["alt"] for img in section.select("img.link-icon")],
+        )
+
+        self.fake_data.link_type_knizhny_voz.disabled = True
+        self.fake_data.link_type_knizhny_voz.save()
+        section = self.get_page().select_one(f'[data-narration-id="{narration.uuid}"]')
+        self.assertEqual(
+            ["Kobo"], [img["alt"] for img in section.select("img.link-icon")]
+        )
+
+
+class PersonDetailViewTests(TestCase):
+    """Tests for the person page that don't need a browser."""
+
+    def setUp(self):
+        super().setUp()
+        self.fake_data = FakeData()
+
+    def tearDown(self):
+        super().tearDown()
+        self.fake_data.cleanup()
+
+    def get_sections(self, person: models.Person) -> dict[str, list[str]]:
+        """Returns sorted book titles in each section of the person page."""
+        response = self.client.get(f"/person/{person.slug}")
+        self.assertEqual(200, response.status_code)
+        page = BeautifulSoup(response.content, "html.parser")
+        return {
+            section["data-test"]: sorted(
+                link.get_text(strip=True)
+                for link in section.select("[data-test='book-title']")
+            )
+            for section in page.select("[data-test^='books-']")
+        }
+
+    def test_books_split_by_role(self):
+        person = self.fake_data.person_ales
+        self.fake_data.create_book_with_single_narration(
+            title="Напісаная", authors=[person]
+        )
+        self.fake_data.create_book_with_single_narration(
+            title="Агучаная і перакладзеная",
+            narrators=[person],
+            translators=[person],
+        )
+        narration = models.Narration.objects.create(
+            book=self.fake_data.create_book_with_single_narration(
+                title="Напісаная і агучаная", authors=[person]
+            ),
+            language=models.Language.RUSSIAN,
+            date=date(2023, 1, 1),
+        )
+        narration.narrators.set([person])
+
+        self.assertEqual(
+            {
+                "books-authored": ["Напісаная", "Напісаная і агучаная"],
+                "books-translated": ["Агучаная і перакладзеная"],
+                "books-narrated": ["Агучаная і перакладзеная", "Напісаная і агучаная"],
+            },
+            self.get_sections(person),
+        )
+
+
+class PublisherDetailViewTests(TestCase):
+    """Tests for the publisher page that don't need a browser."""
+
+    def setUp(self):
+        super().setUp()
+        self.fake_data = FakeData()
+        self.publisher = self.fake_data.publisher_audiobooksby
+
+    def tearDown(self):
+        super().tearDown()
+        self.fake_data.cleanup()
+
+    def add_books(self, count: int, **kwargs) -> list[models.Book]:
+        return [
+            self.fake_data.create_book_with_single_narration(
+                title=f"Кніга {i}",
+                publishers=[self.publisher],
+                date=date(2023, 1, 1) + timedelta(days=i),
+                **kwargs,
+            )
+            for i in range(count)
+        ]
+
+    def get_titles(self, query: str = "") -> list[str]:
+        response = self.client.get(f"/publisher/{self.publisher.slug}{query}")
+        self.assertEqual(200, response.status_code)
+        page = BeautifulSoup(response.content, "html.parser")
+        return [
+            link.get_text(strip=True)
+            for link in page.select("[data-test='book-title']")
+        ]
+
+    def test_paginated(self):
+        self.add_books(catalog.BOOKS_PER_PAGE + 1)
+        first_page = self.get_titles()
+        self.assertEqual(catalog.BOOKS_PER_PAGE, len(first_page))
+        self.assertEqual(f"Кніга {catalog.BOOKS_PER_PAGE}", first_page[0])
+        self.assertEqual(["Кніга 0"], self.get_titles("?page=2"))
+
+    def test_hidden_books_not_shown(self):
+        hidden, _ = self.add_books(2)
+        hidden.status = models.BookStatus.HIDDEN
+        hidden.save()
+        self.assertEqual(["Кніга 1"], self.get_titles())
+
+    def test_filters(self):
+        self.fake_data.create_book_with_single_narration(
+            title="Па-руску",
+            publishers=[self.publisher],
+            language=models.Language.RUSSIAN,
+        )
+        self.fake_data.create_book_with_single_narration(
+            title="Платная",
+            publishers=[self.publisher],
+            paid=True,
+            link_types=[self.fake_data.link_type_kobo],
+        )
+        self.assertEqual(["Па-руску"], self.get_titles("?lang=russian"))
+        self.assertEqual(["Платная"], self.get_titles("?paid=true&links=kobo"))
+        self.assertEqual([], self.get_titles("?lang=russian&paid=true"))
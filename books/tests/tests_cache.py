@@ -0,0 +1,92 @@
+from unittest.mock import patch
+
+from django.core.cache import caches
+from django.test import TestCase
+
+from books import data_export, image_cache, page_cache
+from books.cache import TieredCache
+from books.tests.fake_data import FakeData
+
+
+class TieredCacheTests(TestCase):
+    """Tests cache backend that keeps local cache in front of the DB cache."""
+
+    def setUp(self):
+        super().setUp()
+        caches["shared"].clear()
+        # Two caches with separate local tiers emulate two app instances.
+        self.first_instance = self.create_cache("first")
+        self.second_instance = self.create_cache("second")
+
+    def tearDown(self):
+        super().tearDown()
+        self.first_instance.clear()
+        self.second_instance.clear()
+
+    def create_cache(self, location: str) -> TieredCache:
+        return TieredCache(
+            location, {"OPTIONS": {"SHARED_CACHE": "shared", "LOCAL_TIMEOUT": 30}}
+        )
+
+    def test_entries_are_shared(self):
+        self.first_instance.set("key", "value")
+        self.assertEqual("value", self.second_instance.get("key"))
+        self.assertEqual(
+            {"key": "value"}, self.second_instance.get_many(["key", "missing"])
+        )
+        self.assertIsNone(self.second_instance.get("missing"))
+
+    def test_local_tier_serves_without_shared_cache(self):
+        self.first_instance.set("key", "value")
+        with self.assertNumQueries(0):
+            self.assertEqual("value", self.first_instance.get("key"))
+        self.second_instance.get("key")
+        with self.assertNumQueries(0):
+            self.assertEqual("value", self.second_instance.get("key"))
+
+    def test_add_and_incr_use_shared_cache(self):
+        self.assertTrue(self.first_instance.add("counter", 1))
+        self.assertFalse(self.second_instance.add("counter", 5))
+        self.assertEqual(2, self.second_instance.incr("counter"))
+        self.assertEqual(3, self.first_instance.incr("counter"))
+        self.assertEqual(3, self.second_instance.get("counter"))
+
+    def test_delete(self):
+        self.first_instance.set("key", "value")
+        self.second_instance.delete("key")
+        self.first_instance.clear_local()
+        self.assertIsNone(self.first_instance.get("key"))
+
+
+class WarmupTests(TestCase):
+    """Tests App Engine warmup request."""
+
+    def setUp(self):
+        super().setUp()
+        caches["default"].clear()
+        image_cache._local_sizes.update(sizes={}, loaded_at=float("-inf"))
+        self.fake_data = FakeData()
+        self.fake_data.create_book_with_single_narration(title="Кніга")
+
+    def tearDown(self):
+        super().tearDown()
+        self.fake_data.cleanup()
+
+    def test_warmup_fills_cache(self):
+        self.assertEqual(204, self.client.get("/_ah/warmup").status_code)
+        caches["default"].clear_local()
+        stats = page_cache.get_stats()["load_index_page_data"]
+        self.client.get("/")
+        self.assertEqual(
+            stats["hit"] + 1, page_cache.get_stats()["load_index_page_data"]["hit"]
+        )
+
+    def test_warmup_builds_image_sizes(self):
+        with patch.object(
+            image_cache, "sync_cache", return_value={}
+        ) as sync_cache, patch.object(data_export, "generate") as generate:
+            self.assertEqual({}, image_cache.get_sizes())
+            sync_cache.assert_not_called()
+            self.assertEqual(204, self.client.get("/_ah/warmup").status_code)
+        sync_cache.assert_called_once_with()
+        generate.assert_not_called()
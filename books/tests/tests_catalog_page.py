@@ -178,7 +178,7 @@ class CatalogPageTests(WebdriverTestCase):
             title="By someone else",
             narrators=[self.fake_data.person_bela],
         )
-        self.driver.get(f"{self.live_server_url}/job/update_read_by_author_tag")
+        self.driver.get(f"{self.live_server_url}/job/update_derived_tags")
         self.driver.get(f"{self.live_server_url}/catalog")
         self.scroll_and_click(
             self.driver.find_element(
@@ -267,3 +267,28 @@ class CatalogPageTests(WebdriverTestCase):
         self.driver.find_element(By.LINK_TEXT, self.fake_data.tag_classics.name).click()
         self.assert_page_contains_books([book_free])
         self.assert_page_does_not_contain_books([book_paid, book_both])
+
+    def test_tag_book_counts(self):
+        self.fake_data.create_book_with_single_narration(
+            title="Belarusian",
+            tags=[self.fake_data.tag_classics],
+            language=models.Language.BELARUSIAN,
+        )
+        self.fake_data.create_book_with_single_narration(
+            title="Russian",
+            tags=[self.fake_data.tag_classics, self.fake_data.tag_contemporary],
+            language=models.Language.RUSSIAN,
+        )
+
+        def tag_count(tag: models.Tag) -> str:
+            link = self.driver.find_element(By.LINK_TEXT, tag.name)
+            return link.find_element(By.XPATH, "..//span").text
+
+        self.driver.get(f"{self.live_server_url}/catalog")
+        self.assertEqual("2", tag_count(self.fake_data.tag_classics))
+        self.assertEqual("1", tag_count(self.fake_data.tag_contemporary))
+
+        # Counts take other filters into account.
+        self._choose_filter("#filter-language", "беларуская")
+        self.assertEqual("1", tag_count(self.fake_data.tag_classics))
+        self.assertEqual("0", tag_count(self.fake_data.tag_contemporary))
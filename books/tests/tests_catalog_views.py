@@ -0,0 +1,192 @@
+from datetime import date, timedelta
+import json
+from typing import List
+
+from bs4 import BeautifulSoup
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from rest_framework.utils.encoders import JSONEncoder
+
+from books import models, serializers
+from books.tests.fake_data import FakeData
+from books.views.catalog import (
+    BOOKS_PER_PAGE,
+    BOOKS_PER_TAG_ON_MAIN_PAGE,
+    JSON_CHUNK_SIZE,
+    MAX_BOOKS_PER_PAGE,
+    TAGS_TO_SHOW_ON_MAIN_PAGE,
+)
+
+
+class CatalogViewsTests(TestCase):
+    """
+    Tests for catalog views that don't need a browser. They use Django test client
+    and parse returned HTML.
+    """
+
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        self.fake_data = FakeData()
+
+    def tearDown(self):
+        super().tearDown()
+        self.fake_data.cleanup()
+
+    def create_books(self, count: int, **kwargs) -> List[models.Book]:
+        """Creates books, one per day, starting today. Returns books newest first."""
+        return [
+            self.fake_data.create_book_with_single_narration(
+                title=f"Кніга {i}", date=date.today() - timedelta(days=i), **kwargs
+            )
+            for i in range(count)
+        ]
+
+    def get_page(self, url: str) -> BeautifulSoup:
+        response = self.client.get(url)
+        self.assertEqual(200, response.status_code)
+        return BeautifulSoup(response.content, "html.parser")
+
+    def get_titles(self, page: BeautifulSoup) -> List[str]:
+        return [
+            el.get_text(strip=True) for el in page.select('[data-test="book-title"]')
+        ]
+
+    def get_link(self, page: BeautifulSoup, cls: str) -> str:
+        link = page.select_one(f"a.{cls}")
+        return link["href"] if link else None
+
+    def test_cursor_pagination(self):
+        books = self.create_books(2 * BOOKS_PER_PAGE + 3)
+        titles = [book.title for book in books]
+
+        page = self.get_page("/catalog?after=")
+        self.assertEqual(titles[:BOOKS_PER_PAGE], self.get_titles(page))
+        self.assertIsNone(self.get_link(page, "prev-page"))
+        self.assertIsNone(self.get_link(page, "last-page"))
+        self.assertIn("35 кніг", page.select_one(".pagination").get_text())
+
+        page = self.get_page(self.get_link(page, "next-page"))
+        self.assertEqual(
+            titles[BOOKS_PER_PAGE : 2 * BOOKS_PER_PAGE], self.get_titles(page)
+        )
+
+        page = self.get_page(self.get_link(page, "next-page"))
+        self.assertEqual(titles[2 * BOOKS_PER_PAGE :], self.get_titles(page))
+        self.assertIsNone(self.get_link(page, "next-page"))
+
+        page = self.get_page(self.get_link(page, "prev-page"))
+        self.assertEqual(
+            titles[BOOKS_PER_PAGE : 2 * BOOKS_PER_PAGE], self.get_titles(page)
+        )
+
+        page = self.get_page(self.get_link(page, "first-page"))
+        self.assertEqual(titles[:BOOKS_PER_PAGE], self.get_titles(page))
+        self.assertIsNone(self.get_link(page, "prev-page"))
+
+    def test_cursor_pagination_keeps_filters(self):
+        books = self.create_books(
+            BOOKS_PER_PAGE + 1, tags=[self.fake_data.tag_classics]
+        )
+        self.create_books(3, language=models.Language.RUSSIAN)
+        page = self.get_page("/catalog/classics?lang=belarusian&after=")
+        next_link = self.get_link(page, "next-page")
+        self.assertIn("lang=belarusian", next_link)
+        page = self.get_page(next_link)
+        self.assertEqual([books[-1].title], self.get_titles(page))
+
+    def test_malformed_cursor_shows_first_page(self):
+        books = self.create_books(3)
+        page = self.get_page("/catalog?after=abc")
+        self.assertEqual([book.title for book in books], self.get_titles(page))
+
+    def test_limit_is_capped(self):
+        self.create_books(MAX_BOOKS_PER_PAGE + 5)
+        page = self.get_page(f"/catalog?limit={MAX_BOOKS_PER_PAGE * 10}")
+        self.assertEqual(MAX_BOOKS_PER_PAGE, len(self.get_titles(page)))
+        page = self.get_page("/catalog?limit=abc")
+        self.assertEqual(BOOKS_PER_PAGE, len(self.get_titles(page)))
+
+    def get_json(self, url: str) -> List[dict]:
+        response = self.client.get(url)
+        self.assertEqual(200, response.status_code)
+        self.assertTrue(response.streaming)
+        return json.loads(b"".join(response.streaming_content))
+
+    def test_catalog_json(self):
+        books = self.create_books(
+            JSON_CHUNK_SIZE + 2,
+            authors=[self.fake_data.person_ales],
+            narrators=[self.fake_data.person_bela],
+            tags=[self.fake_data.tag_classics],
+            link_types=[self.fake_data.link_type_kobo],
+        )
+        russian_book = self.create_books(1, language=models.Language.RUSSIAN)[0]
+        russian_book.status = models.BookStatus.HIDDEN
+        russian_book.save()
+
+        data = self.get_json("/api/catalog")
+        self.assertEqual([str(book.uuid) for book in books], [b["uuid"] for b in data])
+        self.assertEqual(
+            json.loads(
+                json.dumps(
+                    serializers.BookSimpleSerializer(books[0]).data, cls=JSONEncoder
+                )
+            ),
+            data[0],
+        )
+
+    def test_catalog_json_filters(self):
+        classics = self.create_books(2, tags=[self.fake_data.tag_classics])
+        russian = self.create_books(1, language=models.Language.RUSSIAN)
+        self.assertEqual(
+            [str(book.uuid) for book in classics],
+            [b["uuid"] for b in self.get_json("/api/catalog/classics")],
+        )
+        self.assertEqual(
+            [str(book.uuid) for book in russian],
+            [b["uuid"] for b in self.get_json("/api/catalog?lang=russian")],
+        )
+        self.assertEqual(404, self.client.get("/api/catalog/unknown").status_code)
+
+    # Local cache so that cache queries are not counted.
+    @override_settings(
+        CACHES={"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}}
+    )
+    def test_index_page_number_of_queries_does_not_depend_on_tags(self):
+        for i, tag_name in enumerate(TAGS_TO_SHOW_ON_MAIN_PAGE):
+            tag, _ = models.Tag.objects.get_or_create(
+                name=tag_name, defaults={"slug": f"tag-{i}"}
+            )
+            self.create_books(BOOKS_PER_TAG_ON_MAIN_PAGE + 1, tags=[tag])
+        cache.clear()
+        # tags, ranked books of tags, books, authors, narrations
+        with self.assertNumQueries(5):
+            page = self.get_page("/")
+        sections = page.select('[data-test^="tag-"]')
+        self.assertEqual(len(TAGS_TO_SHOW_ON_MAIN_PAGE), len(sections))
+        for section in sections:
+            self.assertEqual(
+                BOOKS_PER_TAG_ON_MAIN_PAGE,
+                len(section.select('[data-test="book-title"]')),
+            )
+            self.assertIn("7 кніг", section.get_text())
+        # Second request is served from cache.
+        with self.assertNumQueries(0):
+            self.get_page("/")
+
+    def test_index_page_cache_invalidated_on_changes(self):
+        book = self.create_books(1)[0]
+        page = self.get_page("/")
+        self.assertEqual([book.title], self.get_titles(page))
+
+        new_book = self.fake_data.create_book_with_single_narration(
+            title="Новая", date=date.today() + timedelta(days=1)
+        )
+        page = self.get_page("/")
+        self.assertEqual([new_book.title, book.title], self.get_titles(page))
+
+        new_book.title = "Новая назва"
+        new_book.save()
+        page = self.get_page("/")
+        self.assertEqual(["Новая назва", book.title], self.get_titles(page))
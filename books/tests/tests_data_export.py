@@ -0,0 +1,300 @@
+import gzip
+import json
+from datetime import date
+import tempfile
+from unittest import mock
+from uuid import UUID, uuid4
+
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+
+from books import columnar, data_export, models
+from books.tests.fake_data import FakeData
+
+
+@override_settings(
+    CACHES={"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}}
+)
+class DataExportTests(TestCase):
+    """Tests generation of data.json and serving it."""
+
+    def setUp(self):
+        super().setUp()
+        media_root = tempfile.TemporaryDirectory()
+        self.addCleanup(media_root.cleanup)
+        settings_override = override_settings(MEDIA_ROOT=media_root.name)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        cache.clear()
+        self.fake_data = FakeData()
+        self.book = self.fake_data.create_book_with_single_narration(
+            title="Кніга",
+            authors=[self.fake_data.person_ales],
+            publishers=[self.fake_data.publisher_audiobooksby],
+        )
+
+    def tearDown(self):
+        super().tearDown()
+        self.fake_data.cleanup()
+
+    def generate(self):
+        self.assertEqual(204, self.client.get("/job/generate_data_json").status_code)
+
+    def test_empty_before_generation(self):
+        response = self.client.get("/data.json")
+        self.assertEqual(200, response.status_code)
+        self.assertEqual(b"", response.content)
+
+    def test_serves_generated_data(self):
+        self.generate()
+        response = self.client.get("/data.json")
+        self.assertEqual(200, response.status_code)
+        self.assertEqual("*", response["Access-Control-Allow-Origin"])
+        data = json.loads(b"".join(response.streaming_content))
+        self.assertEqual(
+            ["books", "people", "link_types", "tags", "publishers"], list(data)
+        )
+        self.assertEqual(["Кніга"], [book["title"] for book in data["books"]])
+
+    def test_serves_gzip_when_accepted(self):
+        self.generate()
+        plain = self.client.get("/data.json")
+        compressed = self.client.get("/data.json", HTTP_ACCEPT_ENCODING="gzip, br")
+        self.assertEqual("gzip", compressed["Content-Encoding"])
+        content = b"".join(compressed.streaming_content)
+        self.assertEqual(str(len(content)), compressed["Content-Length"])
+        self.assertEqual(b"".join(plain.streaming_content), gzip.decompress(content))
+        self.assertNotEqual(plain["ETag"], compressed["ETag"])
+
+    def test_gzip_quality_values(self):
+        self.generate()
+        for accept_encoding, expected in [
+            ("gzip;q=0", False),
+            ("br, gzip;q=0.5", True),
+            ("*", True),
+            ("br, *;q=0", False),
+            ("*, gzip;q=0", False),
+            ("identity", False),
+        ]:
+            response = self.client.get(
+                "/data.json", HTTP_ACCEPT_ENCODING=accept_encoding
+            )
+            self.assertEqual(
+                expected, response.get("Content-Encoding") == "gzip", accept_encoding
+            )
+
+    def test_not_modified_when_etag_matches(self):
+        self.generate()
+        etag = self.client.get("/data.json")["ETag"]
+        response = self.client.get("/data.json", HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(304, response.status_code)
+
+        self.book.title = "Новая назва"
+        self.book.save()
+        self.generate()
+        response = self.client.get("/data.json", HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(200, response.status_code)
+
+    def test_export_uses_fixed_number_of_queries(self):
+        def count_queries():
+            with CaptureQueriesContext(connection) as queries:
+                "".join(data_export.generate_chunks())
+            return len(queries)
+
+        initial = count_queries()
+        for i in range(3):
+            self.fake_data.create_book_with_single_narration(
+                title=f"Кніга {i}",
+                authors=[self.fake_data.person_bela],
+                narrators=[self.fake_data.person_viktar],
+                translators=[self.fake_data.person_volha],
+                tags=[self.fake_data.tag_classics],
+                link_types=[self.fake_data.link_type_kobo],
+                publishers=[self.fake_data.publisher_audiobooksby],
+            )
+        self.assertEqual(initial, count_queries())
+
+    def test_old_files_deleted(self):
+        default_storage.save(data_export.LEGACY_FILE, ContentFile(b"{}"))
+        versions = []
+        for i in range(3):
+            self.book.title = f"Кніга {i}"
+            self.book.save()
+            self.generate()
+            versions.append(data_export.get_current())
+        files = set(default_storage.listdir("")[1])
+        self.assertNotIn(data_export.LEGACY_FILE, files)
+        self.assertNotIn(versions[0].json_file, files)
+        for version in versions[1:]:
+            self.assertIn(version.json_file, files)
+            self.assertIn(version.gzip_file, files)
+        # Deltas are kept longer than full files.
+        changes = self.get_changes(versions[0].version)
+        self.assertEqual(["Кніга 2"], [b["title"] for b in changes["books"]])
+
+    def test_unchanged_data_keeps_version(self):
+        self.generate()
+        export = data_export.get_current()
+        self.generate()
+        self.assertEqual(export, data_export.get_current())
+        self.assertEqual(
+            export.version, self.client.get("/data.json")["X-Data-Version"]
+        )
+
+    def get_changes(self, since: str) -> dict:
+        response = self.client.get("/data.json", {"since": since})
+        self.assertEqual(200, response.status_code)
+        data = response.json()
+        self.assertEqual(data_export.get_current().version, data["version"])
+        return data["changed"] | {
+            f"removed_{section}": ids for section, ids in data["removed"].items()
+        }
+
+    def test_changes_since_version(self):
+        removed_book = self.fake_data.create_book_with_single_narration(
+            title="Выдаленая кніга", authors=[self.fake_data.person_ales]
+        )
+        self.generate()
+        first = data_export.get_current().version
+
+        self.book.title = "Новая назва"
+        self.book.save()
+        added_book = self.fake_data.create_book_with_single_narration(
+            title="Новая кніга", authors=[self.fake_data.person_bela]
+        )
+        self.generate()
+        second = data_export.get_current().version
+        changes = self.get_changes(first)
+        self.assertEqual(
+            {str(self.book.uuid), str(added_book.uuid)},
+            {book["uuid"] for book in changes["books"]},
+        )
+        self.assertEqual([], changes["people"])
+        self.assertEqual([], changes["removed_books"])
+
+        removed_book_id = str(removed_book.uuid)
+        removed_book.delete()
+        added_book.title = "Змененая кніга"
+        added_book.save()
+        self.generate()
+        changes = self.get_changes(second)
+        self.assertEqual(["Змененая кніга"], [b["title"] for b in changes["books"]])
+        self.assertEqual([removed_book_id], changes["removed_books"])
+
+        # Changes of several versions are combined.
+        changes = self.get_changes(first)
+        self.assertEqual(
+            {"Новая назва", "Змененая кніга"}, {b["title"] for b in changes["books"]}
+        )
+        self.assertEqual([removed_book_id], changes["removed_books"])
+
+        current = data_export.get_current().version
+        changes = self.get_changes(current)
+        self.assertEqual([], changes["books"])
+        self.assertEqual([], changes["removed_books"])
+
+    def test_binary_export_has_same_data(self):
+        self.fake_data.create_book_with_single_narration(
+            title="Кніга 2",
+            authors=[self.fake_data.person_bela, self.fake_data.person_ales],
+            narrators=[self.fake_data.person_viktar],
+            tags=[self.fake_data.tag_classics],
+            link_types=[self.fake_data.link_type_kobo],
+        )
+        self.generate()
+        data = json.loads(b"".join(self.client.get("/data.json").streaming_content))
+        response = self.client.get("/data.bin")
+        self.assertEqual(200, response.status_code)
+        tables = columnar.loads(b"".join(response.streaming_content))
+
+        books = tables["books"]
+        self.assertEqual([b["title"] for b in data["books"]], books["title"])
+        self.assertEqual([UUID(b["uuid"]).hex for b in data["books"]], books["uuid"])
+        self.assertEqual(
+            [
+                (UUID(b["uuid"]).hex, UUID(author).hex)
+                for b in data["books"]
+                for author in b["authors"]
+            ],
+            list(zip(tables["book_authors"]["book"], tables["book_authors"]["person"])),
+        )
+        narrations = [n for b in data["books"] for n in b["narrations"]]
+        self.assertEqual(
+            [int(n["duration"]) for n in narrations], tables["narrations"]["duration"]
+        )
+        self.assertEqual(
+            [date.fromisoformat(n["date"]) for n in narrations],
+            tables["narrations"]["date"],
+        )
+        self.assertEqual(
+            [n["cover_image"] for n in narrations], tables["narrations"]["cover_image"]
+        )
+        self.assertEqual(
+            [self.fake_data.link_type_kobo.id], tables["links"]["url_type"]
+        )
+        for section in ["people", "link_types", "tags", "publishers"]:
+            self.assertEqual(
+                [obj["name"] for obj in data[section]], tables[section]["name"]
+            )
+
+    def test_columnar_round_trip(self):
+        table = columnar.Table(
+            "t",
+            [
+                columnar.Column("id", columnar.UUID),
+                columnar.Column("count", columnar.INT, nullable=True),
+                columnar.Column("flag", columnar.BOOL),
+                columnar.Column("day", columnar.DATE),
+                columnar.Column("text", columnar.STRING, nullable=True),
+            ],
+        )
+        rows = [
+            (uuid4(), -5, True, date(1969, 12, 31), "тэкст"),
+            (uuid4(), None, False, date(2024, 2, 29), None),
+            (uuid4(), 2**40, True, date(2000, 1, 1), ""),
+        ]
+        for row in rows:
+            table.append(*row)
+        columns = columnar.loads(columnar.dumps([table]))["t"]
+        self.assertEqual(3, len(columns["text"]))
+        self.assertEqual(["тэкст", None, ""], columns["text"])
+        # UUIDs are read as hex strings.
+        self.assertEqual(
+            [(row[0].hex, *row[1:]) for row in rows], list(zip(*columns.values()))
+        )
+
+    def test_unknown_version_is_gone(self):
+        self.generate()
+        response = self.client.get("/data.json", {"since": "20000101000000-abc"})
+        self.assertEqual(410, response.status_code)
+
+    def test_current_version_survives_cache_clear(self):
+        self.generate()
+        export = data_export.get_current()
+        cache.clear()
+        with mock.patch.object(data_export, "_find_latest") as find_latest:
+            self.assertEqual(export, data_export.get_current())
+        find_latest.assert_not_called()
+
+    def test_missing_export_not_searched_on_every_request(self):
+        with mock.patch.object(
+            data_export, "_find_latest", return_value=None
+        ) as find_latest:
+            self.assertIsNone(data_export.get_current())
+            self.assertIsNone(data_export.get_current())
+        find_latest.assert_called_once_with()
+        self.generate()
+        self.assertIsNotNone(data_export.get_current())
+
+    def test_current_version_found_in_storage_without_state(self):
+        self.generate()
+        export = data_export.get_current()
+        models.SharedState.objects.all().delete()
+        cache.clear()
+        found = data_export.get_current()
+        self.assertEqual(export.json_file, found.json_file)
+        self.assertEqual(export.gzip_size, found.gzip_size)
@@ -0,0 +1,176 @@
+from datetime import date, timedelta
+
+from django.db import transaction
+from django.test import TestCase, override_settings
+
+from books import derived_tags, models
+from books.tests.fake_data import FakeData
+
+
+# Local cache so that cache queries are not counted.
+@override_settings(
+    CACHES={"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}}
+)
+class ReadByAuthorTagTests(TestCase):
+    """Tests update of the derived "cytaje-autar" tag."""
+
+    def setUp(self):
+        super().setUp()
+        self.fake_data = FakeData()
+        self.tag = self.fake_data.tag_read_by_author
+        self.read_by_author = self.fake_data.create_book_with_single_narration(
+            title="Read by author",
+            authors=[self.fake_data.person_ales],
+            narrators=[self.fake_data.person_ales],
+        )
+        self.read_by_other = self.fake_data.create_book_with_single_narration(
+            title="Read by other",
+            authors=[self.fake_data.person_ales, self.fake_data.person_bela],
+            narrators=[self.fake_data.person_viktar],
+        )
+
+    def tearDown(self):
+        super().tearDown()
+        self.fake_data.cleanup()
+
+    def tagged_books(self) -> set[str]:
+        return {book.title for book in self.tag.books.all()}
+
+    def test_job_tags_books_read_by_author(self):
+        response = self.client.get("/job/update_derived_tags")
+        self.assertEqual(204, response.status_code)
+        self.assertEqual({"Read by author"}, self.tagged_books())
+        self.assertTrue(
+            models.BookFacet.objects.filter(
+                book=self.read_by_author, name=models.BookFacet.for_tag(self.tag.id)
+            ).exists()
+        )
+
+    def test_only_changes_applied(self):
+        derived_tags.update("cytaje-autar")
+        self.read_by_other.narrations.first().narrators.add(self.fake_data.person_bela)
+        self.read_by_author.narrations.first().narrators.set(
+            [self.fake_data.person_volha]
+        )
+        self.assertEqual(
+            derived_tags.UpdateResult(added=1, removed=1),
+            derived_tags.update("cytaje-autar"),
+        )
+        self.assertEqual({"Read by other"}, self.tagged_books())
+        self.assertEqual(
+            derived_tags.UpdateResult(added=0, removed=0),
+            derived_tags.update("cytaje-autar"),
+        )
+
+    def test_update_uses_fixed_number_of_queries(self):
+        for i in range(5):
+            self.fake_data.create_book_with_single_narration(
+                title=f"Book {i}",
+                authors=[self.fake_data.person_volha],
+                narrators=[self.fake_data.person_volha],
+            )
+        derived_tags.update("cytaje-autar")
+        # Tag, books to add and books to remove, plus savepoint queries.
+        with self.assertNumQueries(5):
+            derived_tags.update("cytaje-autar")
+
+    def test_tags_updated_when_people_change(self):
+        derived_tags.update("cytaje-autar")
+        with self.captureOnCommitCallbacks(execute=True):
+            self.read_by_other.narrations.first().narrators.add(
+                self.fake_data.person_bela
+            )
+        self.assertEqual({"Read by author", "Read by other"}, self.tagged_books())
+        with self.captureOnCommitCallbacks(execute=True):
+            self.fake_data.person_ales.books_authored.remove(self.read_by_author)
+        self.assertEqual({"Read by other"}, self.tagged_books())
+
+    def test_missing_tags_skipped(self):
+        self.assertEqual(["cytaje-autar"], list(derived_tags.update_all()))
+
+
+@override_settings(
+    CACHES={"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}}
+)
+class DerivedTagRulesTests(TestCase):
+    """Tests rules of derived tags and their incremental update."""
+
+    def setUp(self):
+        super().setUp()
+        self.fake_data = FakeData()
+        self.tags = {
+            slug: models.Tag.objects.create(name=slug, slug=slug)
+            for slug in derived_tags.RULES
+            if slug != "cytaje-autar"
+        }
+        self.link_type_spotify = models.LinkType.objects.create(
+            name="spotify_audiobooks", caption="Spotify Audiobooks"
+        )
+
+    def tearDown(self):
+        super().tearDown()
+        self.fake_data.cleanup()
+
+    def tag_slugs(self, book: models.Book) -> set[str]:
+        return set(book.tag.values_list("slug", flat=True))
+
+    def test_rules(self):
+        paid_russian = self.fake_data.create_book_with_single_narration(
+            title="Paid",
+            paid=True,
+            language=models.Language.RUSSIAN,
+            date=date(2000, 1, 1),
+        )
+        free_long = self.fake_data.create_book_with_single_narration(
+            title="Free",
+            duration=timedelta(hours=11),
+            link_types=[self.link_type_spotify],
+        )
+        models.Narration.objects.create(
+            book=paid_russian,
+            language=models.Language.RUSSIAN,
+            paid=True,
+            date=date(2001, 1, 1),
+        )
+        derived_tags.update_all()
+        self.assertEqual({"tolki-pa-rusku"}, self.tag_slugs(paid_russian))
+        self.assertEqual(
+            {"biasplatnyja", "bols-za-10-hadzin", "vyjsli-sioleta", "josc-u-spotify"},
+            self.tag_slugs(free_long),
+        )
+
+        with self.captureOnCommitCallbacks(execute=True):
+            models.Narration.objects.create(
+                book=paid_russian,
+                language=models.Language.BELARUSIAN,
+                paid=False,
+                date=date.today(),
+            )
+        self.assertEqual(
+            {"biasplatnyja", "vyjsli-sioleta"}, self.tag_slugs(paid_russian)
+        )
+
+        with self.captureOnCommitCallbacks(execute=True):
+            models.Link.objects.filter(narration__book=free_long).delete()
+        self.assertNotIn("josc-u-spotify", self.tag_slugs(free_long))
+
+    def test_changes_in_transaction_update_tags_once(self):
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            book = self.fake_data.create_book_with_single_narration(
+                title="Book", link_types=[self.link_type_spotify]
+            )
+        self.assertGreater(len(callbacks), 1)
+        self.assertIn("josc-u-spotify", self.tag_slugs(book))
+        with self.assertNumQueries(0):
+            for callback in callbacks:
+                callback()
+
+    def test_changes_after_rolled_back_savepoint_update_tags(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            with self.assertRaises(RuntimeError), transaction.atomic():
+                self.fake_data.create_book_with_single_narration(title="Rolled back")
+                raise RuntimeError()
+            book = self.fake_data.create_book_with_single_narration(
+                title="Book", link_types=[self.link_type_spotify]
+            )
+        self.assertIn("josc-u-spotify", self.tag_slugs(book))
@@ -1,5 +1,5 @@
 from datetime import date, timedelta
-from books import models
+from books import models, search
 from books.tests.webdriver_test_case import WebdriverTestCase
 from selenium.webdriver.common.by import By
 
@@ -23,6 +23,8 @@ class HeaderAndSearchTests(WebdriverTestCase):
             date=date.today(),
         )
         narration.publishers.set([self.fake_data.publisher_audiobooksby])
+        # Search index is built by jobs, not on requests.
+        search.save_local_index(search.build_records())
 
     def test_click_logo_leads_to_main_page(self):
         self.driver.get(f"{self.live_server_url}/catalog")
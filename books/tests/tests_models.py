@@ -0,0 +1,238 @@
+from datetime import date
+
+from django.test import TestCase
+
+from books import models
+from books.tests.fake_data import FakeData
+
+
+class LatestNarrationDateTests(TestCase):
+    """Tests that Book.latest_narration_date is kept in sync with narrations."""
+
+    def setUp(self):
+        super().setUp()
+        self.fake_data = FakeData()
+        self.book = self.fake_data.create_book_with_single_narration(
+            title="Book", date=date(2020, 1, 1)
+        )
+
+    def tearDown(self):
+        super().tearDown()
+        self.fake_data.cleanup()
+
+    def get_latest_narration_date(self, book: models.Book) -> date:
+        book.refresh_from_db()
+        return book.latest_narration_date
+
+    def test_narration_created(self):
+        self.assertEqual(date(2020, 1, 1), self.get_latest_narration_date(self.book))
+        models.Narration.objects.create(
+            book=self.book, language=models.Language.RUSSIAN, date=date(2022, 5, 5)
+        )
+        self.assertEqual(date(2022, 5, 5), self.get_latest_narration_date(self.book))
+
+    def test_narration_date_changed(self):
+        narration = self.book.narrations.first()
+        narration.date = date(2021, 3, 3)
+        narration.save()
+        self.assertEqual(date(2021, 3, 3), self.get_latest_narration_date(self.book))
+
+    def test_narration_deleted(self):
+        narration = models.Narration.objects.create(
+            book=self.book, language=models.Language.RUSSIAN, date=date(2022, 5, 5)
+        )
+        narration.delete()
+        self.assertEqual(date(2020, 1, 1), self.get_latest_narration_date(self.book))
+        self.book.narrations.all().delete()
+        self.assertIsNone(self.get_latest_narration_date(self.book))
+
+    def test_saving_outdated_book_instance(self):
+        book = models.Book.objects.get(uuid=self.book.uuid)
+        models.Narration.objects.create(
+            book=self.book, language=models.Language.RUSSIAN, date=date(2022, 5, 5)
+        )
+        book.title = "New title"
+        book.save()
+        self.assertEqual(date(2022, 5, 5), self.get_latest_narration_date(book))
+
+    def test_narration_moved_to_another_book(self):
+        other_book = self.fake_data.create_book_with_single_narration(
+            title="Other book", date=date(2019, 1, 1)
+        )
+        narration = models.Narration.objects.create(
+            book=self.book, language=models.Language.RUSSIAN, date=date(2022, 5, 5)
+        )
+        narration.book = other_book
+        narration.save()
+        self.assertEqual(date(2020, 1, 1), self.get_latest_narration_date(self.book))
+        self.assertEqual(date(2022, 5, 5), self.get_latest_narration_date(other_book))
+
+    def test_active_books_ordered_by_date(self):
+        newer = self.fake_data.create_book_with_single_narration(
+            title="Newer", date=date(2023, 1, 1)
+        )
+        hidden = self.fake_data.create_book_with_single_narration(
+            title="Hidden", date=date(2024, 1, 1)
+        )
+        hidden.status = models.BookStatus.HIDDEN
+        hidden.save()
+        self.assertEqual(
+            [newer, self.book], list(models.Book.objects.active_books_ordered_by_date())
+        )
+
+
+class BookFacetTests(TestCase):
+    """Tests that BookFacet table is kept in sync with books, narrations and links."""
+
+    def setUp(self):
+        super().setUp()
+        self.fake_data = FakeData()
+        self.book = self.fake_data.create_book_with_single_narration(
+            title="Book",
+            tags=[self.fake_data.tag_classics],
+            link_types=[self.fake_data.link_type_kobo],
+            language=models.Language.BELARUSIAN,
+            paid=False,
+        )
+
+    def tearDown(self):
+        super().tearDown()
+        self.fake_data.cleanup()
+
+    def get_facets(self, book: models.Book) -> set[str]:
+        return set(book.facets.values_list("name", flat=True))
+
+    def test_facets_created(self):
+        self.assertEqual(
+            {
+                f"tag:{self.fake_data.tag_classics.id}",
+                "links:kobo",
+                "lang:BELARUSIAN",
+                "paid:false",
+            },
+            self.get_facets(self.book),
+        )
+
+    def test_narration_changes(self):
+        narration = self.book.narrations.first()
+        narration.language = models.Language.RUSSIAN
+        narration.paid = True
+        narration.save()
+        self.assertIn("lang:RUSSIAN", self.get_facets(self.book))
+        self.assertNotIn("lang:BELARUSIAN", self.get_facets(self.book))
+        self.assertIn("paid:true", self.get_facets(self.book))
+
+        narration.delete()
+        self.assertEqual(
+            {f"tag:{self.fake_data.tag_classics.id}"}, self.get_facets(self.book)
+        )
+
+    def test_tag_changes(self):
+        contemporary = self.fake_data.tag_contemporary
+        self.book.tag.add(contemporary)
+        self.assertIn(f"tag:{contemporary.id}", self.get_facets(self.book))
+        self.book.tag.remove(self.fake_data.tag_classics)
+        self.assertNotIn(
+            f"tag:{self.fake_data.tag_classics.id}", self.get_facets(self.book)
+        )
+        contemporary.books.clear()
+        self.assertNotIn(f"tag:{contemporary.id}", self.get_facets(self.book))
+        contemporary.books.add(self.book)
+        self.assertIn(f"tag:{contemporary.id}", self.get_facets(self.book))
+
+    def test_link_changes(self):
+        link_type = self.fake_data.link_type_kobo
+        link_type.name = "kobo_new"
+        link_type.save()
+        self.assertIn("links:kobo_new", self.get_facets(self.book))
+        self.assertNotIn("links:kobo", self.get_facets(self.book))
+
+        models.Link.objects.filter(url_type=link_type).first().delete()
+        self.assertNotIn("links:kobo_new", self.get_facets(self.book))
+
+    def test_link_moved_to_another_book(self):
+        other_book = self.fake_data.create_book_with_single_narration(title="Other")
+        link = models.Link.objects.get(narration__book=self.book)
+        link.narration = other_book.narrations.first()
+        link.save()
+        self.assertNotIn("links:kobo", self.get_facets(self.book))
+        self.assertIn("links:kobo", self.get_facets(other_book))
+
+    def test_book_deleted(self):
+        self.book.delete()
+        self.assertEqual(0, models.BookFacet.objects.count())
+
+    def test_filter_and_count(self):
+        russian_book = self.fake_data.create_book_with_single_narration(
+            title="Russian book",
+            tags=[self.fake_data.tag_classics],
+            language=models.Language.RUSSIAN,
+        )
+        books = models.Book.objects.all()
+        self.assertEqual(
+            [russian_book],
+            list(
+                models.BookFacet.objects.filter_books(
+                    books, [["lang:RUSSIAN"], [f"tag:{self.fake_data.tag_classics.id}"]]
+                )
+            ),
+        )
+        self.assertEqual(
+            [self.book, russian_book],
+            list(
+                models.BookFacet.objects.filter_books(
+                    books, [["lang:RUSSIAN", "links:kobo"]]
+                ).order_by("title")
+            ),
+        )
+        counts = models.BookFacet.objects.counts(books)
+        self.assertEqual(2, counts[f"tag:{self.fake_data.tag_classics.id}"])
+        self.assertEqual(1, counts["lang:RUSSIAN"])
+
+
+class LacinkaFieldsTests(TestCase):
+    """Tests that łacinka versions of fields are stored on save and used in pages."""
+
+    def setUp(self):
+        super().setUp()
+        self.fake_data = FakeData()
+        self.book = self.fake_data.create_book_with_single_narration(
+            title="Кніга пра каханне"
+        )
+
+    def tearDown(self):
+        super().tearDown()
+        self.fake_data.cleanup()
+
+    def test_stored_on_save(self):
+        self.book.description = "Апісанне кнігі"
+        self.book.save()
+        self.book.refresh_from_db()
+        self.assertEqual("Kniha pra kachańnie", self.book.title_lac)
+        self.assertEqual("Apisańnie knihi", self.book.description_lac)
+
+        person = self.fake_data.person_ales
+        person.description = "Пісьменнік"
+        person.save()
+        person.refresh_from_db()
+        self.assertEqual("Piśmieńnik", person.description_lac)
+
+    def test_stored_on_save_with_update_fields(self):
+        self.book.title = "Новая назва"
+        self.book.description = "Апісанне кнігі"
+        self.book.save(update_fields=["description"])
+        self.book.refresh_from_db()
+        self.assertEqual("Apisańnie knihi", self.book.description_lac)
+        # Title wasn't saved, so neither was its łacinka version.
+        self.assertEqual("Kniha pra kachańnie", self.book.title_lac)
+
+    def test_page_uses_stored_fields(self):
+        # Stored value differs from converted one, so that the test can tell them
+        # apart.
+        models.Book.objects.filter(uuid=self.book.uuid).update(
+            description="Апісанне", description_lac="Stored description"
+        )
+        self.client.cookies["django_language"] = "be-latn"
+        content = self.client.get(f"/books/{self.book.slug}").content.decode()
+        self.assertIn("Kniha pra kachańnie", content)
+        self.assertIn("Stored description", content)
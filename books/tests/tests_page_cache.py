@@ -0,0 +1,207 @@
+from datetime import date
+from unittest import mock
+
+from bs4 import BeautifulSoup
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+
+from books import models, page_cache
+from books.views import person
+from books.tests.fake_data import FakeData
+
+
+# Query stats are flushed to the cache periodically, which would add queries to
+# requests served from the page cache.
+@override_settings(QUERY_STATS_SAMPLE_RATE=0)
+class PageCacheTests(TestCase):
+    """Tests that public pages are cached and invalidated when models change."""
+
+    def setUp(self):
+        super().setUp()
+        # Flush counters of previous tests before clearing them.
+        page_cache.flush_counters()
+        cache.clear()
+        self.fake_data = FakeData()
+        self.book = self.fake_data.create_book_with_single_narration(
+            title="Кніга",
+            authors=[self.fake_data.person_ales],
+            narrators=[self.fake_data.person_bela],
+        )
+        self.other_book = self.fake_data.create_book_with_single_narration(
+            title="Іншая кніга",
+            authors=[self.fake_data.person_viktar],
+        )
+
+    def tearDown(self):
+        super().tearDown()
+        self.fake_data.cleanup()
+
+    def get_page(self, url: str) -> BeautifulSoup:
+        response = self.client.get(url)
+        self.assertEqual(200, response.status_code)
+        return BeautifulSoup(response.content, "html.parser")
+
+    def assertCached(self, url: str):
+        with self.assertNumQueries(0):
+            self.get_page(url)
+
+    def count_misses(self) -> int:
+        return sum(stats["miss"] for stats in page_cache.get_stats().values())
+
+    def assertNotCached(self, url: str):
+        misses = self.count_misses()
+        self.get_page(url)
+        self.assertEqual(misses + 1, self.count_misses())
+
+    def test_pages_are_cached(self):
+        urls = [
+            f"/books/{self.book.slug}",
+            f"/person/{self.fake_data.person_ales.slug}",
+            f"/publisher/{self.fake_data.publisher_audiobooksby.slug}",
+            "/catalog",
+            "/catalog?page=1",
+        ]
+        for url in urls:
+            self.get_page(url)
+        for url in urls:
+            self.assertCached(url)
+        self.assertEqual(1, page_cache.get_stats()["book_detail"]["hit"])
+        self.assertEqual(1, page_cache.get_stats()["book_detail"]["miss"])
+
+    def test_change_invalidates_only_affected_pages(self):
+        urls = [
+            f"/books/{self.book.slug}",
+            f"/books/{self.other_book.slug}",
+            f"/person/{self.fake_data.person_ales.slug}",
+            f"/person/{self.fake_data.person_viktar.slug}",
+            "/catalog",
+        ]
+        for url in urls:
+            self.get_page(url)
+
+        self.fake_data.person_bela.name = "Бэла Новая"
+        self.fake_data.person_bela.save()
+        page = self.get_page(f"/books/{self.book.slug}")
+        self.assertIn("Бэла Новая", page.get_text())
+        self.assertNotCached("/catalog")
+        self.assertCached(f"/books/{self.other_book.slug}")
+        self.assertCached(f"/person/{self.fake_data.person_viktar.slug}")
+
+        self.book.title = "Новая назва"
+        self.book.save()
+        page = self.get_page(f"/person/{self.fake_data.person_ales.slug}")
+        self.assertIn("Новая назва", page.get_text())
+        self.assertCached(f"/person/{self.fake_data.person_viktar.slug}")
+
+    def test_new_relation_invalidates_pages(self):
+        url = f"/person/{self.fake_data.person_viktar.slug}"
+        self.get_page(url)
+        self.book.authors.add(self.fake_data.person_viktar)
+        self.assertIn("Кніга", self.get_page(url).get_text())
+
+        narration = self.book.narrations.first()
+        narration.publishers.add(self.fake_data.publisher_audiobooksby)
+        self.assertIn(
+            "Кніга",
+            self.get_page(
+                f"/publisher/{self.fake_data.publisher_audiobooksby.slug}"
+            ).get_text(),
+        )
+
+    def test_narration_change_invalidates_publisher_page(self):
+        url = f"/publisher/{self.fake_data.publisher_audiobooksby.slug}"
+        narration = self.book.narrations.first()
+        other_narration = self.other_book.narrations.first()
+        narration.date = date(2020, 1, 1)
+        narration.save()
+        other_narration.date = date(2010, 1, 1)
+        other_narration.save()
+        for n in [narration, other_narration]:
+            n.publishers.add(self.fake_data.publisher_audiobooksby)
+        text = self.get_page(url).get_text()
+        self.assertLess(text.index("Кніга"), text.index("Іншая кніга"))
+
+        other_narration.date = date(2030, 1, 1)
+        other_narration.save()
+
+        text = self.get_page(url).get_text()
+        self.assertLess(text.index("Іншая кніга"), text.index("Кніга"))
+
+    def test_link_change_invalidates_filtered_person_page(self):
+        url = f"/person/{self.fake_data.person_ales.slug}?links=kobo"
+        self.assertNotIn("Кніга", self.get_page(url).get_text())
+        models.Link.objects.create(
+            narration=self.book.narrations.first(),
+            url_type=self.fake_data.link_type_kobo,
+            url="https://kobo.com/book",
+        )
+        self.assertIn("Кніга", self.get_page(url).get_text())
+
+    def test_languages_are_cached_separately(self):
+        url = f"/books/{self.book.slug}"
+        self.assertIn("Кніга", self.get_page(url).get_text())
+        self.client.cookies["django_language"] = "be-latn"
+        self.assertIn("Kniha", self.get_page(url).get_text())
+
+    def test_csrf_token_is_not_shared(self):
+        url = f"/books/{self.book.slug}"
+        self.get_page(url)
+        page = self.get_page(url)
+        token = page.select_one('input[name="csrfmiddlewaretoken"]')["value"]
+        self.assertNotEqual(page_cache.CSRF_TOKEN_PLACEHOLDER.decode(), token)
+        self.assertIn("csrftoken", self.client.cookies)
+
+    def test_not_modified(self):
+        url = f"/books/{self.book.slug}"
+        response = self.client.get(url)
+        self.assertIn("private", response["Cache-Control"])
+        for headers in [
+            {"HTTP_IF_NONE_MATCH": response["ETag"]},
+            {"HTTP_IF_MODIFIED_SINCE": response["Last-Modified"]},
+        ]:
+            with self.assertNumQueries(0):
+                not_modified = self.client.get(url, **headers)
+            self.assertEqual(304, not_modified.status_code)
+            self.assertEqual(b"", not_modified.content)
+            self.assertEqual(response["ETag"], not_modified["ETag"])
+
+    def test_change_updates_etag(self):
+        url = f"/books/{self.book.slug}"
+        etag = self.client.get(url)["ETag"]
+        self.assertEqual(etag, self.client.get(url)["ETag"])
+
+        self.book.title = "Новая назва"
+        self.book.save()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(200, response.status_code)
+        self.assertNotEqual(etag, response["ETag"])
+        self.assertIn("Новая назва", response.content.decode())
+
+    def test_unknown_params_ignored(self):
+        self.get_page("/catalog?page=1")
+        self.assertCached("/catalog?utm_source=test&page=1")
+        page = self.get_page("/catalog?page=1&random=123")
+        self.assertNotIn("random", str(page))
+
+    def test_activated_book_shown_on_person_page(self):
+        url = f"/person/{self.fake_data.person_ales.slug}"
+        self.book.status = models.BookStatus.HIDDEN
+        self.book.save()
+        self.assertNotIn("Кніга", self.get_page(url).get_text())
+
+        self.book.status = models.BookStatus.ACTIVE
+        self.book.save()
+        self.assertIn("Кніга", self.get_page(url).get_text())
+
+    def test_change_during_render_not_cached(self):
+        url = f"/person/{self.fake_data.person_ales.slug}"
+        get_books_with_roles = person.get_books_with_roles
+
+        def change_book(*args):
+            self.book.title = "Новая назва"
+            self.book.save()
+            return get_books_with_roles(*args)
+
+        with mock.patch.object(person, "get_books_with_roles", change_book):
+            self.get_page(url)
+        self.assertNotCached(url)
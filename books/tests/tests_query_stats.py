@@ -0,0 +1,94 @@
+from django.core.cache import cache
+from django.test import override_settings
+
+from books import query_stats
+from books.tests.fake_data import FakeData
+from books.tests.query_budget import QueryBudgetTestCase
+
+
+class QueryBudgetTests(QueryBudgetTestCase):
+    """Checks that public pages stay within their query budgets."""
+
+    def setUp(self):
+        super().setUp()
+        self.fake_data = FakeData()
+        self.book = self.fake_data.create_book_with_single_narration(
+            title="Кніга",
+            authors=[self.fake_data.person_ales],
+            narrators=[self.fake_data.person_bela],
+            translators=[self.fake_data.person_viktar],
+            tags=[self.fake_data.tag_classics],
+            publishers=[self.fake_data.publisher_audiobooksby],
+            link_types=[self.fake_data.link_type_kobo],
+        )
+
+    def tearDown(self):
+        super().tearDown()
+        self.fake_data.cleanup()
+
+    def test_pages_within_budget(self):
+        narration = self.book.narrations.first()
+        for url in [
+            "/",
+            "/catalog",
+            "/catalog?lang=belarusian&paid=false",
+            f"/catalog/{self.fake_data.tag_classics.slug}",
+            f"/books/{self.book.slug}",
+            f"/person/{self.fake_data.person_ales.slug}",
+            f"/person/{self.fake_data.person_bela.slug}",
+            f"/publisher/{self.fake_data.publisher_audiobooksby.slug}",
+            f"/releases/{narration.date.year}",
+            f"/releases/{narration.date.year}/{narration.date.month}",
+            "/about",
+            "/articles/lacinka",
+            "/stats/birthdays",
+            "/stats/digest",
+        ]:
+            cache.clear()
+            self.assertWithinQueryBudget(url)
+
+
+class QueryStatsMiddlewareTests(QueryBudgetTestCase):
+    """Tests that stats are collected and aggregated per view."""
+
+    def setUp(self):
+        super().setUp()
+        query_stats.reset()
+        self.fake_data = FakeData()
+        self.book = self.fake_data.create_book_with_single_narration(title="Кніга")
+
+    def tearDown(self):
+        super().tearDown()
+        self.fake_data.cleanup()
+
+    @override_settings(QUERY_STATS_SAMPLE_RATE=1)
+    def test_stats_collected(self):
+        for _ in range(3):
+            cache.clear()
+            self.client.get(f"/books/{self.book.slug}")
+        self.client.get(f"/releases/{self.book.narrations.first().date.year}")
+
+        report = query_stats.get_report()
+        self.assertEqual(
+            {"book-detail-page", "releases/<int:year>"}, set(report.keys())
+        )
+        stats = report["book-detail-page"]
+        self.assertEqual(3, stats["samples"])
+        self.assertGreater(stats["queries"][50], 0)
+        self.assertGreater(stats["template_time_ms"][90], 0)
+        self.assertGreater(stats["response_size"][99], 0)
+
+    @override_settings(QUERY_STATS_SAMPLE_RATE=0)
+    def test_not_sampled(self):
+        self.client.get(f"/books/{self.book.slug}")
+        self.assertEqual({}, query_stats.get_report())
+
+    def test_concurrent_flushes_keep_samples(self):
+        stats = query_stats.RequestStats()
+        query_stats.record("view", stats)
+        query_stats.flush()
+        # Another instance read the slot counter before it was incremented.
+        cache.set(query_stats._slots_key("view"), 0, timeout=None)
+        query_stats.record("view", stats)
+        query_stats.flush()
+        self.assertEqual(2, query_stats.get_report()["view"]["samples"])
@@ -0,0 +1,229 @@
+import tempfile
+from unittest.mock import MagicMock, patch
+
+from algoliasearch.exceptions import AlgoliaUnreachableHostException
+from django.core.cache import cache
+from django.core.files.storage import default_storage
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+
+from books import models, search
+from books.search_engine import SearchEngine
+from books.tests.fake_data import FakeData
+
+
+# Local cache so that cache queries are not counted.
+@override_settings(
+    ALGOLIA_APPLICATION_ID="",
+    CACHES={"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}},
+)
+class SearchTests(TestCase):
+    """Tests search page served by the local index when Algolia is unavailable."""
+
+    def setUp(self):
+        super().setUp()
+        media_root = tempfile.TemporaryDirectory()
+        self.addCleanup(media_root.cleanup)
+        settings_override = override_settings(MEDIA_ROOT=media_root.name)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        cache.clear()
+        search._breaker.update(failures=0, open_until=float("-inf"))
+        search._local_index.update(version=None, engine=None)
+        self.fake_data = FakeData()
+        self.book = self.fake_data.create_book_with_single_narration(
+            title="Сотнікаў",
+            authors=[self.fake_data.person_ales],
+            narrators=[self.fake_data.person_bela],
+            publishers=[self.fake_data.publisher_audiobooksby],
+        )
+        search.save_local_index(search.build_records())
+
+    def tearDown(self):
+        super().tearDown()
+        self.fake_data.cleanup()
+
+    def search_results(self, query: str) -> list[tuple[str, str]]:
+        response = self.client.get("/search", {"query": query})
+        self.assertEqual(200, response.status_code)
+        return [
+            (
+                result["type"],
+                str(getattr(result["object"], "book", result["object"]).uuid),
+            )
+            for result in response.context["results"]
+        ]
+
+    def test_finds_books_people_and_publishers(self):
+        self.assertEqual([("book", str(self.book.uuid))], self.search_results("сотн"))
+        self.assertEqual(
+            [("book", str(self.book.uuid))], self.search_results("Sotnikaŭ")
+        )
+        self.assertIn(
+            ("person", str(self.fake_data.person_bela.uuid)),
+            self.search_results(self.fake_data.person_bela.name),
+        )
+        self.assertEqual(
+            [
+                ("publisher", str(self.fake_data.publisher_audiobooksby.uuid)),
+                ("book", str(self.book.uuid)),
+            ],
+            self.search_results(self.fake_data.publisher_audiobooksby.name),
+        )
+
+    def test_hidden_books_are_not_found(self):
+        self.book.status = models.BookStatus.HIDDEN
+        self.book.save()
+        search.save_local_index(search.build_records())
+        self.assertEqual([], self.search_results("сотн"))
+        # Publisher doesn't have other books.
+        self.assertEqual(
+            [], self.search_results(self.fake_data.publisher_audiobooksby.name)
+        )
+
+    def test_number_of_queries_does_not_depend_on_results(self):
+        self.search_results("кніга")
+
+        def count_queries():
+            with CaptureQueriesContext(connection) as context:
+                self.search_results("кніга")
+            return len(context.captured_queries)
+
+        for i in range(2):
+            self.fake_data.create_book_with_single_narration(
+                title=f"Кніга {i}",
+                authors=[self.fake_data.person_viktar],
+                publishers=[self.fake_data.publisher_audiobooksby],
+            )
+        search.save_local_index(search.build_records())
+        queries = count_queries()
+        for i in range(2, 6):
+            self.fake_data.create_book_with_single_narration(
+                title=f"Кніга {i}",
+                authors=[self.fake_data.person_viktar],
+                publishers=[self.fake_data.publisher_audiobooksby],
+            )
+        search.save_local_index(search.build_records())
+        self.assertEqual(queries, count_queries())
+
+    def test_index_files_are_versioned(self):
+        first = models.SharedState.objects.get_value(search.LOCAL_INDEX_VERSION_KEY)
+        for _ in range(3):
+            search.save_local_index(search.build_records())
+        current = models.SharedState.objects.get_value(search.LOCAL_INDEX_VERSION_KEY)
+        files = default_storage.listdir("")[1]
+        # The current and the previous index.
+        self.assertEqual(2, len(files))
+        self.assertIn(search._local_index_file(current), files)
+        self.assertNotIn(search._local_index_file(first), files)
+
+    def test_index_not_built_on_request(self):
+        models.SharedState.objects.all().delete()
+        cache.clear()
+        search._local_index.update(version=None, engine=None)
+        with patch.object(search, "build_records") as build_records:
+            self.assertEqual([], self.search_results("сотн"))
+        build_records.assert_not_called()
+
+    def test_previous_index_used_when_current_is_missing(self):
+        self.assertEqual([("book", str(self.book.uuid))], self.search_results("сотн"))
+        models.SharedState.objects.set_value(
+            search.LOCAL_INDEX_VERSION_KEY, "20000101000000000000-missing"
+        )
+        self.assertEqual([("book", str(self.book.uuid))], self.search_results("сотн"))
+
+    @override_settings(SEARCH_BACKEND="local")
+    def test_algolia_used_without_local_index(self):
+        models.SharedState.objects.all().delete()
+        cache.clear()
+        search._local_index.update(version=None, engine=None)
+        algolia_index = MagicMock()
+        algolia_index.search.return_value = {
+            "hits": [{"objectID": str(self.book.uuid), "model": "book"}]
+        }
+        with patch.object(search, "_get_algolia_index", return_value=algolia_index):
+            self.assertEqual(
+                [("book", str(self.book.uuid))], self.search_results("сотн")
+            )
+
+    def test_circuit_breaker(self):
+        algolia_index = MagicMock()
+        algolia_index.search.side_effect = AlgoliaUnreachableHostException(
+            "Unreachable hosts"
+        )
+        with patch.object(search, "_get_algolia_index", return_value=algolia_index):
+            for _ in range(search.CIRCUIT_BREAKER_FAILURES + 2):
+                self.assertEqual(
+                    [("book", str(self.book.uuid))], self.search_results("сотн")
+                )
+        self.assertEqual(
+            search.CIRCUIT_BREAKER_FAILURES, algolia_index.search.call_count
+        )
+
+
+class SearchEngineTests(TestCase):
+    """Tests matching and ranking of the local search index."""
+
+    def setUp(self):
+        super().setUp()
+        records = [
+            {
+                "objectID": "sotnikau",
+                "model": "book",
+                "title": "Сотнікаў",
+                "title_ru": "Сотников",
+                "title_lac": "Sotnikaŭ",
+                "authors": ["Васіль Быкаў"],
+                "authors_ru": ["Василь Быков"],
+                "authors_lac": ["Vasil Bykaŭ"],
+            },
+            {
+                "objectID": "bykau",
+                "model": "person",
+                "name": "Васіль Быкаў",
+                "name_ru": "Василь Быков",
+                "name_lac": "Vasil Bykaŭ",
+            },
+            {
+                "objectID": "znak-biady",
+                "model": "book",
+                "title": "Знак бяды",
+                "title_ru": "Знак беды",
+                "title_lac": "Znak biady",
+                "authors": ["Васіль Быкаў"],
+                "authors_ru": ["Василь Быков"],
+                "authors_lac": ["Vasil Bykaŭ"],
+            },
+            {
+                "objectID": "znaki",
+                "model": "book",
+                "title": "Знакі",
+            },
+        ]
+        # Serialized and loaded back to test the format as well.
+        self.engine = SearchEngine.from_bytes(SearchEngine.build(records).to_bytes())
+
+    def search(self, query: str) -> list[str]:
+        return [hit["objectID"] for hit in self.engine.search(query, limit=10)]
+
+    def test_matching(self):
+        self.assertEqual(["sotnikau"], self.search("Сотнікаў"))
+        self.assertEqual(["sotnikau"], self.search("сотников"))
+        self.assertEqual(["sotnikau"], self.search("sotnikau"))
+        self.assertEqual(["znak-biady"], self.search("знак б"))
+        self.assertEqual([], self.search("бяды знак сотнікаў"))
+        self.assertEqual([], self.search(""))
+
+    def test_typos(self):
+        self.assertEqual(["sotnikau"], self.search("сотнікоў"))
+        self.assertEqual(["znak-biady"], self.search("знак бяди"))
+        # Short words must match exactly.
+        self.assertEqual([], self.search("знк"))
+
+    def test_ranking(self):
+        # Person name matches in "name" field, books match in "authors".
+        self.assertEqual(["bykau", "sotnikau", "znak-biady"], self.search("быкаў"))
+        # Exact matches go before prefix matches and typos.
+        self.assertEqual(["znaki", "znak-biady"], self.search("знакі"))
+        self.assertEqual(["znak-biady", "znaki"], self.search("знак"))
@@ -0,0 +1,187 @@
+from unittest.mock import patch
+
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+
+from books import lacinka, models, search, search_sync
+from books.tests.fake_data import FakeData
+
+
+class FakeResponse:
+    def wait(self):
+        return self
+
+
+class FakeAlgoliaIndex:
+    """Keeps objects in memory and records requests, like Algolia index would."""
+
+    def __init__(self):
+        self.objects = {}
+        self.requests = []
+
+    def partial_update_objects(self, objects, request_options=None):
+        self.requests.append(("update", sorted(o["objectID"] for o in objects)))
+        for obj in objects:
+            self.objects.setdefault(obj["objectID"], {}).update(obj)
+        return FakeResponse()
+
+    def delete_objects(self, object_ids):
+        self.requests.append(("delete", sorted(object_ids)))
+        for object_id in object_ids:
+            self.objects.pop(object_id, None)
+        return FakeResponse()
+
+    def replace_all_objects(self, objects):
+        self.requests.append(("replace", sorted(o["objectID"] for o in objects)))
+        self.objects = {obj["objectID"]: obj for obj in objects}
+        return FakeResponse()
+
+
+@override_settings(
+    CACHES={"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}}
+)
+class SearchSyncTests(TestCase):
+    """Tests incremental sync of search records to Algolia."""
+
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        self.fake_data = FakeData()
+        self.index = FakeAlgoliaIndex()
+        self.book = self.fake_data.create_book_with_single_narration(
+            title="Кніга",
+            authors=[self.fake_data.person_ales],
+            publishers=[self.fake_data.publisher_audiobooksby],
+        )
+        search_sync.sync(self.index)
+        self.index.requests.clear()
+
+    def tearDown(self):
+        super().tearDown()
+        self.fake_data.cleanup()
+
+    def test_initial_sync_pushes_all_records(self):
+        self.assertEqual(
+            {
+                str(self.book.uuid),
+                str(self.fake_data.person_ales.uuid),
+                str(self.fake_data.publisher_audiobooksby.uuid),
+            },
+            set(self.index.objects),
+        )
+        self.assertEqual("Kniha", self.index.objects[str(self.book.uuid)]["title_lac"])
+
+    def test_nothing_pushed_without_changes(self):
+        with patch.object(lacinka, "convert") as lacinify:
+            result = search_sync.sync(self.index)
+        self.assertEqual(search_sync.SyncResult(updated=0, deleted=0), result)
+        self.assertEqual([], self.index.requests)
+        lacinify.assert_not_called()
+
+    def test_only_changed_records_pushed(self):
+        self.book.title = "Новая назва"
+        self.book.save()
+        search_sync.sync(self.index)
+        self.assertEqual([("update", [str(self.book.uuid)])], self.index.requests)
+        self.assertEqual(
+            "Novaja nazva", self.index.objects[str(self.book.uuid)]["title_lac"]
+        )
+        self.assertEqual(
+            [{"objectID": str(self.book.uuid), "model": "book"}],
+            search.get_local_index().search("новая", 10),
+        )
+
+    def test_hidden_objects_deleted(self):
+        self.book.status = models.BookStatus.HIDDEN
+        self.book.save()
+        search_sync.sync(self.index)
+        self.assertEqual(
+            [
+                (
+                    "delete",
+                    sorted(
+                        [
+                            str(self.book.uuid),
+                            str(self.fake_data.person_ales.uuid),
+                            str(self.fake_data.publisher_audiobooksby.uuid),
+                        ]
+                    ),
+                )
+            ],
+            self.index.requests,
+        )
+        self.assertEqual({}, self.index.objects)
+        self.assertEqual(0, models.SearchRecord.objects.count())
+
+    def test_records_built_with_fixed_number_of_queries(self):
+        for i in range(3):
+            self.fake_data.create_book_with_single_narration(
+                title=f"Кніга {i}",
+                authors=[self.fake_data.person_bela],
+                narrators=[self.fake_data.person_viktar],
+                translators=[self.fake_data.person_volha],
+                publishers=[self.fake_data.publisher_audiobooksby],
+            )
+        with self.assertNumQueries(4):
+            records = search.build_record_sources()
+        self.assertEqual(
+            {"book": 4, "person": 4, "publisher": 1},
+            {
+                model: sum(1 for record in records if record["model"] == model)
+                for model in ["book", "person", "publisher"]
+            },
+        )
+
+    def test_full_sync(self):
+        search_sync.sync(self.index, full=True)
+        self.assertEqual("replace", self.index.requests[0][0])
+        self.assertEqual(3, len(self.index.requests[0][1]))
+        self.assertEqual(3, models.SearchRecord.objects.count())
+
+    def test_changes_request_sync(self):
+        self.assertFalse(search_sync.is_sync_requested())
+        with self.captureOnCommitCallbacks(execute=True):
+            self.book.title = "Новая назва"
+            self.book.save()
+            self.fake_data.person_ales.save()
+        self.assertTrue(search_sync.is_sync_requested())
+
+        search_sync.sync(self.index)
+
+        self.assertFalse(search_sync.is_sync_requested())
+
+    def test_relation_change_requests_sync_once(self):
+        with patch.object(
+            search_sync, "request_sync"
+        ) as request_sync, self.captureOnCommitCallbacks(execute=True):
+            self.book.authors.add(self.fake_data.person_bela)
+        request_sync.assert_called_once_with()
+
+    def test_failed_sync_requested_again(self):
+        search_sync.request_sync()
+        self.book.title = "Новая назва"
+        self.book.save()
+        with patch.object(
+            self.index, "partial_update_objects", side_effect=RuntimeError
+        ), self.assertRaises(RuntimeError):
+            search_sync.sync(self.index)
+        self.assertTrue(search_sync.is_sync_requested())
+
+    @override_settings(ALGOLIA_APPLICATION_ID="app", ALGOLIA_MODIFY_KEY="key")
+    def test_job_syncs_only_if_requested(self):
+        with patch.object(search_sync, "create_index", return_value=self.index):
+            self.assertEqual(
+                204, self.client.get("/job/sync_search_changes").status_code
+            )
+            self.assertEqual([], self.index.requests)
+
+            with self.captureOnCommitCallbacks(execute=True):
+                self.book.narrations.first().narrators.add(self.fake_data.person_bela)
+            self.assertEqual(
+                204, self.client.get("/job/sync_search_changes").status_code
+            )
+
+        self.assertEqual(
+            [("update", [str(self.fake_data.person_bela.uuid)])], self.index.requests
+        )
+        self.assertFalse(search_sync.is_sync_requested())
@@ -0,0 +1,166 @@
+from datetime import date
+import tempfile
+from unittest import mock
+from xml.etree import ElementTree
+
+from django.core.cache import cache
+from django.core.files.storage import default_storage
+from django.test import override_settings
+
+from books import sitemap
+from books.models import SharedState
+from books.tests.fake_data import FakeData
+from books.tests.query_budget import QueryBudgetTestCase
+
+NAMESPACES = {"s": "http://www.sitemaps.org/schemas/sitemap/0.9"}
+
+
+class SitemapTests(QueryBudgetTestCase):
+    """Tests generation of sitemaps and serving them."""
+
+    def setUp(self):
+        super().setUp()
+        media_root = tempfile.TemporaryDirectory()
+        self.addCleanup(media_root.cleanup)
+        settings_override = override_settings(MEDIA_ROOT=media_root.name)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        cache.clear()
+        self.fake_data = FakeData()
+        self.book = self.fake_data.create_book_with_single_narration(
+            title="Кніга",
+            authors=[self.fake_data.person_ales],
+            narrators=[self.fake_data.person_bela],
+            tags=[self.fake_data.tag_classics],
+            publishers=[self.fake_data.publisher_audiobooksby],
+            date=date(2023, 5, 1),
+        )
+        sitemap.add_base_url("http://testserver")
+        sitemap.generate_all()
+
+    def tearDown(self):
+        super().tearDown()
+        self.fake_data.cleanup()
+
+    def get_xml(self, url: str) -> ElementTree.Element:
+        response = self.client.get(url)
+        self.assertEqual(200, response.status_code, url)
+        self.assertEqual("application/xml", response["Content-Type"])
+        return ElementTree.fromstring(b"".join(response.streaming_content))
+
+    def get_urls(self) -> dict:
+        """Returns lastmod of each URL in all shards."""
+        urls = {}
+        for shard_url in self.get_xml("/sitemap.xml").findall(
+            "s:sitemap/s:loc", NAMESPACES
+        ):
+            for url in self.get_xml(shard_url.text).findall("s:url", NAMESPACES):
+                lastmod = url.find("s:lastmod", NAMESPACES)
+                urls[url.find("s:loc", NAMESPACES).text] = (
+                    lastmod.text if lastmod is not None else None
+                )
+        return urls
+
+    def test_contains_pages_with_lastmod(self):
+        urls = self.get_urls()
+        self.assertIn("http://testserver/", urls)
+        self.assertIn("http://testserver/catalog", urls)
+        self.assertIn("http://testserver/articles/lacinka", urls)
+        self.assertEqual(
+            "2023-05-01", urls[f"http://testserver/books/{self.book.slug}"]
+        )
+        for person in [self.fake_data.person_ales, self.fake_data.person_bela]:
+            self.assertEqual(
+                "2023-05-01", urls[f"http://testserver/person/{person.slug}"]
+            )
+        self.assertEqual(
+            "2023-05-01",
+            urls[f"http://testserver/catalog/{self.fake_data.tag_classics.slug}"],
+        )
+        self.assertEqual(
+            "2023-05-01",
+            urls[
+                f"http://testserver/publisher/{self.fake_data.publisher_audiobooksby.slug}"
+            ],
+        )
+
+    def test_skips_people_without_active_books(self):
+        urls = self.get_urls()
+        self.assertNotIn(
+            f"http://testserver/person/{self.fake_data.person_volha.slug}", urls
+        )
+
+    def test_sharded(self):
+        with mock.patch.object(sitemap, "SHARD_SIZE", 3):
+            sitemap.generate_all()
+            shards = self.get_xml("/sitemap.xml").findall("s:sitemap", NAMESPACES)
+            urls = self.get_urls()
+        self.assertEqual((len(urls) + 2) // 3, len(shards))
+        self.assertEqual(
+            404, self.client.get(f"/sitemap-{len(shards)}.xml").status_code
+        )
+
+    def test_served_without_queries(self):
+        self.get_urls()
+        self.assertWithinQueryBudget("/sitemap.xml")
+        self.assertWithinQueryBudget("/sitemap-0.xml")
+
+    def test_not_modified(self):
+        etag = self.client.get("/sitemap.xml")["ETag"]
+        response = self.client.get("/sitemap.xml", HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(304, response.status_code)
+
+    def test_regenerated_by_job(self):
+        self.get_urls()
+        etag = self.client.get("/sitemap.xml")["ETag"]
+        book = self.fake_data.create_book_with_single_narration(title="Новая кніга")
+
+        self.assertEqual(204, self.client.get("/job/generate_sitemap").status_code)
+
+        self.assertNotEqual(etag, self.client.get("/sitemap.xml")["ETag"])
+        self.assertIn(f"http://testserver/books/{book.slug}", self.get_urls())
+
+    def test_old_files_deleted(self):
+        self.get_urls()
+        for _ in range(3):
+            sitemap.generate_all()
+        # Index and a shard of the current and the previous versions.
+        self.assertEqual(4, len(default_storage.listdir("")[1]))
+
+    def test_new_base_url_generated_on_first_request(self):
+        SharedState.objects.all().delete()
+        cache.clear()
+        for name in default_storage.listdir("")[1]:
+            default_storage.delete(name)
+
+        self.assertIn(f"http://testserver/books/{self.book.slug}", self.get_urls())
+        self.assertEqual(
+            ["http://testserver"], SharedState.objects.get_value(sitemap.BASE_URLS_KEY)
+        )
+
+    def test_concurrent_first_request_not_generating(self):
+        SharedState.objects.all().delete()
+        cache.clear()
+        for name in default_storage.listdir("")[1]:
+            default_storage.delete(name)
+        cache.add(f"sitemap:generating:{sitemap._key('http://testserver')}", True)
+
+        response = self.client.get("/sitemap.xml")
+
+        self.assertEqual(503, response.status_code)
+        self.assertIn("Retry-After", response)
+
+    def test_current_version_found_in_storage(self):
+        # The previous version is kept in storage as well.
+        sitemap.generate_all()
+        etag = self.client.get("/sitemap.xml")["ETag"]
+        SharedState.objects.filter(name__startswith="sitemap:current:").delete()
+        cache.clear()
+
+        self.assertEqual(etag, self.client.get("/sitemap.xml")["ETag"])
+        self.assertIn(f"http://testserver/books/{self.book.slug}", self.get_urls())
+
+    def test_sitemap_txt_redirects(self):
+        response = self.client.get("/sitemap.txt")
+        self.assertEqual(301, response.status_code)
+        self.assertEqual("/sitemap.xml", response["Location"])
@@ -1,4 +1,5 @@
 from django.urls import include, path
+from django.views.generic import RedirectView
 from books.views import stats, catalog, book, person, support, articles, publisher
 
 urlpatterns = [
@@ -22,17 +23,29 @@ urlpatterns = [
     path("search", support.search, name="search"),
     path("404", support.page_not_found),
     path("robots.txt", support.robots_txt),
-    path("sitemap.txt", support.sitemap),
+    path("sitemap.txt", RedirectView.as_view(url="/sitemap.xml", permanent=True)),
+    path("sitemap.xml", support.sitemap_index),
+    path("sitemap-<int:shard>.xml", support.sitemap_shard),
     path("data.json", support.get_data_json),
+    path("data.bin", support.get_data_binary),
     path("job/push_data_to_algolia", support.push_data_to_algolia),
+    path("job/sync_search_changes", support.sync_search_changes),
+    path("job/build_search_index", support.build_search_index),
     # /_ah/warmup - App Engine specific endpoint to pre-warm application for traffic
     # https://cloud.google.com/appengine/docs/standard/configuring-warmup-requests?tab=python#enabling_warmup_requests
-    path("_ah/warmup", support.generate_data_json),
+    path("_ah/warmup", support.warmup),
     path("job/generate_data_json", support.generate_data_json),
-    path("job/update_read_by_author_tag", support.update_read_by_author_tag),
+    path("job/update_derived_tags", support.update_derived_tags),
+    path("job/generate_sitemap", support.generate_sitemap),
     path("job/sync_image_cache", support.sync_image_cache),
     path("api/markdown_preview", support.markdown_to_html),
     path("api/livelib_books", support.get_livelib_books),
     path("api/convert_orthography", support.convert_orthography),
+    path("api/catalog", catalog.catalog_json, name="catalog-json"),
+    path(
+        "api/catalog/<slug:tag_slug>",
+        catalog.catalog_json,
+        name="catalog-json-for-tag",
+    ),
     path("i18n/", include("django.conf.urls.i18n")),
 ]
@@ -2,23 +2,45 @@
 Views that display information about a particular book.
 """
 
+from django.db.models import Prefetch
 from django.http import HttpRequest, HttpResponse
 from django.shortcuts import render, get_object_or_404
 
-from books.models import Book, Language
+from books import page_cache
+from books.models import Book, Language, Link, Narration
+from books.views.utils import Cover
 
 
+@page_cache.cached_page()
 def book_detail(request: HttpRequest, slug: str) -> HttpResponse:
     """Detailed book page"""
-    book = get_object_or_404(Book, slug=slug)
+    # Everything shown on the page is prefetched so that the number of queries
+    # doesn't depend on number of narrations.
+    # Order narrations - first Belarusian then Russian. Within each
+    # language show newer narrations first.
+    narrations_query = Narration.objects.order_by("language", "-date").prefetch_related(
+        "narrators",
+        "translators",
+        "publishers",
+        Prefetch(
+            "links",
+            queryset=Link.objects.select_related("url_type")
+            .filter(url_type__disabled=False)
+            .order_by("-url_type__weight"),
+        ),
+    )
+    book = get_object_or_404(
+        Book.objects.prefetch_related(
+            "authors", "tag", Prefetch("narrations", queryset=narrations_query)
+        ),
+        slug=slug,
+    )
 
     # Determine if all narrations for the given book are of the same
     # language. That determine whether we show language once at the top
     # or separately for each narration.
     single_language = None
-    # Order narrations - first Belarusian then Russian. Within each
-    # language show newer narrations first.
-    narrations = book.narrations.order_by("language", "-date").all()
+    narrations = list(book.narrations.all())
     if len(narrations) > 0:
         single_language = narrations[0].language
         for narration in narrations:
@@ -29,10 +51,37 @@ def book_detail(request: HttpRequest, slug: str) -> HttpResponse:
     context = {
         "book": book,
         "narrations": narrations,
+        "covers": Cover.for_narrations(
+            book, narrations, list(book.authors.all()), "large"
+        ),
         "tags": book.tag.all(),
         "single_language": single_language,
         "show_russian_title": single_language == Language.RUSSIAN,
         "single_narration": len(narrations) == 1,
     }
 
+    page_cache.add_dependencies(
+        request,
+        page_cache.for_book(book.uuid),
+        page_cache.LINK_TYPES,
+        *[page_cache.for_person(person.uuid) for person in book.authors.all()],
+        *[page_cache.for_tag(tag.id) for tag in context["tags"]],
+    )
+    for narration in narrations:
+        page_cache.add_dependencies(
+            request,
+            *[
+                page_cache.for_person(person.uuid)
+                for person in narration.narrators.all()
+            ],
+            *[
+                page_cache.for_person(person.uuid)
+                for person in narration.translators.all()
+            ],
+            *[
+                page_cache.for_publisher(publisher.uuid)
+                for publisher in narration.publishers.all()
+            ],
+        )
+
     return render(request, "books/book-detail.html", context)
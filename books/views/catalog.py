@@ -3,18 +3,38 @@ Views that provide information about collection of books. Usually this is
 a catalog of books of particular genre.
 """
 
-from collections.abc import Iterable
+from collections.abc import Iterable, Iterator
+import json
 import random
+from typing import Dict, List
 
-from django.http import HttpRequest, HttpResponse
-from django.shortcuts import render
+from django.db.models import Count, F, Q, Window, query
+from django.db.models.functions import RowNumber
+from django.http import HttpRequest, HttpResponse, StreamingHttpResponse
+from django.shortcuts import get_object_or_404, render
+from rest_framework.utils.encoders import JSONEncoder
 from django.core.paginator import Paginator, Page
+from books import page_cache, serializers
 from books.constants import MONTHS
 
 from books.templatetags.books_extras import to_human_language
-from books.models import BookStatus, LinkType, Tag, Language, Book, Narration
+from books.models import (
+    BookFacet,
+    BookStatus,
+    LinkType,
+    Tag,
+    Language,
+    Book,
+    Narration,
+)
 
-from .utils import maybe_filter_links, BookForPreview
+from .utils import (
+    maybe_filter_links,
+    BookForPreview,
+    CursorPage,
+    approximate_count,
+    paginate_by_cursor,
+)
 
 TAGS_TO_SHOW_ON_MAIN_PAGE = [
     "Катэгарычна раім",
@@ -23,82 +43,173 @@ TAGS_TO_SHOW_ON_MAIN_PAGE = [
     "Дзецям і падлеткам",
 ]
 
+BOOKS_PER_TAG_ON_MAIN_PAGE = 6
+MYSTERY_BOOK_SLUG = "audyjakniha-niespadziavanka"
+
 BOOKS_PER_PAGE = 16
+MAX_BOOKS_PER_PAGE = 100
+# Number of books loaded from DB at once when streaming catalog as JSON.
+JSON_CHUNK_SIZE = 100
 
 
 def to_books_preview(books: Iterable[Book]) -> Iterable[BookForPreview]:
     """Converts list of books to BookForPreviews where for each book all narrations are shown."""
-    return [BookForPreview(book, book.narrations.all()) for book in books]
+    return [BookForPreview.with_all_narrations(book) for book in books]
 
 
 def with_latest_narration(books: Iterable[Book]) -> Iterable[BookForPreview]:
     """Converts list of books to BookForPreviews where for each book only the latest
     narration is shown."""
-    with_all_narrations = to_books_preview(books)
-    return [
-        BookForPreview(book.book, book.narrations[-1:]) for book in with_all_narrations
-    ]
+    return [BookForPreview.with_latest_narration(book) for book in books]
 
 
-def index(request: HttpRequest) -> HttpResponse:
-    """Index page, starting page"""
-    # Getting all Tags and creating querystring objects for each to pass to template
-    tags_to_render = []
-    books = Book.objects.active_books_ordered_by_date(["authors", "narrations"])
-    for tag in Tag.objects.filter(name__in=TAGS_TO_SHOW_ON_MAIN_PAGE):
-        tags_to_render.append(
+@page_cache.cached_fragment([page_cache.CATALOG])
+def load_index_page_data() -> Dict:
+    """
+    Loads books shown on the index page using fixed number of queries regardless of
+    number of tags shown: top books of each tag are ranked using window function
+    and then all needed books are loaded together.
+    """
+    tags = list(Tag.objects.filter(name__in=TAGS_TO_SHOW_ON_MAIN_PAGE))
+    book_tags = list(
+        Book.tag.through.objects.filter(tag__in=tags, book__status=BookStatus.ACTIVE)
+        .annotate(
+            rank=Window(
+                RowNumber(),
+                partition_by=[F("tag_id")],
+                order_by=[
+                    F("book__latest_narration_date").desc(),
+                    F("book__uuid").desc(),
+                ],
+            ),
+            total_books=Window(Count("book_id"), partition_by=[F("tag_id")]),
+        )
+        .filter(rank__lte=BOOKS_PER_TAG_ON_MAIN_PAGE)
+        .values_list("tag_id", "book_id", "rank", "total_books")
+    )
+    tag_books: Dict[int, List] = {tag.id: [] for tag in tags}
+    total_books: Dict[int, int] = {tag.id: 0 for tag in tags}
+    for tag_id, book_id, rank, total in book_tags:
+        tag_books[tag_id].append((rank, book_id))
+        total_books[tag_id] = total
+
+    recent_books_ids = (
+        Book.objects.active_books_ordered_by_date()
+        .filter(latest_narration_date__isnull=False)
+        .values("uuid")[:BOOKS_PER_TAG_ON_MAIN_PAGE]
+    )
+    books = {
+        book.uuid: book
+        for book in Book.objects.prefetch_related("authors", "narrations").filter(
+            Q(uuid__in=[book_id for _, book_id, _, _ in book_tags])
+            | Q(uuid__in=recent_books_ids)
+            | Q(slug=MYSTERY_BOOK_SLUG)
+        )
+    }
+    # All recent books are among loaded books. And the rest of loaded books are
+    # older than recent ones so sorting them gives the recent books first.
+    recent_books = sorted(
+        (
+            book
+            for book in books.values()
+            if book.status == BookStatus.ACTIVE
+            and book.latest_narration_date is not None
+        ),
+        key=lambda book: (book.latest_narration_date, book.uuid),
+        reverse=True,
+    )[:BOOKS_PER_TAG_ON_MAIN_PAGE]
+    mystery_book = next(
+        (book for book in books.values() if book.slug == MYSTERY_BOOK_SLUG), None
+    )
+    return {
+        "recent_books": with_latest_narration(recent_books),
+        "mystery_book": (
+            with_latest_narration([mystery_book])[0] if mystery_book else None
+        ),
+        "tags_to_render": [
             {
                 "name": tag.name,
                 "slug": tag.slug,
-                "books": with_latest_narration(books.filter(tag=tag.id)[:6]),
-                "total_books": books.filter(tag=tag.id).count(),
+                "books": with_latest_narration(
+                    books[book_id] for _, book_id in sorted(tag_books[tag.id])
+                ),
+                "total_books": total_books[tag.id],
             }
-        )
+            for tag in tags
+        ],
+    }
 
-    mystery_book = Book.objects.filter(slug="audyjakniha-niespadziavanka").first()
-    if mystery_book:
-        new_books = list(books[:5])
-        new_books.insert(random.randint(0, 5), mystery_book)
-    else:
-        new_books = books[:6]
+
+def index(request: HttpRequest) -> HttpResponse:
+    """Index page, starting page"""
+    # Only data is cached as the mystery book is placed randomly on each request.
+    data = load_index_page_data()
+
+    new_books = list(data["recent_books"])
+    if data["mystery_book"]:
+        new_books = new_books[: BOOKS_PER_TAG_ON_MAIN_PAGE - 1]
+        new_books.insert(
+            random.randint(0, BOOKS_PER_TAG_ON_MAIN_PAGE - 1), data["mystery_book"]
+        )
     context = {
-        "recently_added_books": with_latest_narration(new_books),
-        "tags_to_render": tags_to_render,
+        "recently_added_books": new_books,
+        "tags_to_render": data["tags_to_render"],
     }
 
     return render(request, "books/index.html", context)
 
 
-def get_query_params_without(request: HttpRequest, param: str) -> str:
-    """Returns query string without given param"""
+def get_query_params_without(request: HttpRequest, *params_to_remove: str) -> str:
+    """Returns query string without given params"""
     params = request.GET.copy()
-    if param in params:
-        params.pop(param)
+    for param in params_to_remove:
+        if param in params:
+            params.pop(param)
     if len(params) == 0:
         return ""
     return "?" + params.urlencode()
 
 
-def catalog(request: HttpRequest, tag_slug: str = "") -> HttpResponse:
-    """Catalog page for specific tag or all books"""
-
-    page = request.GET.get("page")
-    tags = Tag.objects.all()
-    filtered_books = maybe_filter_links(
-        Book.objects.active_books_ordered_by_date(["authors", "narrations"]), request
-    ).distinct()
+def get_books_per_page(request: HttpRequest) -> int:
+    """
+    Returns number of books per page requested via `limit` param. The number is
+    capped so that a single request can't render the whole catalog. Use
+    catalog_json to fetch large number of books.
+    """
+    try:
+        limit = int(request.GET.get("limit", 0))
+    except ValueError:
+        limit = 0
+    return min(max(limit, BOOKS_PER_PAGE), MAX_BOOKS_PER_PAGE)
 
-    tag = None
-    if tag_slug:
-        # get selected tag id
-        tag = tags.filter(slug=tag_slug).first()
-        # pagination for the books by tag
-        filtered_books = filtered_books.filter(tag=tag.id)
 
+def filter_books_by_params(
+    books: query.QuerySet, request: HttpRequest
+) -> query.QuerySet:
+    """
+    Applies catalog filters passed as url params: lang, paid and links. Filters are
+    resolved using precomputed BookFacet table.
+    """
+    books = maybe_filter_links(books, request)
     lang = request.GET.get("lang")
     if lang:
-        filtered_books = filtered_books.filter(narrations__language=lang.upper())
+        books = BookFacet.objects.filter_books(
+            books, [[BookFacet.for_language(lang.upper())]]
+        )
+    paid = request.GET.get("paid")
+    if paid is not None:
+        books = BookFacet.objects.filter_books(
+            books, [[BookFacet.for_paid(paid == "true")]]
+        )
+    return books
+
 
+def get_filter_options(request: HttpRequest) -> Dict:
+    """
+    Returns options of the language, price and link filters rendered by
+    _catalog_filters.html. Each option is (value, caption, is_selected) tuple.
+    """
+    lang = request.GET.get("lang")
     language_options = [("", "усе", lang is None)]
     for available_lang in Language.values:
         language_options.append(
@@ -110,11 +221,6 @@ def catalog(request: HttpRequest, tag_slug: str = "") -> HttpResponse:
         )
 
     paid = request.GET.get("paid")
-    if paid is not None:
-        filtered_books = filtered_books.filter(
-            narrations__paid=(request.GET.get("paid") == "true")
-        )
-
     price_options = [
         ("", "усе", paid is None),
         ("true", "платныя", paid == "true"),
@@ -122,16 +228,84 @@ def catalog(request: HttpRequest, tag_slug: str = "") -> HttpResponse:
     ]
 
     link = request.GET.get("links")
-    link_options = [("", "усе", lang is None)]
+    link_options = [("", "усе", link is None)]
     for available_link in LinkType.objects.filter(disabled=False).order_by("caption"):
         link_options.append(
             (available_link.name, available_link.caption, link == available_link.name)
         )
+    return {
+        "language_options": language_options,
+        "price_options": price_options,
+        "link_options": link_options,
+    }
 
-    paginator = Paginator(filtered_books, BOOKS_PER_PAGE)
-    books_per_page = max(int(request.GET.get("limit", 0)), BOOKS_PER_PAGE)
-    paginator = Paginator(filtered_books, books_per_page)
-    paged_books: Page = paginator.get_page(page)
+
+@page_cache.cached_page(
+    params=["page", "lang", "paid", "links", "limit", "after", "before"]
+)
+def catalog(request: HttpRequest, tag_slug: str = "") -> HttpResponse:
+    """Catalog page for specific tag or all books"""
+
+    page = request.GET.get("page")
+    tags = list(Tag.objects.all())
+    # Tag filter is applied last so that the same query can be used to count books
+    # for each tag.
+    filtered_books = filter_books_by_params(
+        Book.objects.active_books_ordered_by_date(["authors", "narrations"]), request
+    )
+
+    facet_counts = BookFacet.objects.counts(filtered_books)
+    for each_tag in tags:
+        each_tag.books_count = facet_counts.get(BookFacet.for_tag(each_tag.id), 0)
+
+    tag = None
+    if tag_slug:
+        # get selected tag id
+        tag = next((t for t in tags if t.slug == tag_slug), None)
+        # pagination for the books by tag
+        filtered_books = BookFacet.objects.filter_books(
+            filtered_books, [[BookFacet.for_tag(tag.id)]]
+        )
+
+    books_per_page = get_books_per_page(request)
+    if "after" in request.GET or "before" in request.GET:
+        # Cursor mode: /catalog?after= is the first page, next/prev links carry
+        # position of the last/first book on the page.
+        cursor_page = paginate_by_cursor(
+            filtered_books,
+            request.GET.get("after"),
+            request.GET.get("before"),
+            books_per_page,
+        )
+        paged_books = cursor_page.books
+        page_obj = None
+        related_pages = get_cursor_related_pages(request, cursor_page)
+        total_books = approximate_count(filtered_books)
+        query_params = get_query_params_without(request, "after", "before")
+        query_params += ("&" if query_params else "?") + "after="
+    else:
+        paginator = Paginator(filtered_books, books_per_page)
+        paged_books = page_obj = paginator.get_page(page)
+        related_pages = get_page_related_pages(request, paged_books)
+        total_books = paginator.count
+        query_params = get_query_params_without(request, "page")
+
+    context = {
+        "books": to_books_preview(paged_books),
+        "paginator": page_obj,
+        "total_books": total_books,
+        "related_pages": related_pages,
+        "selected_tag": tag,
+        "tags": tags,
+        "query_params": query_params,
+        **get_filter_options(request),
+    }
+    page_cache.add_dependencies(request, page_cache.CATALOG, page_cache.LINK_TYPES)
+    return render(request, "books/catalog.html", context)
+
+
+def get_page_related_pages(request: HttpRequest, paged_books: Page) -> Dict:
+    """Returns links to first/prev/next/last pages for page-number pagination."""
 
     def related_page(page: int) -> str:
         params = request.GET.copy()
@@ -148,28 +322,88 @@ def catalog(request: HttpRequest, tag_slug: str = "") -> HttpResponse:
         related_pages["first"] = related_page(1)
         related_pages["prev"] = related_page(paged_books.previous_page_number())
     if paged_books.has_next():
-        related_pages["last"] = related_page(paginator.num_pages)
+        related_pages["last"] = related_page(paged_books.paginator.num_pages)
         related_pages["next"] = related_page(paged_books.next_page_number())
+    return related_pages
 
-    context = {
-        "books": to_books_preview(paged_books),
-        "paginator": paged_books,
-        "related_pages": related_pages,
-        "selected_tag": tag,
-        "tags": tags,
-        "query_params": get_query_params_without(request, "page"),
-        "language_options": language_options,
-        "price_options": price_options,
-        "link_options": link_options,
+
+def get_cursor_related_pages(request: HttpRequest, cursor_page: CursorPage) -> Dict:
+    """
+    Returns links to first/prev/next pages for cursor pagination. There is no link
+    to the last page as it's unknown without scanning all books.
+    """
+
+    def related_page(param: str, cursor: str) -> str:
+        params = request.GET.copy()
+        for cursor_param in ["after", "before"]:
+            if cursor_param in params:
+                params.pop(cursor_param)
+        params[param] = cursor
+        return request.path + "?" + params.urlencode()
+
+    related_pages = {
+        "has_other": cursor_page.prev_cursor is not None
+        or cursor_page.next_cursor is not None,
     }
-    return render(request, "books/catalog.html", context)
+    if cursor_page.prev_cursor is not None:
+        related_pages["first"] = related_page("after", "")
+        related_pages["prev"] = related_page("before", cursor_page.prev_cursor)
+    if cursor_page.next_cursor is not None:
+        related_pages["next"] = related_page("after", cursor_page.next_cursor)
+    return related_pages
+
+
+def catalog_json(request: HttpRequest, tag_slug: str = "") -> StreamingHttpResponse:
+    """
+    Returns all books matching catalog filters as JSON list. Each book has the same
+    format as books in data.json. Books are loaded from DB and serialized in chunks
+    so that the whole catalog is never kept in memory.
+    """
+    books = filter_books_by_params(
+        Book.objects.active_books_ordered_by_date(
+            [
+                "authors",
+                "tag",
+                "narrations__links",
+                "narrations__narrators",
+                "narrations__translators",
+                "narrations__publishers",
+            ]
+        ),
+        request,
+    )
+    if tag_slug:
+        tag = get_object_or_404(Tag, slug=tag_slug)
+        books = BookFacet.objects.filter_books(books, [[BookFacet.for_tag(tag.id)]])
+
+    def generate_json() -> Iterator[str]:
+        yield "["
+        for i, book in enumerate(books.iterator(chunk_size=JSON_CHUNK_SIZE)):
+            if i > 0:
+                yield ","
+            yield json.dumps(
+                serializers.BookSimpleSerializer(book).data,
+                ensure_ascii=False,
+                cls=JSONEncoder,
+            )
+        yield "]"
+
+    return StreamingHttpResponse(
+        generate_json(),
+        content_type="application/json",
+        headers={
+            # Allow accessing catalog from JS.
+            "Access-Control-Allow-Origin": "*",
+        },
+    )
 
 
+@page_cache.cached_page()
 def releases(request: HttpRequest, year: int, month: int = 0) -> HttpResponse:
     """Returns books released in a given year or month, if month is not 0."""
     if year < 2000 or year > 2100 or month < 0 or month > 12:
         return render(request, "404.html", status=404)
-    narrations = Narration.objects.prefetch_related("book").filter(
+    narrations = Narration.objects.prefetch_related("book__authors").filter(
         date__year=year,
         book__status=BookStatus.ACTIVE,
     )
@@ -187,4 +421,5 @@ def releases(request: HttpRequest, year: int, month: int = 0) -> HttpResponse:
         ],
         "title": title,
     }
+    page_cache.add_dependencies(request, page_cache.CATALOG)
     return render(request, "books/releases.html", context)
@@ -4,60 +4,71 @@ Views that display information about a particular person.
 
 from django.http import HttpRequest, HttpResponse
 from django.shortcuts import render, get_object_or_404
-from django.db.models import Prefetch, query
+from django.db.models import Exists, OuterRef, Prefetch, Q, query
 
+from books import page_cache
 from books.models import Person, Narration, Book
 from books.templatetags.books_extras import gender
 
 from .utils import maybe_filter_links, BookForPreview
 
 
-def get_active_books(books: query.QuerySet, request: HttpRequest) -> query.QuerySet:
+def get_books_with_roles(person: Person, request: HttpRequest) -> query.QuerySet:
+    """
+    Returns all active books the person authored, narrated or translated, in a
+    single query. Each book is annotated with is_author, is_narrator and
+    is_translator flags so that books can be split by role without extra
+    queries.
+    """
+    is_author = Exists(
+        Book.authors.through.objects.filter(book=OuterRef("pk"), person=person)
+    )
+    is_narrator = Exists(
+        Narration.narrators.through.objects.filter(
+            narration__book=OuterRef("pk"), person=person
+        )
+    )
+    is_translator = Exists(
+        Narration.translators.through.objects.filter(
+            narration__book=OuterRef("pk"), person=person
+        )
+    )
     # order narrations by date so that the newest one last so that we can render
     # cover stack correctly with the latest bein on top.
     narrations_by_date = Prefetch(
-        "narrations", queryset=Narration.objects.order_by("date")
+        "narrations",
+        queryset=Narration.objects.order_by("date").prefetch_related(
+            "narrators", "translators"
+        ),
     )
-    active_books = books.prefetch_related(narrations_by_date)
-    return maybe_filter_links(active_books, request).distinct()
+    books = (
+        Book.objects.active_books_ordered_by_date()
+        .prefetch_related(narrations_by_date)
+        .annotate(
+            is_author=is_author, is_narrator=is_narrator, is_translator=is_translator
+        )
+        .filter(Q(is_author=True) | Q(is_narrator=True) | Q(is_translator=True))
+    )
+    return maybe_filter_links(books, request)
 
 
+@page_cache.cached_page(params=["links"])
 def person_detail(request: HttpRequest, slug: str) -> HttpResponse:
     """Detailed book page"""
 
-    # Prefetch all books in the relationships
-    person = get_object_or_404(
-        Person.objects.prefetch_related(
-            "books_authored", "narrations", "narrations_translated"
-        ),
-        slug=slug,
-    )
+    person = get_object_or_404(Person, slug=slug)
 
-    narration_ids = person.narrations.values_list("uuid", flat=True)
-    narrated_books = Book.objects.active_books_ordered_by_date().filter(
-        narrations__uuid__in=narration_ids
-    )
-    narrated_books = get_active_books(narrated_books, request)
-
-    narrations_translated_ids = person.narrations_translated.values_list(
-        "uuid", flat=True
-    )
-    translated_books = Book.objects.active_books_ordered_by_date().filter(
-        narrations__uuid__in=narrations_translated_ids
-    )
-    translated_books = get_active_books(translated_books, request)
-
-    authored_books = Book.objects.active_books_ordered_by_date().filter(
-        authors__uuid=person.uuid
-    )
-    authored_books = get_active_books(authored_books, request)
+    books = list(get_books_with_roles(person, request))
+    authored_books = [book for book in books if book.is_author]
+    translated_books = [book for book in books if book.is_translator]
+    narrated_books = [book for book in books if book.is_narrator]
 
     verbs_for_title = []
-    if authored_books.count() > 0:
+    if authored_books:
         verbs_for_title.append("напіса")
-    if translated_books.count() > 0:
+    if translated_books:
         verbs_for_title.append("перакла")
-    if narrated_books.count() > 0:
+    if narrated_books:
         verbs_for_title.append("агучы")
     # Edge case, when person has no books. It might happen if all books are hidden.
     # Just render "напісала/напісаў" in this case for now.
@@ -85,5 +96,15 @@ def person_detail(request: HttpRequest, slug: str) -> HttpResponse:
         ],
         "verbs_for_title": verbs_for_title_joined,
     }
+    page_cache.add_dependencies(
+        request,
+        page_cache.for_person(person.uuid),
+        *[
+            dependency
+            for key in ["authored_books", "translated_books", "narrated_books"]
+            for preview in context[key]
+            for dependency in preview.page_cache_dependencies()
+        ],
+    )
 
     return render(request, "books/person.html", context)
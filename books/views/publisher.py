@@ -2,25 +2,79 @@
 Views that display information about a particular publisher.
 """
 
+from django.core.paginator import Paginator
+from django.db.models import Exists, OuterRef, query
 from django.http import HttpRequest, HttpResponse
 from django.shortcuts import render, get_object_or_404
 
-from books.models import BookStatus, Publisher
+from books import page_cache
+from books.models import BookStatus, Link, Narration, Publisher
+from books.views.catalog import (
+    BOOKS_PER_PAGE,
+    get_filter_options,
+    get_page_related_pages,
+)
 from books.views.utils import BookForPreview
 
 
+def filter_narrations_by_params(
+    narrations: query.QuerySet, request: HttpRequest
+) -> query.QuerySet:
+    """
+    Applies the same filters as the catalog: lang, paid and links. Unlike the
+    catalog, filters are applied to narrations rather than books, as publisher
+    page lists narrations.
+    """
+    lang = request.GET.get("lang")
+    if lang:
+        narrations = narrations.filter(language=lang.upper())
+    paid = request.GET.get("paid")
+    if paid is not None:
+        narrations = narrations.filter(paid=paid == "true")
+    links = request.GET.get("links")
+    if links is not None:
+        narrations = narrations.filter(
+            Exists(
+                Link.objects.filter(
+                    narration=OuterRef("pk"), url_type__name__in=links.split(",")
+                )
+            )
+        )
+    return narrations
+
+
+@page_cache.cached_page(params=["page", "lang", "paid", "links"])
 def publisher_detail(request: HttpRequest, slug: str) -> HttpResponse:
     """Detailed publisher page"""
 
     publisher = get_object_or_404(Publisher, slug=slug)
-    narrations = publisher.narrations.order_by("-date")
+    narrations = filter_narrations_by_params(
+        Narration.objects.filter(publishers=publisher, book__status=BookStatus.ACTIVE)
+        .select_related("book")
+        .prefetch_related("book__authors")
+        .order_by("-date", "-uuid"),
+        request,
+    )
+    paginator = Paginator(narrations, BOOKS_PER_PAGE)
+    paged_narrations = paginator.get_page(request.GET.get("page"))
     books = [
-        BookForPreview(narration.book, [narration])
-        for narration in narrations
-        if narration.book.status == BookStatus.ACTIVE
+        BookForPreview(narration.book, [narration]) for narration in paged_narrations
     ]
     context = {
         "publisher": publisher,
         "books": books,
+        "paginator": paged_narrations,
+        "related_pages": get_page_related_pages(request, paged_narrations),
+        **get_filter_options(request),
     }
+    page_cache.add_dependencies(
+        request,
+        page_cache.for_publisher(publisher.uuid),
+        page_cache.LINK_TYPES,
+        *[
+            dependency
+            for preview in books
+            for dependency in preview.page_cache_dependencies()
+        ],
+    )
     return render(request, "books/publisher.html", context)
@@ -5,30 +5,44 @@ methods such as sitemap or robots.txt.
 
 import json
 import logging
-from typing import Dict, List, Union
-from uuid import UUID
+from typing import Dict, List, Optional, Union
 from django import views
-from django.conf import settings
-from django.http import HttpRequest, HttpResponse, HttpResponseBadRequest
+from django.db.models import Prefetch
+from django.http import (
+    FileResponse,
+    HttpRequest,
+    HttpResponse,
+    HttpResponseBadRequest,
+    JsonResponse,
+)
 from django.views.decorators.cache import cache_control
-from django.views.decorators.http import require_POST, require_GET
+from django.views.decorators.http import condition, require_POST, require_GET
 from django.views.decorators.csrf import csrf_exempt
 from django.shortcuts import render
 from django.core.files.storage import default_storage
-from django.core.files.base import ContentFile
 from django.core.management import call_command
-from django.urls import reverse
+from django.utils.cache import add_never_cache_headers
 from django.utils.html import escape
-from algoliasearch.search_client import SearchClient
 from markdownify.templatetags.markdownify import markdownify
 from books.thirdparty.livelibru import search_books_with_reviews, DataclassJSONEncoder
 
-from books import serializers, image_cache
-from books.models import Book, LinkType, Person, Tag, Publisher
+from books import (
+    data_export,
+    derived_tags,
+    image_cache,
+    search as search_index,
+    sitemap,
+)
+from books.models import (
+    Book,
+    BookStatus,
+    Narration,
+    Person,
+    Publisher,
+)
+from books.views import catalog
 from books.views.utils import BookForPreview
 
-from .articles import ARTICLES
-
 import belorthography
 
 logger = logging.getLogger(__name__)
@@ -39,15 +53,9 @@ def search(request: HttpRequest) -> HttpResponse:
     query = request.GET.get("query")
 
     if query:
-        client = SearchClient.create(
-            settings.ALGOLIA_APPLICATION_ID, settings.ALGOLIA_SEARCH_KEY
-        )
-        index = client.init_index(settings.ALGOLIA_INDEX)
-        # Response:
-        # https://www.algolia.com/doc/guides/building-search-ui/going-further/backend-search/in-depth/understanding-the-api-response/
-        hits = index.search(query, {"hitsPerPage": 100})["hits"]
+        hits = search_index.search(query)
 
-        # Load all models, books and people returned from algolia.
+        # Load all models, books and people returned from search.
         people_ids: List[str] = []
         books_ids: List[str] = []
         publishers_ids: List[str] = []
@@ -62,14 +70,24 @@ def search(request: HttpRequest) -> HttpResponse:
                 logger.warning(
                     "Got unexpected model from search %s", hit["model"], extra=hit
                 )
+        # Models are loaded in batches so that number of queries doesn't depend on
+        # number of hits.
         loaded_models: Dict[str, Union[Person, BookForPreview, Publisher]] = {}
-        for person in Person.objects.all().filter(uuid__in=people_ids):
+        for person in Person.objects.filter(uuid__in=people_ids):
             loaded_models[str(person.uuid)] = person
-        for book in (
-            Book.objects.all().prefetch_related("authors").filter(uuid__in=books_ids)
+        for book in Book.objects.prefetch_related("authors", "narrations").filter(
+            uuid__in=books_ids
         ):
             loaded_models[str(book.uuid)] = BookForPreview.with_all_narrations(book)
-        for publisher in Publisher.objects.all().filter(uuid__in=publishers_ids):
+        publishers = Publisher.objects.prefetch_related(
+            Prefetch(
+                "narrations",
+                queryset=Narration.objects.filter(book__status=BookStatus.ACTIVE)
+                .select_related("book")
+                .prefetch_related("book__authors"),
+            )
+        ).filter(uuid__in=publishers_ids)
+        for publisher in publishers:
             loaded_models[str(publisher.uuid)] = publisher
             for narration in publisher.narrations.all():
                 loaded_models[str(narration.book.uuid)] = BookForPreview(
@@ -86,10 +104,10 @@ def search(request: HttpRequest) -> HttpResponse:
             else:
                 return "unknown_type"
 
-        # Build search result list in the same order as returned by algolia.
+        # Build search result list in the same order as returned by search.
         # So that most relevant are shown first.
-        # Note: Some hits from Algolia may not exist in the database (e.g., if
-        # data was deleted but Algolia index wasn't synced yet), so we skip those.
+        # Note: Some hits may not exist in the database (e.g., if data was deleted
+        # but search index wasn't synced yet), so we skip those.
         search_results = [
             {"type": hit["model"], "object": loaded_models.pop(hit["objectID"])}
             for hit in hits
@@ -97,7 +115,7 @@ def search(request: HttpRequest) -> HttpResponse:
         ]
 
         # Add all other items from loaded_models dict. This objects weren't
-        # returned by Algolia, but they are still relevant to the search. For
+        # returned by search, but they are still relevant to the search. For
         # example if user searched for publisher "audiobooks.by" we also
         # show all books published by that publisher.
         search_results.extend(
@@ -127,6 +145,24 @@ def push_data_to_algolia(request: HttpRequest) -> HttpResponse:
     return HttpResponse(status=204)
 
 
+def sync_search_changes(request: HttpRequest) -> HttpResponse:
+    """
+    HTTP hook that pushes changed data to algolia if there were changes since the
+    previous push. It's called every few minutes by an appengine job.
+    """
+    call_command("push_data_to_algolia", if_requested=True)
+    return HttpResponse(status=204)
+
+
+def build_search_index(request: HttpRequest) -> HttpResponse:
+    """
+    HTTP hook that rebuilds local search index. Needed when Algolia is not used,
+    otherwise the index is rebuilt by push_data_to_algolia.
+    """
+    call_command("build_search_index")
+    return HttpResponse(status=204)
+
+
 def page_not_found(request: HttpRequest) -> HttpResponse:
     """Helper method to test 404 page rendering locally, where using real 404 shows stack trace."""
     return views.defaults.page_not_found(request, None)
@@ -144,38 +180,73 @@ def robots_txt(request: HttpRequest) -> HttpResponse:
     return render(request, "robots.txt", context)
 
 
-def sitemap(request: HttpRequest) -> HttpResponse:
+def _sitemap_base_url(request: HttpRequest) -> str:
+    protocol = "https" if request.is_secure() else "http"
+    return f"{protocol}://{request.get_host()}"
+
+
+def _sitemap_etag(request: HttpRequest, shard: Optional[int] = None) -> Optional[str]:
+    current = sitemap.get_current(_sitemap_base_url(request))
+    if current is None:
+        return None
+    return current.version if shard is None else f"{current.version}-{shard}"
+
+
+def _stream_sitemap(request: HttpRequest, shard: Optional[int] = None) -> HttpResponse:
+    base_url = _sitemap_base_url(request)
+    current = sitemap.get_current(base_url)
+    if current is None:
+        current = sitemap.generate_first(base_url)
+    if current is None:
+        response = HttpResponse(status=503)
+        response["Retry-After"] = "10"
+        add_never_cache_headers(response)
+        return response
+    if shard is not None and shard >= current.shards:
+        return HttpResponse(status=404)
+    return FileResponse(
+        default_storage.open(sitemap.file_name(base_url, current.version, shard), "rb"),
+        content_type="application/xml",
+    )
+
+
+@cache_control(max_age=60 * 60)
+@condition(etag_func=_sitemap_etag)
+def sitemap_index(request: HttpRequest) -> HttpResponse:
     """
-    Serve sitemap in text format.
-    https://developers.google.com/search/docs/advanced/sitemaps/overview?hl=en
+    Serve sitemap index that lists sitemap shards, see books/sitemap.py.
+    https://developers.google.com/search/docs/crawling-indexing/sitemaps/large-sitemaps
     """
-    pages: List[str] = ["/", "/about", "/catalog", "/articles"]
-    for article in ARTICLES:
-        pages.append(reverse("single-article", args=(article.slug,)))
-    for book in Book.objects.active_books_ordered_by_date():
-        pages.append(reverse("book-detail-page", args=(book.slug,)))
-    for person in Person.objects.all():
-        pages.append(reverse("person-detail-page", args=(person.slug,)))
-    for tag in Tag.objects.all():
-        pages.append(reverse("catalog-for-tag", args=(tag.slug,)))
-    for publisher in Publisher.objects.all():
-        pages.append(reverse("publisher-detail-page", args=(publisher.slug,)))
-    domain = "https" if request.is_secure() else "http"
-    domain = domain + "://" + request.get_host()
-    result = "\n".join(domain + page for page in pages)
-    return HttpResponse(result, content_type="text/plain")
+    return _stream_sitemap(request)
+
 
+@cache_control(max_age=60 * 60)
+@condition(etag_func=_sitemap_etag)
+def sitemap_shard(request: HttpRequest, shard: int) -> HttpResponse:
+    """Serve a single sitemap shard listed in the sitemap index."""
+    return _stream_sitemap(request, shard)
 
-DATA_JSON_FILE = "tmp_data.json"
 
+def generate_sitemap(request: HttpRequest) -> HttpResponse:
+    """
+    HTTP hook that regenerates sitemaps which are served by sitemap_index and
+    sitemap_shard handlers.
+    """
+    sitemap.generate_all()
+    return HttpResponse(status=204)
 
-class UUIDEncoder(json.JSONEncoder):
 
-    def default(self, obj):
-        if isinstance(obj, UUID):
-            # if the obj is uuid, we simply return the value of uuid
-            return str(obj)
-        return json.JSONEncoder.default(self, obj)
+def warmup(request: HttpRequest) -> HttpResponse:
+    """
+    HTTP hook called by App Engine before a new instance starts receiving traffic.
+    Loads data needed by most pages into the instance cache, so that first requests
+    are served as fast as the following ones. Data missing from the shared cache
+    is computed and stored there.
+    """
+    image_cache.warm_up()
+    catalog.load_index_page_data()
+    search_index.get_local_index()
+    return HttpResponse(status=204)
 
 
 def generate_data_json(request: HttpRequest) -> HttpResponse:
@@ -183,66 +254,122 @@ def generate_data_json(request: HttpRequest) -> HttpResponse:
     HTTP hook that triggers generation of data.json file which
     will be cached and served by another handler.
     """
-    data: Dict = {
-        "books": serializers.BookSimpleSerializer(
-            Book.objects.prefetch_related("narrations").all(), many=True
-        ).data,
-        "people": serializers.PersonSimpleSerializer(
-            Person.objects.all(), many=True
-        ).data,
-        "link_types": serializers.LinkTypeSimpleSerializer(
-            LinkType.objects.all(), many=True
-        ).data,
-        "tags": serializers.TagSerializer(Tag.objects.all(), many=True).data,
-        "publishers": serializers.PublisherSimpleSerializer(
-            Publisher.objects.all(), many=True
-        ).data,
-    }
-    if default_storage.exists(DATA_JSON_FILE):
-        default_storage.delete(DATA_JSON_FILE)
-
-    data_str = json.dumps(data, ensure_ascii=False, indent=4, cls=UUIDEncoder)
-    default_storage.save(DATA_JSON_FILE, ContentFile(data_str.encode("utf-8")))
+    data_export.generate()
     return HttpResponse(status=204)
 
 
+def _accepts_gzip(request: HttpRequest) -> bool:
+    """
+    Whether Accept-Encoding allows gzip, taking quality values into account:
+    "gzip;q=0" and "*;q=0" without gzip forbid it.
+    https://www.rfc-editor.org/rfc/rfc9110#field.accept-encoding
+    """
+    qualities: Dict[str, float] = {}
+    for item in request.headers.get("Accept-Encoding", "").split(","):
+        coding, *params = [part.strip() for part in item.split(";")]
+        quality = 1.0
+        for param in params:
+            name, _, value = param.partition("=")
+            if name.strip().lower() == "q":
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        if coding:
+            qualities[coding.lower()] = quality
+    for coding in ["gzip", "x-gzip", "*"]:
+        if coding in qualities:
+            return qualities[coding] > 0
+    return False
+
+
+def _data_json_etag(request: HttpRequest) -> Optional[str]:
+    export = data_export.get_current()
+    if export is None:
+        return None
+    since = request.GET.get("since")
+    if since is not None:
+        return f"{export.version}-since-{since}"
+    # Gzipped and plain responses are different representations, so they need
+    # different ETags.
+    return export.etag + ("-gzip" if _accepts_gzip(request) else "")
+
+
 @cache_control(max_age=60 * 60 * 24)
+@condition(etag_func=_data_json_etag)
 def get_data_json(request: HttpRequest) -> HttpResponse:
     """
-    Returns cached data.json that was generated by the generate_data_json
-    handler.
+    Returns data.json that was generated by the generate_data_json handler.
+    The file is streamed from storage, gzipped if the client accepts it.
+
+    With `since` parameter returns only objects that were added, changed or
+    removed after the given version. Returns 410 if changes since the version
+    are not available anymore, in which case the whole data.json should be
+    downloaded.
     """
-    content = ""
-    if default_storage.exists(DATA_JSON_FILE):
-        with default_storage.open(DATA_JSON_FILE, "r") as f:
-            content = f.read()
-    return HttpResponse(
-        content,
+    headers = {
+        # Allow accessing data.json from JS.
+        "Access-Control-Allow-Origin": "*",
+        "Vary": "Accept-Encoding",
+    }
+    since = request.GET.get("since")
+    if since is not None:
+        changes = data_export.get_changes(since)
+        if changes is None:
+            return JsonResponse(
+                {"error": f"Changes since version {since} are not available."},
+                status=410,
+                headers=headers,
+            )
+        return JsonResponse(
+            changes, headers=headers, json_dumps_params={"ensure_ascii": False}
+        )
+    export = data_export.get_current()
+    if export is None:
+        return HttpResponse("", content_type="application/json", headers=headers)
+    headers["X-Data-Version"] = export.version
+    if _accepts_gzip(request):
+        name, size = export.gzip_file, export.gzip_size
+        headers["Content-Encoding"] = "gzip"
+    else:
+        name, size = export.json_file, export.json_size
+    headers["Content-Length"] = str(size)
+    return FileResponse(
+        default_storage.open(name, "rb"),
         content_type="application/json",
-        headers={
-            # Allow accessing data.json from JS.
-            "Access-Control-Allow-Origin": "*",
-        },
+        headers=headers,
+    )
+
+
+def _data_binary_etag(request: HttpRequest) -> Optional[str]:
+    export = data_export.get_current()
+    return None if export is None else export.etag + "-binary"
+
+
+@cache_control(max_age=60 * 60 * 24)
+@condition(etag_func=_data_binary_etag)
+def get_data_binary(request: HttpRequest) -> HttpResponse:
+    """
+    Returns the same data as data.json in compact columnar format, see
+    books/columnar.py.
+    """
+    export = data_export.get_current()
+    name = data_export.get_binary_file(export) if export is not None else None
+    if name is None:
+        return HttpResponse(status=404)
+    return FileResponse(
+        default_storage.open(name, "rb"),
+        content_type="application/octet-stream",
+        headers={"X-Data-Version": export.version},
     )
 
 
-def update_read_by_author_tag(request: HttpRequest) -> HttpResponse:
+def update_derived_tags(request: HttpRequest) -> HttpResponse:
     """
-    HTTP hook that triggers update of 'Read by author tag'.
+    HTTP hook that applies rules of derived tags, such as 'Read by author', to
+    all books. See books/derived_tags.py.
     """
-    read_by_author_tag = Tag.objects.filter(slug="cytaje-autar").first()
-    if read_by_author_tag is None:
-        return HttpResponse(status=500, content="Tag cytaje-autar is missing from DB")
-    books = Book.objects.prefetch_related("tag", "narrations").all()
-    book: Book
-    read_by_author_tag.books.clear()
-    for book in books:
-        authors = set(book.authors.all())
-        for narration in book.narrations.all():
-            for narrator in narration.narrators.all():
-                if narrator in authors:
-                    read_by_author_tag.books.add(book)
-    read_by_author_tag.save()
+    derived_tags.update_all()
     return HttpResponse(status=204)
 
 
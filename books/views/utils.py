@@ -2,23 +2,75 @@
 Utility functions and constants used by multiple views.
 """
 
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 from collections.abc import Sequence
-from django.db.models import query
+import datetime
+import hashlib
+from typing import List, Optional, Tuple
+import uuid
+from django.core.cache import cache
+from django.db.models import Q, query
 from django.http import HttpRequest
 
-from books import models
+from books import models, page_cache
+from books.templatetags.books_extras import resized_image
+
+
+@dataclass
+class Cover:
+    """Information necessary to render a narration cover, see _cover.html."""
+
+    narration: models.Narration
+    book: models.Book
+    authors: Sequence[models.Person]
+    # Empty if the narration doesn't have cover image. Generated cover is shown then.
+    image_url: str
+    # Position of the cover when multiple covers of the book are shown together.
+    index: int
+
+    @staticmethod
+    def for_narrations(
+        book: models.Book,
+        narrations: Sequence[models.Narration],
+        authors: Sequence[models.Person],
+        type: str,
+    ) -> List["Cover"]:
+        """Returns covers of given narrations. type is "small" or "large"."""
+        return [
+            Cover(
+                narration=narration,
+                book=book,
+                authors=authors,
+                image_url=(
+                    resized_image(narration.cover_image.url, type)
+                    if narration.cover_image
+                    else ""
+                ),
+                index=index,
+            )
+            for index, narration in enumerate(narrations)
+        ]
 
 
 @dataclass
 class BookForPreview:
-    """Class containing necessary information to render a book preview."""
+    """
+    Class containing necessary information to render a book preview. Authors and
+    covers are computed once so that rendering doesn't need queries, given authors
+    of the book are prefetched.
+    """
 
     book: models.Book
     narrations: Sequence[models.Narration]
+    authors: List[models.Person] = field(init=False)
+    covers: List[Cover] = field(init=False)
 
     def __post_init__(self):
         self.narrations = sorted(self.narrations, key=lambda n: n.date)
+        self.authors = list(self.book.authors.all())
+        self.covers = Cover.for_narrations(
+            self.book, self.narrations, self.authors, "small"
+        )
 
     @staticmethod
     def with_all_narrations(book: models.Book) -> "BookForPreview":
@@ -26,23 +78,38 @@ class BookForPreview:
 
     @staticmethod
     def with_latest_narration(book: models.Book) -> "BookForPreview":
-        preview = BookForPreview(book, book.narrations.all())
-        return BookForPreview(book, preview.narrations[-1:])
+        narrations = sorted(book.narrations.all(), key=lambda n: n.date)
+        return BookForPreview(book, narrations[-1:])
 
     @staticmethod
     def with_narrations_from_narrator(
         book: models.Book, narrator: models.Person
     ) -> "BookForPreview":
-        narrations = book.narrations.filter(narrators__in=[narrator])
+        # Filtered in Python to use prefetched narrations and narrators.
+        narrations = [
+            narration
+            for narration in book.narrations.all()
+            if narrator in narration.narrators.all()
+        ]
         return BookForPreview(book, narrations)
 
     @staticmethod
     def with_narrations_from_translator(
         book: models.Book, translator: models.Person
     ) -> "BookForPreview":
-        narrations = book.narrations.filter(translators__in=[translator])
+        narrations = [
+            narration
+            for narration in book.narrations.all()
+            if translator in narration.translators.all()
+        ]
         return BookForPreview(book, narrations)
 
+    def page_cache_dependencies(self) -> List[str]:
+        """Objects shown in the preview. Pages showing it depend on them."""
+        return [page_cache.for_book(self.book.uuid)] + [
+            page_cache.for_person(author.uuid) for author in self.authors
+        ]
+
 
 def maybe_filter_links(
     books_query: query.QuerySet, request: HttpRequest
@@ -55,4 +122,92 @@ def maybe_filter_links(
     links = request.GET.get("links")
     if links is None:
         return books_query
-    return books_query.filter(narrations__links__url_type__name__in=links.split(","))
+    return models.BookFacet.objects.filter_books(
+        books_query,
+        [[models.BookFacet.for_link_type(name) for name in links.split(",")]],
+    )
+
+
+def encode_cursor(book: models.Book) -> str:
+    """Encodes position of the book in the catalog ordering as URL-safe string."""
+    return f"{book.latest_narration_date.isoformat()}_{book.uuid}"
+
+
+def decode_cursor(cursor: str) -> Optional[Tuple[datetime.date, uuid.UUID]]:
+    """Decodes cursor created by encode_cursor. Returns None if cursor is malformed."""
+    try:
+        date, book_uuid = cursor.split("_")
+        return datetime.date.fromisoformat(date), uuid.UUID(book_uuid)
+    except ValueError:
+        return None
+
+
+@dataclass
+class CursorPage:
+    """
+    Page of books paginated using keyset (cursor) pagination. Unlike offset-based
+    pagination the cost of fetching a page doesn't depend on how deep the page is.
+    """
+
+    books: List[models.Book]
+    prev_cursor: Optional[str]
+    next_cursor: Optional[str]
+
+
+def paginate_by_cursor(
+    books: query.QuerySet,
+    after: Optional[str],
+    before: Optional[str],
+    books_per_page: int,
+) -> CursorPage:
+    """
+    Returns page of books that go right after or right before the given cursor.
+    Books are expected to be ordered by Book.objects.active_books_ordered_by_date
+    ordering: by latest narration date and then uuid, both descending. Books
+    without narrations can't be positioned and are skipped.
+    """
+    books = books.filter(latest_narration_date__isnull=False)
+    before_position = decode_cursor(before) if before else None
+    after_position = decode_cursor(after) if after else None
+    if before_position is not None:
+        date, book_uuid = before_position
+        books = books.filter(
+            Q(latest_narration_date__gt=date)
+            | Q(latest_narration_date=date, uuid__gt=book_uuid)
+        ).reverse()
+    elif after_position is not None:
+        date, book_uuid = after_position
+        books = books.filter(
+            Q(latest_narration_date__lt=date)
+            | Q(latest_narration_date=date, uuid__lt=book_uuid)
+        )
+    # Fetch one extra book to know whether there is one more page.
+    page = list(books[: books_per_page + 1])
+    has_more = len(page) > books_per_page
+    page = page[:books_per_page]
+    if before_position is not None:
+        page.reverse()
+        has_prev, has_next = has_more, True
+    else:
+        has_prev, has_next = after_position is not None, has_more
+    return CursorPage(
+        books=page,
+        prev_cursor=encode_cursor(page[0]) if has_prev and page else None,
+        next_cursor=encode_cursor(page[-1]) if has_next and page else None,
+    )
+
+
+APPROXIMATE_COUNT_TIMEOUT_SEC = 10 * 60
+
+
+def approximate_count(books: query.QuerySet) -> int:
+    """
+    Returns number of books in the query. The number is cached for few minutes so
+    it might be slightly outdated, which is fine for displaying purposes.
+    """
+    key = "books-count-" + hashlib.sha256(str(books.query).encode()).hexdigest()
+    count = cache.get(key)
+    if count is None:
+        count = books.count()
+        cache.set(key, count, timeout=APPROXIMATE_COUNT_TIMEOUT_SEC)
+    return count
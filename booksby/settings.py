@@ -77,6 +77,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    "books.middleware.QueryStatsMiddleware",
     "django.middleware.locale.LocaleMiddleware",
     "django.middleware.security.SecurityMiddleware",
     "partners.middleware.PartnerSessionMiddleware",
@@ -90,11 +91,16 @@ MIDDLEWARE = [
     "google.cloud.logging_v2.handlers.middleware.RequestMiddleware",
 ]
 
+# Share of requests for which number of queries and timings are collected, see
+# books/query_stats.py.
+QUERY_STATS_SAMPLE_RATE = 1.0 if DEBUG else 0.01
+
 ROOT_URLCONF = "booksby.urls"
 
 TEMPLATES = [
     {
-        "BACKEND": "django.template.backends.django.DjangoTemplates",
+        # DjangoTemplates that measures rendering time, see books/query_stats.py.
+        "BACKEND": "books.query_stats.TimedDjangoTemplates",
         "DIRS": [],
         "APP_DIRS": True,
         "OPTIONS": {
@@ -270,6 +276,9 @@ ALGOLIA_INDEX = env("ALGOLIA_INDEX", default="dev")
 ALGOLIA_APPLICATION_ID = env("ALGOLIA_APPLICATION_ID", default="")
 ALGOLIA_SEARCH_KEY = env("ALGOLIA_SEARCH_KEY", default="")
 ALGOLIA_MODIFY_KEY = env("ALGOLIA_MODIFY_KEY", default="")
+# "algolia" or "local". Local search index is used as a fallback when Algolia is
+# unavailable. See books/search.py.
+SEARCH_BACKEND = env("SEARCH_BACKEND", default="algolia")
 RESIZE_IMAGES_URL = env("RESIZE_IMAGES_URL", default="")
 
 # for debugging sql
@@ -302,11 +311,26 @@ if env("ENV") == "local":
         # }
     }
 
+# Cache is shared by all instances via DB table, with a small per-instance
+# in-memory cache in front of it. See books/cache.py.
 CACHES = {
     "default": {
-        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+        "BACKEND": "books.cache.TieredCache",
         "LOCATION": "booksby-cache",
-    }
+        "OPTIONS": {
+            "SHARED_CACHE": "shared",
+            "LOCAL_TIMEOUT": 30,
+            "MAX_ENTRIES": 1000,
+        },
+    },
+    "shared": {
+        "BACKEND": "django.core.cache.backends.db.DatabaseCache",
+        # Created by books/migrations/0028_create_cache_table.py.
+        "LOCATION": "booksby_cache",
+        # Rendered pages are cached, see books/page_cache.py. Default limit of 300
+        # entries is too small for them.
+        "OPTIONS": {"MAX_ENTRIES": 20000},
+    },
 }
 
 